@@ -100,7 +100,8 @@ def filter_raw(meeg, highpass, lowpass, filter_length, l_trans_bandwidth,
 
 
 def find_events(meeg, stim_channels, min_duration, shortest_event, adjust_timeline_by_msec):
-    raw = meeg.load_raw()  # No copy to consume less memory
+    # Only load the stim-channels (all of them, if they are detected by mne.find_events)
+    raw = meeg.load_raw(picks=stim_channels or 'stim')
 
     events = mne.find_events(raw, min_duration=min_duration, shortest_event=shortest_event,
                              stim_channel=stim_channels)
@@ -119,7 +120,8 @@ def find_events(meeg, stim_channels, min_duration, shortest_event, adjust_timeli
 
 
 def find_6ch_binary_events(meeg, min_duration, shortest_event, adjust_timeline_by_msec):
-    raw = meeg.load_raw()  # No copy to consume less memory
+    # Only load the 6 stim-channels
+    raw = meeg.load_raw(picks=[f'STI 00{idx}' for idx in range(1, 7)])
 
     # Binary Coding of 6 Stim Channels in Biomagenetism Lab Heidelberg
     # prepare arrays
@@ -304,13 +306,12 @@ def epoch_raw(meeg, ch_types, t_epoch, baseline, reject, flat, bad_interpolation
 
 def run_ica(meeg, ica_method, ica_fitto, n_components, ica_noise_cov, ica_remove_proj, ica_reject, ica_autoreject,
             ch_types, reject_by_annotation, ica_eog, eog_channel, ica_ecg, ecg_channel, **kwargs):
+    # Only load the channels, which are fitted
     if ica_fitto == 'Raw (Unfiltered)':
-        data = meeg.load_raw()
-        data.pick(ch_types, exclude='bads')
+        data = meeg.load_raw(picks=ch_types, exclude='bads')
 
     elif ica_fitto == 'Raw (Filtered)':
-        data = meeg.load_filtered()
-        data.pick(ch_types, exclude='bads')
+        data = meeg.load_filtered(picks=ch_types, exclude='bads')
     else:
         data = meeg.load_epochs()
         # Bad-Channels and Channel-Types are already picked in epoch_raw
@@ -355,9 +356,8 @@ def run_ica(meeg, ica_method, ica_fitto, n_components, ica_noise_cov, ica_remove
     ica.fit(filt_data, reject=reject, reject_by_annotation=reject_by_annotation, **fit_kwargs)
 
     # Load Raw for EOG/ECG-Detection without picks (e.g. still containing EEG for EOG or EOG channels)
-    eog_ecg_raw = meeg.load_filtered()
-    # Include EOG/ECG with all the data-channels
-    eog_ecg_raw.pick_types(meg=True, eeg=True, eog=True, ecg=True, seeg=True, ecog=True, fnirs=True, exclude='bads')
+    # Include EOG/ECG with all the data-channels (without loading the other channels, e.g. stim)
+    eog_ecg_raw = meeg.load_filtered(picks=['meg', 'eeg', 'eog', 'ecg', 'seeg', 'ecog', 'fnirs'], exclude='bads')
 
     if ica_eog:
 
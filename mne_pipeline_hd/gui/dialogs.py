@@ -18,12 +18,12 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from functools import partial
 from os.path import join
-from pathlib import Path
 
 import mne
 import numpy as np
 import pandas as pd
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (QComboBox, QDialog, QDockWidget, QGridLayout, QHBoxLayout,
                              QInputDialog,
                              QLabel, QLineEdit, QListView, QMessageBox, QPushButton,
@@ -33,9 +33,11 @@ from mne_pipeline_hd.gui import parameter_widgets
 from mne_pipeline_hd.gui.base_widgets import SimpleList
 from mne_pipeline_hd.gui.gui_utils import set_ratio_geometry
 from mne_pipeline_hd.gui.models import CheckListModel
-from mne_pipeline_hd.gui.parameter_widgets import BoolGui, StringGui
+from mne_pipeline_hd.gui.parameter_widgets import BoolGui, IntGui, StringGui
 from mne_pipeline_hd.pipeline_functions import iswin
+from mne_pipeline_hd.pipeline_functions.execution import get_run_steps
 from mne_pipeline_hd.pipeline_functions.loading import MEEG
+from mne_pipeline_hd.pipeline_functions.planner import RunPlanner, get_plan_table
 from mne_pipeline_hd.pipeline_functions.project import Project
 
 
@@ -166,10 +168,63 @@ class SettingsDlg(QDialog):
         #                           param_alias='Image-Format', description='Choose the image format for plots',
         #                           default='.png'))
 
-        layout.addWidget(BoolGui(self.mw.qsettings, 'save_ram', param_alias='Save RAM',
-                                 description='Set to True on low RAM-Machines to avoid the process to be killed '
-                                             'by the OS due to low Memory (with leaving it off, the pipeline goes'
-                                             'a bit faster, because the data can be saved in memory)', default=True))
+        layout.addWidget(IntGui(self.mw.qsettings, 'cache_memory', param_alias='Cache-Memory', param_unit='GB',
+                                description='Set to the amount of RAM, in which loaded and saved data is kept for '
+                                            'the next functions (the least recently used data is dropped first, '
+                                            'each function gets its own copy). '
+                                            'The cached copies are held in addition to the data of the functions, '
+                                            'thus the pipeline may use up to this amount more RAM than without '
+                                            'the cache (counted against the Memory-Budget of parallel runs). '
+                                            'Set it low on low RAM-Machines to avoid the process to be killed '
+                                            'by the OS due to low Memory. 0 disables the cache. '
+                                            'In a parallel run, the processes share this amount.',
+                                default=2, min_val=0, max_val=100000))
+
+        layout.addWidget(BoolGui(self.mw.qsettings, 'async_save', param_alias='Save in Background',
+                                 description='Set to True to write saved data in the background, while the next '
+                                             'functions already run (a copy of the data is held in RAM until it is '
+                                             'written). Loading data waits until it is written.', default=False))
+
+        layout.addWidget(BoolGui(self.mw.settings, 'dependency_graph', param_alias='Dependency-Graph',
+                                 description='Set to True to start each step as soon as the steps it depends on '
+                                             'are finished (only with more than one process). The dependencies '
+                                             'are taken from the data the functions load and save and from '
+                                             'the column "dependencies" in functions.csv', default=False))
+
+        layout.addWidget(IntGui(self.mw.qsettings, 'memory_budget', param_alias='Memory-Budget', param_unit='GB',
+                                description='Set to the amount of RAM, which the parallel processes may use together '
+                                            '(only with more than one process). Steps are only started, if their '
+                                            'peak memory (estimated from the size of their input-files and learned '
+                                            'from past runs with psutil installed) and the Cache-Memory of their '
+                                            'process fit in. 0 means no limit.',
+                                default=0, min_val=0, max_val=100000))
+
+        layout.addWidget(IntGui(self.mw.qsettings, 'prefetch_memory', param_alias='Prefetch-Memory', param_unit='GB',
+                                description='Set to the amount of RAM, which may be used to load the data of the next '
+                                            'object in the background while the current function runs '
+                                            '(in a sequential run). 0 disables prefetching.',
+                                default=0, min_val=0, max_val=100000))
+
+        layout.addWidget(IntGui(self.mw.qsettings, 'plot_processes', param_alias='Plot-Processes',
+                                description='Set to the number of processes, in which the plot-functions render '
+                                            'their figures off-screen after all other functions '
+                                            '(only if "Show Plots" is off). 0 runs the plot-functions '
+                                            'in order with the other functions.',
+                                default=0, min_val=0, max_val=1000, special_value_text='Off'))
+
+        layout.addWidget(StringGui(self.mw.qsettings, 'event_stream', param_alias='Event-Stream',
+                                   description='Write the events of a run (steps queued/started/finished/failed) '
+                                               'as JSON-lines for external monitoring to this file-path, '
+                                               'to "file" for _pipeline_scripts/run_events_<project>.jsonl '
+                                               'or send them to "udp://<host>:<port>". Empty disables the events.',
+                                   default=''))
+
+        layout.addWidget(StringGui(self.mw.qsettings, 'scratch_path', param_alias='Scratch-Path',
+                                   description='Set the directory for the scratch-files of functions, which load '
+                                               'raw-data memory-mapped (column "preload" in functions.csv). '
+                                               'It should be on a disk with enough space, empty uses the '
+                                               'temporary directory of the system.',
+                                   default=''))
 
         layout.addWidget(StringGui(self.mw.qsettings, 'fs_path', param_alias='FREESURFER_HOME-Path',
                                    description='Set the Path to the "freesurfer"-directory of your '
@@ -380,6 +435,43 @@ class SysInfoMsg(QDialog):
         self.show_widget.insertPlainText(text)
 
 
+class RunPlanDlg(QDialog):
+    """Show the plan for a run of the selected functions and objects without running them (dry-run)"""
+
+    def __init__(self, main_win):
+        super().__init__(main_win)
+        self.mw = main_win
+        self.setWindowTitle('Dry-Run')
+        layout = QVBoxLayout()
+
+        self.plan_widget = QTextEdit()
+        self.plan_widget.setReadOnly(True)
+        self.plan_widget.setLineWrapMode(QTextEdit.NoWrap)
+        self.plan_widget.setFont(QFont('Courier'))
+        layout.addWidget(self.plan_widget)
+
+        close_bt = QPushButton('Close')
+        close_bt.clicked.connect(self.close)
+        layout.addWidget(close_bt)
+
+        set_ratio_geometry(0.7, self)
+        self.setLayout(layout)
+        self.show_plan()
+        self.show()
+
+    def show_plan(self):
+        all_objects, all_steps = get_run_steps(self.mw)
+        if len(all_steps) == 0:
+            self.plan_widget.setPlainText('No functions and objects are selected!')
+            return
+        try:
+            plan = RunPlanner(self.mw).plan(all_objects, all_steps)
+        except Exception as err:
+            self.plan_widget.setPlainText(f'The plan could not be made: {err}')
+        else:
+            self.plan_widget.setPlainText(get_plan_table(plan))
+
+
 class QuickGuide(QDialog):
     def __init__(self, main_win):
         super().__init__(main_win)
@@ -528,16 +620,15 @@ class RawInfo(QDialog):
         # Get size in Mebibytes of all files associated to this
         meeg = MEEG(meeg_name, self.mw)
         info = meeg.load_info()
-        fp = meeg.file_parameters
         meeg.get_existing_paths()
         other_infos = dict()
 
         sizes = list()
         for path_type in meeg.existing_paths:
             for path in meeg.existing_paths[path_type]:
-                file_name = Path(path).name
-                if file_name in fp and 'SIZE' in fp[file_name]:
-                    sizes.append(fp[file_name]['SIZE'])
+                file_size = meeg.get_file_params(path).get('SIZE')
+                if file_size is not None:
+                    sizes.append(file_size)
         other_infos['no_files'] = len(sizes)
 
         sizes_sum = sum(sizes)
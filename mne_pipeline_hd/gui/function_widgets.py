@@ -1121,13 +1121,13 @@ class SavePkgDialog(QDialog):
                     # Replace indexes from file with same name
                     drop_funcs = [f for f in read_pd_funcs.index if f in final_add_pd_funcs.index]
                     read_pd_funcs.drop(index=drop_funcs, inplace=True)
-                    final_add_pd_funcs = read_pd_funcs.append(final_add_pd_funcs)
+                    final_add_pd_funcs = pd.concat([read_pd_funcs, final_add_pd_funcs])
                 if isfile(pd_params_path):
                     read_pd_params = pd.read_csv(pd_params_path, sep=';', index_col=0)
                     # Replace indexes from file with same name
                     drop_params = [p for p in read_pd_params.index if p in final_add_pd_params.index]
                     read_pd_params.drop(index=drop_params, inplace=True)
-                    final_add_pd_params = read_pd_params.append(final_add_pd_params)
+                    final_add_pd_params = pd.concat([read_pd_params, final_add_pd_params])
 
                 if self.my_pkg_name and self.my_pkg_name != self.cf.pkg_name:
                     # Rename folder and .csv-files if you enter a new name
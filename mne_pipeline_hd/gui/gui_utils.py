@@ -11,11 +11,15 @@ inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
 """
 import io
 import logging
+import re
 import sys
 import traceback
+from collections import deque
+from html import unescape
 from inspect import signature
+from logging.handlers import RotatingFileHandler
 
-from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, Qt, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import QApplication, QDesktopWidget, QDialog, QHBoxLayout, QLabel, QMessageBox, QProgressBar, \
     QPushButton, \
@@ -52,13 +56,57 @@ def get_exception_tuple():
 
 
 class ConsoleWidget(QTextEdit):
-    def __init__(self):
+    """A console displaying stdout/stderr in a bounded ring-buffer
+
+    Writes are collected and inserted together on a timer instead of one insertHtml per write.
+    Only the last max_chunks writes are kept, the complete output can be written
+    to a rotating log-file (e.g. in _pipeline_scripts).
+    The document is not rendered as a window over the buffer (QTextEdit has no virtual scrolling),
+    instead the chunks are appended until the document holds 2 * max_chunks chunks,
+    then it is rebuilt from the buffer. Thus between max_chunks and 2 * max_chunks writes are displayed.
+
+    Parameters
+    ----------
+    log_path : str | None
+        The path to the log-file for the complete output (None for no log-file)
+    max_chunks : int
+        The number of writes kept for display (at most twice as many are displayed)
+    update_interval : int
+        The interval in milliseconds at which the collected writes are displayed
+    """
+
+    def __init__(self, log_path=None, max_chunks=5000, update_interval=100):
         super().__init__()
 
         self.setReadOnly(True)
         self.is_prog_text = False
         self.autoscroll = True
 
+        # The html-chunks kept for display (the oldest are dropped if full)
+        self.buffer = deque(maxlen=max_chunks)
+        # The html-chunks not yet displayed and the plain text not yet written to the log-file
+        self.pending = list()
+        self.pending_log = list()
+        # If the last displayed line is a progress-text, which is replaced by the first pending chunk
+        self.replace_last = False
+        # The number of chunks in the document, it is rebuilt from the buffer if it grows above 2 * max_chunks
+        self.n_rendered = 0
+
+        self.log_handler = None
+        if log_path is not None:
+            try:
+                self.log_handler = RotatingFileHandler(log_path, maxBytes=10 * 1024 ** 2, backupCount=5,
+                                                       encoding='utf-8', delay=True)
+                # Keep the line-endings of the written text
+                self.log_handler.terminator = ''
+                self.log_handler.setFormatter(logging.Formatter('%(message)s'))
+            except OSError as err:
+                print(f'Console-Log could not be opened at {log_path}: {err}')
+
+        self.update_timer = QTimer(self)
+        self.update_timer.timeout.connect(self.flush)
+        self.update_timer.start(update_interval)
+
         # Connect custom stdout and stderr to display-function
         sys.stdout.signal.text_written.connect(self.write_stdout)
         sys.stderr.signal.text_written.connect(self.write_error)
@@ -66,39 +114,94 @@ class ConsoleWidget(QTextEdit):
         sys.stdout.signal.text_updated.connect(self.write_progress)
         sys.stderr.signal.text_updated.connect(self.write_progress)
 
+    def _add_chunk(self, html, log_text):
+        self.buffer.append(html)
+        self.pending.append(html)
+        if log_text:
+            self.pending_log.append(log_text)
+
     def add_html(self, text):
-        self.insertHtml(text)
-        if self.autoscroll:
-            self.ensureCursorVisible()
+        self.is_prog_text = False
+        # Headlines and error-markers are written as plain text to the log-file
+        log_text = re.sub(r'<br\s*/?>|</h\d>|</p>', '\n', text)
+        self._add_chunk(text, unescape(re.sub(r'<[^>]+>', '', log_text)))
 
     def set_autoscroll(self, autoscroll):
         self.autoscroll = autoscroll
 
     def write_stdout(self, text):
         self.is_prog_text = False
-        text = text.replace('\n', '<br>')
-        text = f'<font color="black">{text}</font>'
-        self.add_html(text)
+        html = text.replace('\n', '<br>')
+        html = f'<font color="black">{html}</font>'
+        self._add_chunk(html, text)
 
     def write_error(self, text):
         self.is_prog_text = False
-        text = text.replace('\n', '<br>')
-        text = f'<font color="red">{text}</font>'
-        self.add_html(text)
+        html = text.replace('\n', '<br>')
+        html = f'<font color="red">{html}</font>'
+        self._add_chunk(html, text)
 
     def write_progress(self, text):
-        text = text.replace('\n', '<br>')
-        text = f'<font color="green">{text}</font>'
+        html = text.replace('\n', '<br>')
+        html = f'<font color="green">{html}</font>'
         if self.is_prog_text:
-            # Delete last line
-            cursor = self.textCursor()
-            cursor.movePosition(QTextCursor.End)
-            cursor.select(QTextCursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            self.add_html(text)
+            # Replace the last progress-text (only the latest update between two flushes gets displayed)
+            self.buffer[-1] = html
+            if len(self.pending) > 0:
+                self.pending[-1] = html
+            else:
+                self.replace_last = True
+                self.pending.append(html)
         else:
             self.is_prog_text = True
-            self.add_html(text)
+            # Progress-updates are not written to the log-file
+            self._add_chunk(html, None)
+
+    def flush(self):
+        """Display the pending chunks and write them to the log-file"""
+        if len(self.pending_log) > 0 and self.log_handler is not None:
+            record = logging.LogRecord('console', logging.INFO, '', 0, ''.join(self.pending_log), None, None)
+            self.log_handler.handle(record)
+        self.pending_log.clear()
+
+        if len(self.pending) == 0:
+            return
+
+        if self.n_rendered + len(self.pending) > 2 * self.buffer.maxlen:
+            # Rebuild the document from the buffer to drop the oldest chunks
+            self.setHtml(''.join(self.buffer))
+            self.n_rendered = len(self.buffer)
+        else:
+            cursor = self.textCursor()
+            cursor.movePosition(QTextCursor.End)
+            if self.replace_last:
+                # Delete last line
+                cursor.select(QTextCursor.LineUnderCursor)
+                cursor.removeSelectedText()
+            cursor.insertHtml(''.join(self.pending))
+            self.n_rendered += len(self.pending)
+        self.pending.clear()
+        self.replace_last = False
+
+        if self.autoscroll:
+            self.moveCursor(QTextCursor.End)
+            self.ensureCursorVisible()
+
+    def clear(self):
+        super().clear()
+        self.buffer.clear()
+        self.pending.clear()
+        self.is_prog_text = False
+        self.replace_last = False
+        self.n_rendered = 0
+
+    def close_log(self):
+        """Display the remaining chunks and close the log-file"""
+        self.update_timer.stop()
+        self.flush()
+        if self.log_handler is not None:
+            self.log_handler.close()
+            self.log_handler = None
 
 
 class StdoutStderrSignal(QObject):
@@ -30,7 +30,7 @@ from PyQt5.QtWidgets import (QAbstractItemView, QCheckBox, QComboBox, QDialog, Q
                              QTreeWidgetItem, QVBoxLayout, QWidget, QWizard, QWizardPage)
 from matplotlib import pyplot as plt
 
-from mne_pipeline_hd.pipeline_functions.loading import FSMRI, Group, MEEG
+from mne_pipeline_hd.pipeline_functions.loading import FSMRI, Group, MEEG, preload_policy
 from .base_widgets import (CheckDictList, CheckList, EditDict, EditList, FilePandasTable, SimpleDialog, SimpleList,
                            SimplePandasTable)
 from .dialogs import ErrorDialog
@@ -163,8 +163,7 @@ class RemoveDialog(QDialog):
                 self.pr.meeg_to_fsmri.pop(meeg, None)
                 self.pr.meeg_bad_channels.pop(meeg, None)
                 self.pr.meeg_event_id.pop(meeg, None)
-                if meeg in self.pr.file_parameters:
-                    self.pr.file_parameters.pop(meeg)
+                self.pr.provenance.remove(meeg)
                 if remove_files:
                     try:
                         remove_path = join(self.pr.data_path, meeg)
@@ -703,7 +702,7 @@ class AddFilesWidget(QWidget):
                     # Organize other files
                     self.mw.pr.all_meeg.append(file)
 
-                # Copy sub_files to destination (with MEEG-Class to also include raw into file_parameters)
+                # Copy sub_files to destination (with MEEG-Class to also record raw in the provenance)
                 meeg = MEEG(file, self.mw)
 
                 # Get bad-channels from raw-file
@@ -1466,7 +1465,9 @@ class SubBadsWidget(QWidget):
         plot_dialog = QDialog(self)
         plot_dialog.setWindowTitle('Opening Raw-Plot...')
         plot_dialog.open()
-        self.raw = self.current_obj.load_raw()
+        # The plot only reads the data of the shown channels and time-window from disk
+        with preload_policy('lazy'):
+            self.raw = self.current_obj.load_raw()
         self.raw_fig = self.raw.plot(n_channels=30, bad_color='red', title=self.current_obj.name)
         # Connect Closing of Matplotlib-Figure to assignment of bad-channels
         self.raw_fig.canvas.mpl_connect('close_event', self.get_selected_bads)
@@ -1871,14 +1872,11 @@ class FileManagment(QDialog):
                 obj_pd_size.loc[obj_name, path_type] = 0
 
                 for path in obj.existing_paths[path_type]:
-                    try:
-                        # Add Time
-                        # Last entry in TIME should be the most recent one
-                        obj_pd_time.loc[obj_name, path_type] = obj.file_parameters[Path(path).name]['TIME'][-1]
-                        # Add Size (accumulate, if there are several files
-                        obj_pd_size.loc[obj_name, path_type] += obj.file_parameters[Path(path).name]['SIZE']
-                    except KeyError:
-                        pass
+                    # Add Time and Size (accumulate, if there are several files) from the last record
+                    file_params = obj.get_file_params(path)
+                    if file_params:
+                        obj_pd_time.loc[obj_name, path_type] = file_params['TIME']
+                        obj_pd_size.loc[obj_name, path_type] += file_params['SIZE'] or 0
 
                     # Compare all parameters from last run to now
                     result_dict = compare_filep(obj, path, verbose=False)
@@ -2115,7 +2113,7 @@ class FileManagment(QDialog):
             obj_table.content_changed()
             # Drop from file-parameters
             path = Path(obj.io_dict[path_type]['path']).name
-            obj.file_parameters.pop(path, None)
+            obj.pr.provenance.remove(obj.name, path)
             # Remove File
             worker_signals.pgbar_text.emit(f'Removing: {path}')
             obj.remove_path(path_type)
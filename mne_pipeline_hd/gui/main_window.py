@@ -11,10 +11,9 @@ inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
 """
 import json
 import os
-import re
 import sys
 from functools import partial
-from importlib import reload, resources, util
+from importlib import resources
 from os import listdir
 from os.path import isdir, join
 from subprocess import run
@@ -30,7 +29,7 @@ from PyQt5.QtWidgets import (QAction, QApplication, QComboBox, QFileDialog,
                              QVBoxLayout, QWidget)
 
 from .dialogs import (ErrorDialog, ParametersDock, QuickGuide, RawInfo, RemoveProjectsDlg,
-                      SettingsDlg, SysInfoMsg)
+                      RunPlanDlg, SettingsDlg, SysInfoMsg)
 from .education_widgets import EducationEditor, EducationTour
 from .function_widgets import AddKwargs, ChooseCustomModules, CustomFunctionImport
 from .gui_utils import WorkerDialog, center, get_exception_tuple, set_ratio_geometry
@@ -39,9 +38,9 @@ from .loading_widgets import (AddFilesDialog, AddMRIDialog, CopyTrans, EventIDGu
                               SubDictDialog, SubjectDock, SubjectWizard)
 from .parameter_widgets import BoolGui, ComboGui, IntGui
 from .tools import DataTerminal, PlotViewSelection
-from .. import basic_functions
 from ..basic_functions.plot import close_all
 from ..pipeline_functions import iswin
+from ..pipeline_functions.controller import BaseController
 from ..pipeline_functions.function_utils import (RunDialog)
 from ..pipeline_functions.project import Project
 
@@ -59,9 +58,8 @@ def get_upstream():
     print(result.stdout)
 
 
-# Todo: Controller-Class to make MainWindow-Class more light and prepare for features as Pipeline-Freezig
-#  (you need an PyQt-independent system for that)
-class MainWindow(QMainWindow):
+# The settings, base-paths and the import of functions are shared with the Controller (without Qt-GUI)
+class MainWindow(QMainWindow, BaseController):
     # Define Main-Window-Signals to send into QThread to control function execution
     cancel_functions = pyqtSignal(bool)
     plot_running = pyqtSignal(bool)
@@ -99,6 +97,8 @@ class MainWindow(QMainWindow):
         self.module_err_dlg = None
         self.bt_dict = dict()
         self.all_modules = dict()
+        # The BindingPlans for the arguments of each function
+        self.binding_plans = dict()
         self.available_image_formats = {'.png': 'PNG', '.jpg': 'JPEG', '.tiff': 'TIFF'}
         # For functions, which should or should not be called durin initialization
         self.first_init = True
@@ -121,12 +121,8 @@ class MainWindow(QMainWindow):
         # Get projects and current_project (need settings for this, thus after self.load_settings()
         self.get_projects()
 
-        # Pandas-DataFrame for contextual data of basic functions (included with program)
-        with resources.path('mne_pipeline_hd.pipeline_resources', 'functions.csv') as pd_funcs_path:
-            self.pd_funcs = pd.read_csv(str(pd_funcs_path), sep=';', index_col=0)
-        # Pandas-DataFrame for contextual data of paramaters for basic functions (included with program)
-        with resources.path('mne_pipeline_hd.pipeline_resources', 'parameters.csv') as pd_params_path:
-            self.pd_params = pd.read_csv(str(pd_params_path), sep=';', index_col=0)
+        # Pandas-DataFrames for contextual data of functions and parameters
+        self.load_pd_funcs()
 
         # Import the basic- and custom-function-modules
         self.import_custom_modules()
@@ -154,15 +150,6 @@ class MainWindow(QMainWindow):
         # Start Education-Tour
         self.start_edu()
 
-    def make_base_paths(self):
-        self.projects_path = join(self.home_path, 'projects')
-        self.subjects_dir = join(self.home_path, 'freesurfer')
-        mne.utils.set_config("SUBJECTS_DIR", self.subjects_dir, set_env=True)
-        self.custom_pkg_path = join(self.home_path, 'custom_packages')
-        for path in [self.projects_path, self.subjects_dir, self.custom_pkg_path]:
-            if not isdir(path):
-                os.mkdir(path)
-
     def get_projects(self):
         # Get current_project
         self.current_project = self.get_setting('current_project')
@@ -293,139 +280,13 @@ class MainWindow(QMainWindow):
         else:
             self.project_box.setCurrentText(self.projects[0])
 
-    def load_default_settings(self):
-        with resources.open_text('mne_pipeline_hd.pipeline_resources', 'default_settings.json') as file:
-            self.default_settings = json.load(file)
-
-    def load_settings(self):
-        self.load_default_settings()
-        try:
-            with open(join(self.home_path, 'mne_pipeline_hd-settings.json'), 'r') as file:
-                self.settings = json.load(file)
-            # Account for settings, which were not saved but exist in default_settings
-            for setting in [s for s in self.default_settings['settings'] if s not in self.settings]:
-                self.settings[setting] = self.default_settings['settings'][setting]
-        except FileNotFoundError:
-            self.settings = self.default_settings['settings']
-
-        # Check QSettings
-        for qsetting in [qs for qs in self.default_settings['qsettings'] if qs not in self.qsettings.childKeys()]:
-            self.qsettings.setValue(qsetting, self.default_settings['qsettings'][qsetting])
-
-    def save_settings(self):
-        with open(join(self.home_path, 'mne_pipeline_hd-settings.json'), 'w') as file:
-            json.dump(self.settings, file, indent=4)
-
-    def get_setting(self, setting):
-        try:
-            value = self.settings[setting]
-        except KeyError:
-            value = self.default_settings['settings'][setting]
-
-        return value
-
-    def get_func_groups(self):
-        self.fsmri_funcs = self.pd_funcs[self.pd_funcs['target'] == 'FSMRI']
-        self.meeg_funcs = self.pd_funcs[self.pd_funcs['target'] == 'MEEG']
-        self.group_funcs = self.pd_funcs[self.pd_funcs['target'] == 'Group']
-        self.other_funcs = self.pd_funcs[self.pd_funcs['target'] == 'Other']
-
-    def import_custom_modules(self):
-        """
-        Load all modules in basic_functions and custom_functions
-        """
-
-        # Load basic-modules
-        basic_functions_list = [x for x in dir(basic_functions) if '__' not in x]
-        self.all_modules['basic'] = dict()
-        for module_name in basic_functions_list:
-            self.all_modules['basic'][module_name] = (getattr(basic_functions, module_name), None)
-
-        # Load custom_modules
-        pd_functions_pattern = r'.*_functions\.csv'
-        pd_parameters_pattern = r'.*_parameters\.csv'
-        custom_module_pattern = r'(.+)(\.py)$'
-        for directory in [d for d in os.scandir(self.custom_pkg_path) if not d.name.startswith('.')]:
-            pkg_name = directory.name
-            pkg_path = directory.path
-            file_dict = {'functions': None, 'parameters': None, 'modules': list()}
-            for file_name in [f for f in listdir(pkg_path) if not f.startswith(('.', '_'))]:
-                functions_match = re.match(pd_functions_pattern, file_name)
-                parameters_match = re.match(pd_parameters_pattern, file_name)
-                custom_module_match = re.match(custom_module_pattern, file_name)
-                if functions_match:
-                    file_dict['functions'] = join(pkg_path, file_name)
-                elif parameters_match:
-                    file_dict['parameters'] = join(pkg_path, file_name)
-                elif custom_module_match and custom_module_match.group(1) != '__init__':
-                    file_dict['modules'].append(custom_module_match)
-
-            # Check, that there is a whole set for a custom-module (module-file, functions, parameters)
-            if all([value is not None or value != [] for value in file_dict.values()]):
-                self.all_modules[pkg_name] = dict()
-                functions_path = file_dict['functions']
-                parameters_path = file_dict['parameters']
-                correct_count = 0
-                for module_match in file_dict['modules']:
-                    module_name = module_match.group(1)
-                    module_file_name = module_match.group()
-
-                    spec = util.spec_from_file_location(module_name, join(pkg_path, module_file_name))
-                    module = util.module_from_spec(spec)
-                    try:
-                        spec.loader.exec_module(module)
-                    except:
-                        exc_tuple = get_exception_tuple()
-                        self.module_err_dlg = ErrorDialog(exc_tuple, self,
-                                                          title=f'Error in import of custom-module: {module_name}')
-                    else:
-                        correct_count += 1
-                        # Add module to sys.modules
-                        sys.modules[module_name] = module
-                        # Add Module to dictionary
-                        self.all_modules[pkg_name][module_name] = (module, spec)
-
-                # Make sure, that every module in modules is imported without error
-                # (otherwise don't append to pd_funcs and pd_params)
-                if len(file_dict['modules']) == correct_count:
-                    try:
-                        read_pd_funcs = pd.read_csv(functions_path, sep=';', index_col=0)
-                        read_pd_params = pd.read_csv(parameters_path, sep=';', index_col=0)
-                    except:
-                        exc_tuple = get_exception_tuple()
-                        self.module_err_dlg = ErrorDialog(exc_tuple, self,
-                                                          title=f'Error in import of custom-package: {pkg_name}')
-                    else:
-                        # Add pkg_name here (would be redundant in read_pd_funcs of each custom-package)
-                        read_pd_funcs['pkg_name'] = pkg_name
-
-                        # Check, that there are no duplicates
-                        pd_funcs_to_append = read_pd_funcs.loc[~read_pd_funcs.index.isin(self.pd_funcs.index)]
-                        self.pd_funcs = self.pd_funcs.append(pd_funcs_to_append)
-                        pd_params_to_append = read_pd_params.loc[~read_pd_params.index.isin(self.pd_params.index)]
-                        self.pd_params = self.pd_params.append(pd_params_to_append)
+    def import_error(self, title, err):
+        exc_tuple = get_exception_tuple()
+        self.module_err_dlg = ErrorDialog(exc_tuple, self, title=title)
 
-            else:
-                text = f'Files for import of {pkg_name} are missing: ' \
-                       f'{[key for key in file_dict if file_dict[key] is None]}'
-                QMessageBox.warning(self, 'Import-Problem', text)
-
-        self.get_func_groups()
-
-    def reload_modules(self):
-        for pkg_name in self.all_modules:
-            for module_name in self.all_modules[pkg_name]:
-                module = self.all_modules[pkg_name][module_name][0]
-                try:
-                    reload(module)
-                # Custom-Modules somehow can't be reloaded because spec is not found
-                except ModuleNotFoundError:
-                    spec = self.all_modules[pkg_name][module_name][1]
-                    if spec:
-                        spec.loader.exec_module(module)
-                        sys.modules[module_name] = module
-                    else:
-                        raise RuntimeError(f'{module_name} from {pkg_name} could not be reloaded')
+    def import_files_missing(self, pkg_name, missing_files):
+        text = f'Files for import of {pkg_name} are missing: {missing_files}'
+        QMessageBox.warning(self, 'Import-Problem', text)
 
     def load_edu(self):
         if self.edu_program_name:
@@ -508,6 +369,7 @@ class MainWindow(QMainWindow):
         func_menu.addAction('&Reload Modules', self.reload_modules)
         func_menu.addSeparator()
         func_menu.addAction('Additional Keyword-Arguments', partial(AddKwargs, self))
+        func_menu.addAction('Dry-Run (Estimate Runtime)', partial(RunPlanDlg, self))
 
         # Education
         education_menu = self.menuBar().addMenu('&Education')
@@ -557,13 +419,31 @@ class MainWindow(QMainWindow):
         self.toolbar.addWidget(IntGui(self.qsettings, 'n_threads', min_val=1,
                                       description='Set to the amount of threads you want to run simultaneously '
                                                   'in the pipeline', default=1, groupbox_layout=False))
+        self.toolbar.addWidget(IntGui(self.qsettings, 'n_processes', min_val=1,
+                                      description='Set to the amount of processes to run independent objects '
+                                                  '(MEEG, FSMRI, Groups) in parallel\n'
+                                                  '(plots are only saved and not shown when > 1)',
+                                      default=1, groupbox_layout=False))
         self.toolbar.addWidget(IntGui(self.qsettings, 'n_jobs', min_val=-1, special_value_text='Auto',
                                       description='Set to the amount of (virtual) cores of your machine '
-                                                  'you want to use for multiprocessing', default=-1,
+                                                  'you want to use for multiprocessing\n'
+                                                  '(with more than one process, the cores are split '
+                                                  'between the running steps)', default=-1,
                                       groupbox_layout=False))
         self.toolbar.addWidget(BoolGui(self.settings, 'overwrite', param_alias='Overwrite',
                                        description='Check to overwrite files even if their parameters where unchanged',
                                        default=False))
+        self.toolbar.addWidget(BoolGui(self.settings, 'skip_up_to_date', param_alias='Skip Up-To-Date',
+                                       description='Check to skip functions, whose saved files are newer than '
+                                                   'the files they load and were saved with the same values for '
+                                                   'their parameters (column "func_args" in functions.csv)',
+                                       default=False))
+        self.toolbar.addWidget(BoolGui(self.settings, 'artifact_store', param_alias='Artifact-Store',
+                                       description='Check to keep the saved files in a store keyed by the hash of '
+                                                   'the inputs and parameters of the function. When another '
+                                                   'Parameter-Preset computes the same, the files are linked '
+                                                   'from the store instead of computing them again',
+                                       default=False))
         self.toolbar.addWidget(BoolGui(self.settings, 'show_plots', param_alias='Show Plots',
                                        description='Do you want to show plots?\n'
                                                    '(or just save them without showing, then just check "Save Plots")',
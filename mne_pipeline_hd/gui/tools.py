@@ -25,7 +25,7 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
 from mne_pipeline_hd.gui.base_widgets import CheckList, SimpleDialog, SimpleList
 from mne_pipeline_hd.gui.gui_utils import Worker, set_ratio_geometry, get_exception_tuple
-from mne_pipeline_hd.pipeline_functions.function_utils import get_arguments
+from mne_pipeline_hd.pipeline_functions.execution import get_arguments
 from mne_pipeline_hd.pipeline_functions.loading import FSMRI, Group, MEEG
 
 
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Run the pipeline from the command-line without a GUI (e.g. on compute-nodes without display)
+"""
+import argparse
+import json
+import sys
+from inspect import getsourcefile
+from os.path import abspath
+from pathlib import Path
+
+# Plots can't be shown without display, so they are only saved
+import matplotlib
+
+matplotlib.use('Agg')
+
+# Enable start also when not installed via pip (e.g. for development)
+# Get the package_path and add it, should work across platforms and in spyder
+package_parent = str(Path(abspath(getsourcefile(lambda: 0))).parent.parent)
+if package_parent not in sys.path:
+    sys.path.insert(0, package_parent)
+
+from mne_pipeline_hd.pipeline_functions.artifacts import prune_artifacts
+from mne_pipeline_hd.pipeline_functions.cluster import QueueExecutor, run_queue_worker
+from mne_pipeline_hd.pipeline_functions.controller import Controller
+from mne_pipeline_hd.pipeline_functions.data_cache import format_cache_stats, get_data_cache
+from mne_pipeline_hd.pipeline_functions.events import get_event_stream
+from mne_pipeline_hd.pipeline_functions.execution import (StepRunner, get_run_steps, split_plot_steps,
+                                                          summarize_results, validate_binding_plans)
+from mne_pipeline_hd.pipeline_functions.journal import RunJournal, get_resume_steps
+from mne_pipeline_hd.pipeline_functions.parallel import ParallelRunner
+from mne_pipeline_hd.pipeline_functions.loading import fsmri_registry
+from mne_pipeline_hd.pipeline_functions.planner import RunPlanner, get_plan_table
+from mne_pipeline_hd.pipeline_functions.prefetch import Prefetcher
+from mne_pipeline_hd.pipeline_functions.profiler import RunReport
+from mne_pipeline_hd.pipeline_functions.scheduler import DAGRunner
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='mne_pipeline_hd_headless',
+                                     description='Run the selected functions of a project without GUI. '
+                                                 'Functions and objects default to the selection '
+                                                 'stored in the project.')
+    parser.add_argument('--home-path', help='The Home-Path (defaults to the last Home-Path of the GUI)')
+    parser.add_argument('--project', help='The project (defaults to the last project of the GUI)')
+    parser.add_argument('--p-preset', help='The Parameter-Preset (defaults to the last Parameter-Preset)')
+    parser.add_argument('--functions', nargs='+', help='Functions to run instead of the selected functions')
+    parser.add_argument('--meeg', nargs='+', help='MEEG-Files to run instead of the selected MEEG-Files')
+    parser.add_argument('--fsmri', nargs='+', help='Freesurfer-MRIs to run instead of the selected ones')
+    parser.add_argument('--groups', nargs='+', help='Groups to run instead of the selected Groups')
+    parser.add_argument('--n-processes', type=int,
+                        help='Run independent objects in this number of parallel processes '
+                             '(defaults to the setting "n_processes" of the GUI)')
+    parser.add_argument('--dependency-graph', action='store_true',
+                        help='Start each step as soon as the steps it depends on are finished '
+                             '(only with more than one process)')
+    parser.add_argument('--memory-budget', type=float,
+                        help='Only start parallel steps while their estimated peak memory fits into this many GB '
+                             '(defaults to the setting "memory_budget" of the GUI, 0 means no limit)')
+    parser.add_argument('--prefetch-memory', type=float,
+                        help='Load the data of the next object in the background using at most this many GB '
+                             '(only in a sequential run, defaults to the setting "prefetch_memory" of the GUI, '
+                             '0 disables prefetching)')
+    parser.add_argument('--queue',
+                        help='Send the jobs to the queue in this SQLite-file (e.g. in the shared project-directory), '
+                             'from which workers started with mne_pipeline_hd_worker on other machines take them '
+                             '(--n-processes sets how many jobs are queued at the same time)')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='Start this number of workers for the queue on this machine')
+    parser.add_argument('--plot-processes', type=int,
+                        help='Render the plots off-screen in this number of processes after all other functions '
+                             '(defaults to the setting "plot_processes" of the GUI, 0 runs the plot-functions '
+                             'in order with the other functions)')
+    parser.add_argument('--skip-up-to-date', action='store_true',
+                        help='Skip functions, whose outputs are up to date '
+                             '(defaults to the setting "skip_up_to_date" of the GUI)')
+    parser.add_argument('--artifact-store', action='store_true',
+                        help='Link the outputs of functions, which were computed with the same inputs and '
+                             'parameters before (e.g. for another Parameter-Preset), from the artifact-store '
+                             '(defaults to the setting "artifact_store" of the GUI)')
+    parser.add_argument('--prune-artifacts', action='store_true',
+                        help='Remove the files from the artifact-store after the run, which are not linked '
+                             'to a file of the project anymore')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the interrupted last run of the project (from the run-journal) '
+                             'instead of running the selection')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only show the steps with their estimated runtime and peak memory '
+                             'and which steps would be skipped as up to date, without running them')
+    parser.add_argument('--event-stream',
+                        help='Write the events of the run as JSON-lines for external monitoring to this file-path, '
+                             'to "file" for _pipeline_scripts/run_events_<project>.jsonl '
+                             'or send them to "udp://<host>:<port>" (defaults to the setting "event_stream" of the GUI)')
+    parser.add_argument('--summary', help='Write the summary as JSON to this path instead of stdout')
+    parser.add_argument('--no-save', action='store_true', help='Don\'t save the project after the run')
+
+    return parser
+
+
+def apply_selection(controller, args):
+    """Override the selections stored in the project with the selections from the command-line"""
+    pr = controller.pr
+    if args.functions is not None:
+        unknown = [f for f in args.functions if f not in controller.pd_funcs.index]
+        if unknown:
+            raise RuntimeError(f'Functions not found: {unknown}')
+        pr.sel_functions = {f: int(f in args.functions) for f in controller.pd_funcs.index}
+    for attr_name, all_name, selection in [('sel_meeg', 'all_meeg', args.meeg),
+                                           ('sel_fsmri', 'all_fsmri', args.fsmri),
+                                           ('sel_groups', 'all_groups', args.groups)]:
+        if selection is not None:
+            unknown = [s for s in selection if s not in getattr(pr, all_name)]
+            if unknown:
+                raise RuntimeError(f'{unknown} not found in {all_name}')
+            setattr(pr, attr_name, selection)
+
+
+def run_headless(args):
+    controller = Controller(args.home_path, args.project, args.p_preset)
+    apply_selection(controller, args)
+    if args.skip_up_to_date:
+        controller.settings['skip_up_to_date'] = True
+    if args.artifact_store:
+        controller.settings['artifact_store'] = True
+
+    # Save Project before possible errors happen (like in the GUI)
+    if not args.no_save and not args.dry_run:
+        controller.pr.save()
+
+    journal = RunJournal(controller, get_event_stream(controller, args.event_stream))
+    if args.resume:
+        if not journal.is_interrupted():
+            raise RuntimeError(f'No interrupted run found in {journal.journal_path}')
+        remaining_steps, p_preset = journal.get_remaining_steps()
+        # Use the Parameter-Preset of the interrupted run if not given explicitly
+        if args.p_preset is None and p_preset in controller.pr.parameters:
+            controller.pr.p_preset = p_preset
+        elif args.p_preset is None and p_preset is not None:
+            print(f'The Parameter-Preset "{p_preset}" of the interrupted run doesn\'t exist anymore, '
+                  f'the remaining steps run with "{controller.pr.p_preset}"')
+        all_objects, all_steps = get_resume_steps(controller, remaining_steps)
+    else:
+        all_objects, all_steps = get_run_steps(controller)
+
+    if args.dry_run:
+        plan = RunPlanner(controller).plan(all_objects, all_steps)
+        print(get_plan_table(plan))
+        return {'project': controller.pr.name, 'p_preset': controller.pr.p_preset, 'n_failed': 0, 'plan': plan,
+                'write_errors': list()}
+
+    journal.start_run(all_steps)
+    fsmri_registry.clear()
+    get_data_cache().clear()
+    for func_name, error in validate_binding_plans([s[1] for s in all_steps], controller).items():
+        print(f'{func_name} will fail: {error}')
+
+    if args.plot_processes is None:
+        plot_processes = int(controller.qsettings.value('plot_processes', defaultValue=0))
+    else:
+        plot_processes = args.plot_processes
+    # Plots are never shown without GUI, thus they can always be rendered in other processes
+    if plot_processes > 0:
+        all_steps, plot_steps = split_plot_steps(controller, all_steps)
+    else:
+        plot_steps = list()
+
+    n_processes = args.n_processes or int(controller.qsettings.value('n_processes', defaultValue=1))
+    if args.memory_budget is None:
+        memory_budget = float(controller.qsettings.value('memory_budget', defaultValue=0))
+    else:
+        memory_budget = args.memory_budget
+    # The Memory-Budget is set in GB
+    memory_budget = memory_budget * 1024 ** 3 or None
+    executor = QueueExecutor(args.queue, n_local_workers=args.local_workers) if args.queue else None
+    parallel = n_processes > 1 or executor is not None
+    if parallel and (args.dependency_graph or controller.get_setting('dependency_graph')):
+        runner = DAGRunner(controller, all_objects, all_steps, n_processes, journal=journal,
+                           memory_budget=memory_budget, executor=executor)
+    elif parallel:
+        runner = ParallelRunner(controller, all_objects, all_steps, n_processes, journal=journal,
+                                memory_budget=memory_budget, executor=executor)
+    else:
+        if args.prefetch_memory is None:
+            prefetch_memory = float(controller.qsettings.value('prefetch_memory', defaultValue=0))
+        else:
+            prefetch_memory = args.prefetch_memory
+        prefetcher = Prefetcher(controller, prefetch_memory * 1024 ** 3) if prefetch_memory > 0 else None
+        # Without the Prefetcher-thread the steps own the process, thus the CPU-time of the threads
+        # started by the functions (e.g. BLAS or n_jobs) is measured too (the clock is recorded with each step)
+        cpu_clock = 'thread' if prefetcher is not None else 'process'
+        runner = StepRunner(controller, all_objects, all_steps, journal=journal, prefetcher=prefetcher,
+                            cpu_clock=cpu_clock)
+    summary = runner.run()
+    # Errors of data saved in the background (with the setting "async_save")
+    write_errors = summary.get('write_errors', list())
+    if len(plot_steps) > 0:
+        print(f'Rendering {len(plot_steps)} plots in {plot_processes} processes')
+        plot_runner = ParallelRunner(controller, all_objects, plot_steps, plot_processes, journal=journal,
+                                     memory_budget=memory_budget)
+        plot_summary = plot_runner.run()
+        write_errors += plot_summary.get('write_errors', list())
+        summary = summarize_results(summary['steps'] + plot_summary['steps'])
+    journal.end_run()
+    summary.update({'project': controller.pr.name, 'p_preset': controller.pr.p_preset,
+                    'write_errors': write_errors})
+
+    # Save the measurements of the steps and show which functions took the most time
+    report = RunReport(summary['steps'])
+    # The summary and the journal are still written, if the report can't be saved (e.g. when the disk is full)
+    try:
+        summary['report'] = report.save(controller)
+    except OSError as err:
+        print(f'Run-Report could not be saved: {err}')
+        summary['report'] = None
+    print(report.get_table())
+    # The hits and misses of the data-cache of this process (not of the parallel processes)
+    summary['cache'] = get_data_cache().get_stats()
+    print(format_cache_stats(summary['cache']))
+
+    if args.prune_artifacts:
+        n_files, n_bytes = prune_artifacts(controller)
+        print(f'Removed {n_files} files ({n_bytes / 1024 ** 2:.1f} MB) from the artifact-store')
+        summary['pruned_artifacts'] = n_files
+
+    if not args.no_save:
+        controller.pr.save()
+
+    return summary
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    summary = run_headless(args)
+
+    summary_str = json.dumps(summary, indent=4)
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            file.write(summary_str)
+    else:
+        print(summary_str)
+
+    # Non-zero exit-code if any step or the saving of data failed
+    sys.exit(int(summary['n_failed'] > 0 or len(summary.get('write_errors', list())) > 0))
+
+
+def get_worker_parser():
+    parser = argparse.ArgumentParser(prog='mne_pipeline_hd_worker',
+                                     description='Run jobs from a queue filled by mne_pipeline_hd_headless --queue '
+                                                 '(the project-directory has to be accessible from this machine)')
+    parser.add_argument('--queue', required=True, help='The SQLite-file of the queue')
+    parser.add_argument('--home-path', help='The Home-Path on this machine if it is mounted at another path than on '
+                                            'the machine, which submitted the jobs')
+    parser.add_argument('--poll-interval', type=float, default=5,
+                        help='Seconds to wait before looking for new jobs if the queue is empty')
+    parser.add_argument('--idle-timeout', type=float,
+                        help='Stop after the queue was empty for this many seconds (defaults to run forever)')
+    parser.add_argument('--max-jobs', type=int, help='Stop after this number of jobs')
+    parser.add_argument('--lease-timeout', type=float, default=300,
+                        help='Seconds without heartbeat of a worker, after which its running job is taken '
+                             'by another worker')
+    parser.add_argument('--n-workers', type=int, default=1,
+                        help='The number of workers started on this machine, which share its cores '
+                             'and the data-cache')
+
+    return parser
+
+
+def worker_main(argv=None):
+    args = get_worker_parser().parse_args(argv)
+    run_queue_worker(args.queue, home_path=args.home_path, poll_interval=args.poll_interval,
+                     idle_timeout=args.idle_timeout, max_jobs=args.max_jobs, lease_timeout=args.lease_timeout,
+                     n_workers=args.n_workers)
+
+
+if __name__ == '__main__':
+    main()
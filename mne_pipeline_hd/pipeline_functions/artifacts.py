@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+A content-addressed store of the files saved by functions (with the setting "artifact_store")
+
+Each step (function and data-object) gets a key from the hash of
+    - the source-code of the function (with the module-level helper-functions it calls),
+    - the values of the parameters the function takes or reads from the Parameter-Preset,
+    - the entries for the object in the project (e.g. bad-channels, event-id, ica_exclude),
+      except those the function sets itself,
+    - the files it loads (device, inode, size and modification-time).
+The files saved by the step are hard-linked into <data_path>/_artifacts under this key.
+When another Parameter-Preset runs the same step with the same key,
+the files are linked from the store to its paths instead of computing them again.
+Files restored this way share the inode with the stored file, thus also the keys of the next steps match
+(e.g. presets, which differ only in the parameters for the inverse-operator, share filtered raw, epochs and ICA).
+
+Linked files are removed before they are saved again (see detach_files), writing into them would change all links.
+If hard-links are not supported, the files are copied (and the store is marked, thus it is never pruned).
+Stored files, which are not linked to any path of a Parameter-Preset anymore, are removed by prune_artifacts.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from os import makedirs, remove, rmdir
+from os.path import isdir, isfile, join
+from pathlib import Path
+
+from .pipeline_utils import (_get_data_objects, _get_data_paths, _get_function_source, get_function_entries,
+                             get_function_io, get_function_parameters)
+
+# Source-Estimates are saved with the suffixes -lh.stc/-rh.stc
+artifact_suffixes = ['', '-lh.stc', '-rh.stc']
+# The file in the store, which marks that files were copied instead of hard-linked
+copied_marker = '_copied'
+# Calls to load/save JSON-files with secondary data (e.g. meeg.save_json('eog_indices', eog_indices))
+json_call_pattern = re.compile(r'\b(meeg|group)\.(load|save)_json\([\'"](\w+)[\'"]')
+
+
+def use_artifact_store(obj):
+    """Check the setting "artifact_store" (only data of MEEG and Group is stored, FSMRI-data is not in data_path)"""
+    # Avoid circular import
+    from .loading import Group, MEEG
+
+    return bool(obj.mw.get_setting('artifact_store')) and isinstance(obj, (MEEG, Group))
+
+
+def get_store_path(main_win):
+    return join(main_win.pr.data_path, '_artifacts')
+
+
+def _get_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _get_files(path):
+    """Get the files on disk for a path from the io_dict as (suffix, file-path)"""
+    return [(suffix, path + suffix) for suffix in artifact_suffixes if isfile(path + suffix)]
+
+
+def _get_file_identity(path):
+    """Get the identity of the files for path (links to the same stored file have the same identity)"""
+    identity = list()
+    for suffix, file_path in _get_files(path):
+        stat = os.stat(file_path)
+        identity.append((suffix, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+
+    return identity or None
+
+
+def _get_step_io(obj, func_name):
+    """Get the source-code of a function and the data it loads and saves (None if the step can't be stored)"""
+    func, source = _get_function_source(func_name, obj.mw)
+    io = get_function_io(func_name, obj.mw)
+    if source == '' or io is None:
+        return None
+
+    outputs = [(ot, dn) for ot, dn in io['save'] if dn != 'json']
+    # Only steps, which save data of their own object, are stored
+    if len(outputs) == 0 or any([ot != type(obj).__name__ for ot, _ in outputs]):
+        return None
+    json_io = {'load': set(), 'save': set()}
+    for _, mode, file_name in json_call_pattern.findall(source):
+        json_io[mode].add(file_name)
+
+    return func, source, io, outputs, json_io
+
+
+def get_step_key(obj, func_name):
+    """Get the key for the outputs of a step from the hash of its inputs and parameters
+
+    Returns
+    -------
+    step_key : str | None
+        The key or None, if the outputs of the function can't be stored
+    """
+    step_io = _get_step_io(obj, func_name)
+    if step_io is None:
+        return None
+    func, source, io, _, json_io = step_io
+    # The same parameters and entries are compared by check_up_to_date
+    parameters = get_function_parameters(obj, func_name)
+
+    inputs = list()
+    for obj_type, data_name in sorted(io['load']):
+        if data_name == 'json':
+            continue
+        for data_obj in _get_data_objects(obj, obj_type):
+            paths = _get_data_paths(data_obj, data_name) or list()
+            inputs.append((obj_type, data_obj.name, data_name, [_get_file_identity(p) for p in paths]))
+    for file_name in sorted(json_io['load']):
+        inputs.append(('json', file_name, _get_file_identity(obj.get_json_path(file_name))))
+
+    return _get_hash({'function': func_name, 'source': source, 'parameters': parameters,
+                      'inputs': inputs, 'object': get_function_entries(obj, func_name)})
+
+
+def _get_store_file(obj, step_key, data_type, path):
+    """Get the path in the store for a path from the io_dict (keeping the file-name for the file-endings of MNE)"""
+    # The same file-name for all Parameter-Presets
+    file_name = Path(path).name.replace(f'_{obj.p_preset}', '')
+    output_key = _get_hash([step_key, data_type, file_name])
+
+    return join(get_store_path(obj.mw), output_key[:2], f'{output_key}_{file_name}')
+
+
+def _mark_copied(main_win):
+    """Mark the store, when files were copied, the number of links doesn't tell anymore if a file is used"""
+    marker_path = join(get_store_path(main_win), copied_marker)
+    if not isfile(marker_path):
+        makedirs(get_store_path(main_win), exist_ok=True)
+        with open(marker_path, 'w') as file:
+            file.write('Files were copied instead of hard-linked, the store can\'t be pruned\n')
+
+
+def _link(source_path, target_path):
+    """Hard-link source_path to target_path (replacing target_path, copying if hard-links are not supported)
+
+    Returns
+    -------
+    linked : bool
+        False, if the file was copied
+    """
+    makedirs(Path(target_path).parent, exist_ok=True)
+    tmp_path = f'{target_path}.{os.getpid()}.tmp'
+    if isfile(tmp_path):
+        remove(tmp_path)
+    try:
+        os.link(source_path, tmp_path)
+        linked = True
+    except OSError:
+        shutil.copy2(source_path, tmp_path)
+        linked = False
+    os.replace(tmp_path, target_path)
+
+    return linked
+
+
+def prune_artifacts(main_win):
+    """Remove the files from the store, which are not linked to a file of the project anymore
+
+    If files were copied instead of hard-linked (see _mark_copied), nothing is removed,
+    because the copies in the store have no other links even while they are used.
+
+    Returns
+    -------
+    n_files : int
+        The number of removed files
+    n_bytes : int
+        The size of the removed files in bytes
+    """
+    store_path = get_store_path(main_win)
+    n_files = 0
+    n_bytes = 0
+    if not isdir(store_path):
+        return n_files, n_bytes
+    if isfile(join(store_path, copied_marker)):
+        print(f'The artifact-store at {store_path} can\'t be pruned, because hard-links are not supported '
+              f'and files were copied')
+        return n_files, n_bytes
+
+    for dir_path, _, file_names in os.walk(store_path, topdown=False):
+        for file_name in file_names:
+            file_path = join(dir_path, file_name)
+            stat = os.stat(file_path)
+            # Only the link in the store is left
+            if stat.st_nlink == 1:
+                remove(file_path)
+                n_files += 1
+                n_bytes += stat.st_size
+        if dir_path != store_path and len(os.listdir(dir_path)) == 0:
+            rmdir(dir_path)
+
+    return n_files, n_bytes
+
+
+def detach_files(paths):
+    """Remove the files of paths, which are linked with the store, before they are saved again"""
+    for path in paths:
+        for _, file_path in _get_files(path):
+            if os.stat(file_path).st_nlink > 1:
+                remove(file_path)
+
+
+def store_artifacts(obj, step_key, data_type, paths):
+    """Link the files of data_type just saved by the step with step_key into the store"""
+    for path in paths:
+        store_file = _get_store_file(obj, step_key, data_type, path)
+        for suffix, file_path in _get_files(path):
+            if not _link(file_path, store_file + suffix):
+                _mark_copied(obj.mw)
+
+
+def restore_artifacts(obj, func_name, step_key):
+    """Link the outputs of a step from the store to the paths of the current Parameter-Preset
+
+    Returns
+    -------
+    restored : bool
+        True, if all outputs were in the store and the function doesn't need to run
+    reason : str
+        A description of the outcome
+    """
+    step_io = _get_step_io(obj, func_name)
+    if step_io is None:
+        return False, ''
+    _, _, _, outputs, json_io = step_io
+
+    links = list()
+    restored_paths = list()
+    restored_types = list()
+    for _, data_name in outputs:
+        data_type = [dt for dt in obj.io_dict if obj.io_dict[dt]['save'] == f'save_{data_name}'][0]
+        paths = _get_data_paths(obj, data_name)
+        if not paths:
+            return False, f'no paths for {data_name}'
+        for path in paths:
+            store_file = _get_store_file(obj, step_key, data_type, path)
+            files = [(store_file + suffix, path + suffix) for suffix in artifact_suffixes
+                     if isfile(store_file + suffix)]
+            if len(files) == 0:
+                return False, f'{Path(path).name} is not in the artifact-store'
+            links += files
+            restored_paths.append(path)
+        restored_types.append(data_type)
+    # JSON-files are saved only by some runs of a function (e.g. if ECG-channels exist)
+    for file_name in json_io['save']:
+        path = obj.get_json_path(file_name)
+        store_file = _get_store_file(obj, step_key, 'json', path)
+        if isfile(store_file):
+            links.append((store_file, path))
+            restored_paths.append(path)
+
+    for store_file, path in links:
+        if not _link(store_file, path):
+            _mark_copied(obj.mw)
+    for path in restored_paths:
+        obj.save_file_params(path, func_name)
+    # Data prefetched before is outdated now
+    for data_type in restored_types:
+        obj.data_dict.pop(data_type, None)
+
+    return True, f'outputs of {func_name} linked from the artifact-store'
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Send the jobs of a parallel run to a queue, from which worker-processes on other machines
+(with access to the same project-directory) pull them
+"""
+import inspect
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future
+from contextlib import closing
+from copy import deepcopy
+from multiprocessing import get_context
+
+from .pipeline_utils import TypedJSONEncoder, encode_tuples, type_json_hook
+
+
+class JobQueue:
+    """The interface of a queue for the jobs of a parallel run
+
+    A job is a dictionary with the arguments of run_object_steps (e.g. project, Parameter-Preset,
+    object-name and functions), the result is the return-value of run_object_steps.
+    """
+
+    def submit(self, job, run_id=None):
+        """Put a job into the queue (tagged with the id of its run) and return its id"""
+        raise NotImplementedError
+
+    def fetch(self, worker_name):
+        """Take the next pending job for a worker and return (job_id, job) or None if there is none"""
+        raise NotImplementedError
+
+    def complete(self, job_id, result):
+        """Store the result of a finished job"""
+        raise NotImplementedError
+
+    def fail(self, job_id, error):
+        """Mark a job as failed with an error-message"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id):
+        """Renew the lease of a running job (jobs with an expired lease are taken by another worker)"""
+        raise NotImplementedError
+
+    def cancel(self, run_id):
+        """Remove the pending jobs of a run and return their ids"""
+        raise NotImplementedError
+
+    def get_finished(self, job_ids):
+        """Get (job_id, result, error) for the jobs from job_ids, which are finished"""
+        raise NotImplementedError
+
+
+class SQLiteQueue(JobQueue):
+    """A JobQueue in a SQLite-database (e.g. in the shared project-directory)
+
+    SQLite locks the database-file while a job is taken, thus many workers can use the same file.
+    CAVE: Some network-file-systems don't support file-locking reliably.
+
+    A running job has a lease, which its worker renews with heartbeats. If the worker dies
+    (e.g. the machine crashed), the lease expires and the job is put back to pending for another worker.
+
+    Parameters
+    ----------
+    queue_path : str
+        The path to the database-file (created if it doesn't exist)
+    lease_timeout : float
+        The seconds after the last heartbeat, until a running job is taken by another worker
+    max_attempts : int
+        The number of times a job is started, before it fails (e.g. if it always kills its worker)
+    """
+    # Columns added after the first version of the queue
+    added_columns = {'run_id': 'TEXT', 'heartbeat': 'REAL', 'attempts': 'INTEGER DEFAULT 0'}
+
+    def __init__(self, queue_path, lease_timeout=300, max_attempts=3):
+        self.queue_path = queue_path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        with closing(self.connect()) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'status TEXT NOT NULL, '
+                               'job TEXT NOT NULL, '
+                               'result TEXT, '
+                               'error TEXT, '
+                               'worker TEXT, '
+                               'submitted REAL, '
+                               'started REAL, '
+                               'finished REAL, '
+                               'run_id TEXT, '
+                               'heartbeat REAL, '
+                               'attempts INTEGER DEFAULT 0)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            for column, column_type in self.added_columns.items():
+                if column not in columns:
+                    connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+
+    def connect(self):
+        # Wait for locks of other workers instead of failing immediately
+        return sqlite3.connect(self.queue_path, timeout=60, isolation_level=None)
+
+    def submit(self, job, run_id=None):
+        # Tuples in the entries of the project need to be encoded (e.g. in the event-ids)
+        job = deepcopy(job)
+        encode_tuples(job)
+        job_str = json.dumps(job, cls=TypedJSONEncoder)
+        with closing(self.connect()) as connection:
+            cursor = connection.execute('INSERT INTO jobs (status, job, submitted, run_id) VALUES (?, ?, ?, ?)',
+                                        ('pending', job_str, time.time(), run_id))
+            return cursor.lastrowid
+
+    def _expire_leases(self, connection):
+        """Put the running jobs with an expired lease back to pending (or fail them after max_attempts)"""
+        expired = connection.execute('SELECT id, worker, attempts FROM jobs WHERE status = ? AND heartbeat < ?',
+                                     ('running', time.time() - self.lease_timeout)).fetchall()
+        for job_id, worker_name, attempts in expired:
+            if (attempts or 0) >= self.max_attempts:
+                connection.execute('UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                                   ('failed', f'Lease expired {attempts} times (last worker: {worker_name})',
+                                    time.time(), job_id))
+            else:
+                connection.execute('UPDATE jobs SET status = ?, worker = NULL WHERE id = ?', ('pending', job_id))
+
+    def fetch(self, worker_name):
+        with closing(self.connect()) as connection:
+            # Lock the database, thus no other worker can take the same job
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                self._expire_leases(connection)
+                row = connection.execute('SELECT id, job FROM jobs WHERE status = ? ORDER BY id LIMIT 1',
+                                         ('pending',)).fetchone()
+                if row is not None:
+                    now = time.time()
+                    connection.execute('UPDATE jobs SET status = ?, worker = ?, started = ?, heartbeat = ?, '
+                                       'attempts = COALESCE(attempts, 0) + 1 WHERE id = ?',
+                                       ('running', worker_name, now, now, row[0]))
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+        if row is None:
+            return None
+
+        return row[0], json.loads(row[1], object_hook=type_json_hook)
+
+    def complete(self, job_id, result):
+        # Tuples in the project-entries need to be encoded
+        results, project_entries, write_errors = deepcopy(result)
+        encode_tuples(project_entries)
+        result_str = json.dumps([results, project_entries, write_errors], cls=TypedJSONEncoder)
+        with closing(self.connect()) as connection:
+            connection.execute('UPDATE jobs SET status = ?, result = ?, finished = ? WHERE id = ?',
+                               ('finished', result_str, time.time(), job_id))
+
+    def fail(self, job_id, error):
+        with closing(self.connect()) as connection:
+            connection.execute('UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                               ('failed', error, time.time(), job_id))
+
+    def heartbeat(self, job_id):
+        with closing(self.connect()) as connection:
+            connection.execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ?',
+                               (time.time(), job_id, 'running'))
+
+    def cancel(self, run_id):
+        with closing(self.connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                job_ids = [row[0] for row in connection.execute('SELECT id FROM jobs WHERE run_id = ? AND status = ?',
+                                                                (run_id, 'pending'))]
+                connection.execute('DELETE FROM jobs WHERE run_id = ? AND status = ?', (run_id, 'pending'))
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+        return job_ids
+
+    def get_finished(self, job_ids):
+        if len(job_ids) == 0:
+            return list()
+        with closing(self.connect()) as connection:
+            rows = connection.execute(f'SELECT id, result, error FROM jobs '
+                                      f'WHERE status IN (?, ?) AND id IN ({", ".join(["?"] * len(job_ids))})',
+                                      ['finished', 'failed'] + list(job_ids)).fetchall()
+
+        return [(job_id, json.loads(result, object_hook=type_json_hook) if result else None, error)
+                for job_id, result, error in rows]
+
+
+def _send_heartbeats(queue, job_id, stop_event):
+    """Renew the lease of a job until stop_event is set (in a thread, while the job runs)"""
+    while not stop_event.wait(queue.lease_timeout / 5):
+        try:
+            queue.heartbeat(job_id)
+        except sqlite3.Error as err:
+            # The lease is lost only, if the heartbeats fail for the whole lease_timeout
+            logging.warning(f'Heartbeat for job {job_id} failed: {err}')
+
+
+def run_queue_worker(queue_path, home_path=None, poll_interval=5, idle_timeout=None, max_jobs=None,
+                     lease_timeout=300, n_workers=1):
+    """Take jobs from the queue and run them until the queue is idle for idle_timeout seconds
+
+    Parameters
+    ----------
+    queue_path : str
+        The path to the database-file of the SQLiteQueue
+    home_path : str | None
+        The Home-Path on this machine, if it differs from the one of the submitting machine
+        (e.g. because the shared directory is mounted elsewhere)
+    poll_interval : float
+        The seconds to wait before looking for new jobs if the queue is empty
+    idle_timeout : float | None
+        Stop after the queue was empty for this many seconds (None to run forever)
+    max_jobs : int | None
+        Stop after running this number of jobs (None for no limit)
+    lease_timeout : float
+        The seconds after the last heartbeat of a worker, until its running job is taken by another worker
+    n_workers : int
+        The number of workers on this machine, which share its cores and the data-cache
+        (the settings "n_jobs" and "cache_memory" of this machine)
+    """
+    # The pipeline (with MNE) is only imported, where jobs run, the queue itself doesn't need it
+    from .parallel import _init_worker, run_object_steps
+
+    _init_worker()
+    queue = SQLiteQueue(queue_path, lease_timeout=lease_timeout)
+    worker_name = f'{socket.gethostname()}:{os.getpid()}'
+    n_jobs = 0
+    idle_since = time.time()
+
+    while max_jobs is None or n_jobs < max_jobs:
+        fetched = queue.fetch(worker_name)
+        if fetched is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        job_id, job = fetched
+        print(f'{worker_name} running {job["obj_name"]} <- {", ".join(job["functions"])}')
+        if home_path is not None:
+            job['home_path'] = home_path
+        stop_event = threading.Event()
+        heartbeat_thread = threading.Thread(target=_send_heartbeats, args=(queue, job_id, stop_event), daemon=True)
+        heartbeat_thread.start()
+        try:
+            result = run_object_steps(n_workers=n_workers, **job)
+        except Exception as err:
+            queue.fail(job_id, f'{type(err).__name__}: {err}')
+        else:
+            queue.complete(job_id, result)
+        finally:
+            stop_event.set()
+            heartbeat_thread.join()
+        n_jobs += 1
+        idle_since = time.time()
+
+
+class QueueExecutor(Executor):
+    """An Executor for the ParallelRunner, which sends the jobs to a SQLiteQueue instead of a local process-pool
+
+    Parameters
+    ----------
+    queue_path : str
+        The path to the database-file of the SQLiteQueue
+    n_local_workers : int
+        Start this number of workers on this machine (e.g. to run without a cluster)
+    poll_interval : float
+        The seconds between looking for finished jobs
+    max_poll_errors : int
+        The number of failed attempts in a row to look for finished jobs (e.g. if the shared directory is
+        not reachable), before the outstanding jobs fail
+    """
+
+    def __init__(self, queue_path, n_local_workers=0, poll_interval=1, max_poll_errors=10):
+        self.queue = SQLiteQueue(queue_path)
+        self.poll_interval = poll_interval
+        self.max_poll_errors = max_poll_errors
+        # The jobs of this executor are tagged with this id (to cancel them without touching other runs)
+        self.run_id = uuid.uuid4().hex
+        # Queue-Job-ID -> Future
+        self.futures = dict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._poll_thread = threading.Thread(target=self._poll, daemon=True)
+        self._poll_thread.start()
+
+        self.local_workers = list()
+        for _ in range(n_local_workers):
+            process = get_context('spawn').Process(target=run_queue_worker, args=(queue_path,),
+                                                   kwargs={'poll_interval': poll_interval,
+                                                           'n_workers': n_local_workers}, daemon=True)
+            process.start()
+            self.local_workers.append(process)
+
+    def submit(self, fn, *args, **kwargs):
+        # The pipeline (with MNE) is only imported, where jobs run, the queue itself doesn't need it
+        from .parallel import run_object_steps
+
+        if fn is not run_object_steps:
+            raise ValueError('Only run_object_steps can be sent to a queue')
+        # Serialize the job with the names of the arguments
+        job = dict(inspect.signature(run_object_steps).bind(*args, **kwargs).arguments)
+        # The results of the job would never be collected
+        if not self._poll_thread.is_alive():
+            raise RuntimeError('The queue is not polled anymore')
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self.futures[self.queue.submit(job, self.run_id)] = future
+
+        return future
+
+    def _collect_finished(self):
+        with self._lock:
+            job_ids = list(self.futures)
+        for job_id, result, error in self.queue.get_finished(job_ids):
+            with self._lock:
+                future = self.futures.pop(job_id)
+            if error is None:
+                future.set_result(tuple(result))
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_futures(self, error, job_ids=None):
+        """Fail the outstanding futures (or only those of job_ids)"""
+        with self._lock:
+            job_ids = list(self.futures) if job_ids is None else job_ids
+            futures = [self.futures.pop(job_id) for job_id in job_ids if job_id in self.futures]
+        for future in futures:
+            future.set_exception(error)
+
+    def _poll(self):
+        n_errors = 0
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self._collect_finished()
+            except Exception as err:
+                # e.g. the shared directory is temporarily not reachable
+                n_errors += 1
+                logging.warning(f'Polling the queue failed ({n_errors}/{self.max_poll_errors}): '
+                                f'{type(err).__name__}: {err}')
+                if n_errors >= self.max_poll_errors:
+                    self._fail_futures(RuntimeError(f'Polling the queue failed: {type(err).__name__}: {err}'))
+                    break
+            else:
+                n_errors = 0
+
+    def cancel_pending(self):
+        """Remove the jobs of this executor, which no worker took yet, from the queue"""
+        try:
+            job_ids = self.queue.cancel(self.run_id)
+        except sqlite3.Error as err:
+            logging.warning(f'Pending jobs of run {self.run_id} could not be cancelled: {err}')
+        else:
+            self._fail_futures(RuntimeError('The job was cancelled'), job_ids)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if cancel_futures:
+            self.cancel_pending()
+        if wait:
+            while len(self.futures) > 0 and self._poll_thread.is_alive():
+                time.sleep(self.poll_interval)
+        self._stop_event.set()
+        self._poll_thread.join()
+        # Jobs of this run should not be taken by workers after the run ended
+        self.cancel_pending()
+        for process in self.local_workers:
+            process.terminate()
+            process.join()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Don't wait for the remaining jobs, if the run was aborted by an error
+        self.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+        return False
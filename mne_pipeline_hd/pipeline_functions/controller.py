@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import json
+import os
+import re
+import sys
+from importlib import reload, resources, util
+from os import listdir
+from os.path import isdir, join
+
+import mne
+import pandas as pd
+# QtCore doesn't need a display (QSettings are shared with the GUI)
+from PyQt5.QtCore import QCoreApplication, QSettings
+
+from .execution import make_binding_plans
+from .project import Project
+from .. import basic_functions
+
+
+class BaseController:
+    """The Qt-GUI-independent logic of the Controller and the MainWindow (settings, base-paths and functions)
+
+    Errors while importing custom-modules are printed (see import_error), the MainWindow shows them in dialogs.
+    """
+
+    def make_base_paths(self):
+        self.projects_path = join(self.home_path, 'projects')
+        self.subjects_dir = join(self.home_path, 'freesurfer')
+        mne.utils.set_config("SUBJECTS_DIR", self.subjects_dir, set_env=True)
+        self.custom_pkg_path = join(self.home_path, 'custom_packages')
+        for path in [self.projects_path, self.subjects_dir, self.custom_pkg_path]:
+            if not isdir(path):
+                os.mkdir(path)
+
+    def load_default_settings(self):
+        with resources.open_text('mne_pipeline_hd.pipeline_resources', 'default_settings.json') as file:
+            self.default_settings = json.load(file)
+
+    def load_settings(self):
+        self.load_default_settings()
+        try:
+            with open(join(self.home_path, 'mne_pipeline_hd-settings.json'), 'r') as file:
+                self.settings = json.load(file)
+            # Account for settings, which were not saved but exist in default_settings
+            for setting in [s for s in self.default_settings['settings'] if s not in self.settings]:
+                self.settings[setting] = self.default_settings['settings'][setting]
+        except FileNotFoundError:
+            self.settings = self.default_settings['settings']
+
+        # Check QSettings
+        for qsetting in [qs for qs in self.default_settings['qsettings'] if qs not in self.qsettings.childKeys()]:
+            self.qsettings.setValue(qsetting, self.default_settings['qsettings'][qsetting])
+
+    def save_settings(self):
+        with open(join(self.home_path, 'mne_pipeline_hd-settings.json'), 'w') as file:
+            json.dump(self.settings, file, indent=4)
+
+    def get_setting(self, setting):
+        try:
+            value = self.settings[setting]
+        except KeyError:
+            value = self.default_settings['settings'][setting]
+
+        return value
+
+    def get_func_groups(self):
+        self.fsmri_funcs = self.pd_funcs[self.pd_funcs['target'] == 'FSMRI']
+        self.meeg_funcs = self.pd_funcs[self.pd_funcs['target'] == 'MEEG']
+        self.group_funcs = self.pd_funcs[self.pd_funcs['target'] == 'Group']
+        self.other_funcs = self.pd_funcs[self.pd_funcs['target'] == 'Other']
+
+    def load_pd_funcs(self):
+        # Pandas-DataFrame for contextual data of basic functions (included with program)
+        with resources.path('mne_pipeline_hd.pipeline_resources', 'functions.csv') as pd_funcs_path:
+            self.pd_funcs = pd.read_csv(str(pd_funcs_path), sep=';', index_col=0)
+        # Pandas-DataFrame for contextual data of paramaters for basic functions (included with program)
+        with resources.path('mne_pipeline_hd.pipeline_resources', 'parameters.csv') as pd_params_path:
+            self.pd_params = pd.read_csv(str(pd_params_path), sep=';', index_col=0)
+
+    def import_error(self, title, err):
+        """Report an error while importing a custom-package (called inside the except-block)"""
+        print(f'{title}: {err}')
+
+    def import_files_missing(self, pkg_name, missing_files):
+        """Report the missing files of a custom-package"""
+        print(f'Files for import of {pkg_name} are missing: {missing_files}')
+
+    def import_custom_modules(self):
+        """
+        Load all modules in basic_functions and custom_functions
+        """
+
+        # Load basic-modules
+        basic_functions_list = [x for x in dir(basic_functions) if '__' not in x]
+        self.all_modules['basic'] = dict()
+        for module_name in basic_functions_list:
+            self.all_modules['basic'][module_name] = (getattr(basic_functions, module_name), None)
+
+        # Load custom_modules
+        pd_functions_pattern = r'.*_functions\.csv'
+        pd_parameters_pattern = r'.*_parameters\.csv'
+        custom_module_pattern = r'(.+)(\.py)$'
+        for directory in [d for d in os.scandir(self.custom_pkg_path) if not d.name.startswith('.')]:
+            pkg_name = directory.name
+            pkg_path = directory.path
+            file_dict = {'functions': None, 'parameters': None, 'modules': list()}
+            for file_name in [f for f in listdir(pkg_path) if not f.startswith(('.', '_'))]:
+                functions_match = re.match(pd_functions_pattern, file_name)
+                parameters_match = re.match(pd_parameters_pattern, file_name)
+                custom_module_match = re.match(custom_module_pattern, file_name)
+                if functions_match:
+                    file_dict['functions'] = join(pkg_path, file_name)
+                elif parameters_match:
+                    file_dict['parameters'] = join(pkg_path, file_name)
+                elif custom_module_match and custom_module_match.group(1) != '__init__':
+                    file_dict['modules'].append(custom_module_match)
+
+            if file_dict['functions'] is None or file_dict['parameters'] is None:
+                self.import_files_missing(pkg_name, [key for key in file_dict if file_dict[key] is None])
+                continue
+
+            self.all_modules[pkg_name] = dict()
+            correct_count = 0
+            for module_match in file_dict['modules']:
+                module_name = module_match.group(1)
+                module_file_name = module_match.group()
+
+                spec = util.spec_from_file_location(module_name, join(pkg_path, module_file_name))
+                module = util.module_from_spec(spec)
+                try:
+                    spec.loader.exec_module(module)
+                except Exception as err:
+                    self.import_error(f'Error in import of custom-module: {module_name}', err)
+                else:
+                    correct_count += 1
+                    # Add module to sys.modules
+                    sys.modules[module_name] = module
+                    # Add Module to dictionary
+                    self.all_modules[pkg_name][module_name] = (module, spec)
+
+            # Make sure, that every module in modules is imported without error
+            # (otherwise don't append to pd_funcs and pd_params)
+            if len(file_dict['modules']) == correct_count:
+                try:
+                    read_pd_funcs = pd.read_csv(file_dict['functions'], sep=';', index_col=0)
+                    read_pd_params = pd.read_csv(file_dict['parameters'], sep=';', index_col=0)
+                except Exception as err:
+                    self.import_error(f'Error in import of custom-package: {pkg_name}', err)
+                    continue
+                # Add pkg_name here (would be redundant in read_pd_funcs of each custom-package)
+                read_pd_funcs['pkg_name'] = pkg_name
+
+                # Check, that there are no duplicates
+                pd_funcs_to_append = read_pd_funcs.loc[~read_pd_funcs.index.isin(self.pd_funcs.index)]
+                self.pd_funcs = pd.concat([self.pd_funcs, pd_funcs_to_append])
+                pd_params_to_append = read_pd_params.loc[~read_pd_params.index.isin(self.pd_params.index)]
+                self.pd_params = pd.concat([self.pd_params, pd_params_to_append])
+
+        self.get_func_groups()
+        make_binding_plans(self)
+
+    def reload_modules(self):
+        for pkg_name in self.all_modules:
+            for module_name in self.all_modules[pkg_name]:
+                module = self.all_modules[pkg_name][module_name][0]
+                try:
+                    reload(module)
+                # Custom-Modules somehow can't be reloaded because spec is not found
+                except ModuleNotFoundError:
+                    spec = self.all_modules[pkg_name][module_name][1]
+                    if spec:
+                        spec.loader.exec_module(module)
+                        sys.modules[module_name] = module
+                    else:
+                        raise RuntimeError(f'{module_name} from {pkg_name} could not be reloaded')
+        make_binding_plans(self)
+
+
+class Controller(BaseController):
+    """A Qt-GUI-independent replacement for the MainWindow holding the project, settings and functions
+
+    Parameters
+    ----------
+    home_path : str | None
+        The Home-Path with the projects (if None, the last Home-Path from the GUI is taken)
+    project : str | None
+        The name of the project (if None, the last project from the settings is taken)
+    p_preset : str | None
+        The Parameter-Preset to use (if None, the last selected Parameter-Preset is taken)
+    """
+
+    def __init__(self, home_path=None, project=None, p_preset=None):
+        # Use the same QSettings as the GUI (without a QApplication)
+        QCoreApplication.setOrganizationName('marsipu')
+        QCoreApplication.setApplicationName('mne_pipeline_hd')
+        self.qsettings = QSettings()
+
+        self.home_path = home_path or self.qsettings.value('home_path', defaultValue=None)
+        if self.home_path is None or not isdir(self.home_path):
+            raise RuntimeError(f'Home-Path {self.home_path} not found!')
+
+        self.projects_path = ''
+        self.subjects_dir = ''
+        self.custom_pkg_path = ''
+        self.all_modules = dict()
+        # The BindingPlans for the arguments of each function
+        self.binding_plans = dict()
+        # Only for compatibility with the MainWindow
+        self.pipeline_running = False
+
+        self.settings = dict()
+        self.load_settings()
+        self.make_base_paths()
+
+        # Get projects and current_project
+        self.projects = [p for p in listdir(self.projects_path) if isdir(join(self.projects_path, p, 'data'))]
+        self.current_project = project or self.get_setting('current_project')
+        if self.current_project not in self.projects:
+            raise RuntimeError(f'Project {self.current_project} not found in {self.projects_path}')
+
+        self.load_pd_funcs()
+
+        # Import the basic- and custom-function-modules
+        self.import_custom_modules()
+
+        # Call project-class
+        self.pr = Project(self, self.current_project)
+        if p_preset is not None:
+            if p_preset not in self.pr.parameters:
+                raise RuntimeError(f'Parameter-Preset {p_preset} not found in {self.current_project}')
+            self.pr.p_preset = p_preset
+
+    def save_main(self, worker_signals=None):
+        # Save Project
+        self.pr.save()
+        self.settings['current_project'] = self.current_project
+        self.save_settings()
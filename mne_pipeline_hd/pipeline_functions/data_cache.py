@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+A process-wide cache of loaded data with a memory-budget (used by load_decorator/save_decorator)
+
+Functions change loaded data in place (e.g. raw.filter, raw.pick), thus the cache never hands out the data it holds:
+it keeps a copy with read-only arrays and each function gets its own copy in memory (still much faster than reading
+and parsing the files again). MNE-objects don't offer hooks to copy their arrays lazily on the first change,
+thus the copy is made when the data is taken from the cache.
+"""
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .pipeline_utils import _get_existing_path, get_object_entries
+
+
+def get_data_nbytes(data, _seen=None):
+    """Estimate the memory of loaded data from its arrays (e.g. raw._data.nbytes)
+
+    Containers (dictionaries like Forward/Covariance, lists like SourceSpaces) are summed up recursively,
+    other objects without arrays count as 0.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(data) in _seen:
+        return 0
+    _seen.add(id(data))
+
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    elif isinstance(data, dict):
+        return sum([get_data_nbytes(value, _seen) for value in data.values()])
+    elif isinstance(data, (list, tuple)):
+        return sum([get_data_nbytes(item, _seen) for item in data])
+
+    # MNE-objects keep their data in _data (Raw, Epochs, SourceEstimate) or data (Evoked, TFR)
+    for attr_name in ['_data', 'data']:
+        array = getattr(data, attr_name, None)
+        if isinstance(array, np.ndarray):
+            return array.nbytes
+
+    return 0
+
+
+def set_read_only(data, _seen=None):
+    """Make the arrays of data read-only (like in get_data_nbytes), thus changing the cached data raises an error"""
+    if _seen is None:
+        _seen = set()
+    if id(data) in _seen:
+        return
+    _seen.add(id(data))
+
+    if isinstance(data, np.ndarray):
+        data.setflags(write=False)
+    elif isinstance(data, dict):
+        for value in data.values():
+            set_read_only(value, _seen)
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            set_read_only(item, _seen)
+    else:
+        for attr_name in ['_data', 'data']:
+            array = getattr(data, attr_name, None)
+            if isinstance(array, np.ndarray):
+                array.setflags(write=False)
+
+
+def copy_data(data):
+    """Get a copy of data with writable arrays
+
+    Plain containers (e.g. the dictionaries of evokeds per trial) are copied item by item,
+    MNE-objects with their copy-method and other objects with deepcopy.
+    """
+    if isinstance(data, np.ndarray):
+        return data.copy()
+    elif type(data) in [dict, OrderedDict]:
+        return type(data)((key, copy_data(value)) for key, value in data.items())
+    elif type(data) in [list, tuple]:
+        return type(data)(copy_data(item) for item in data)
+    elif callable(getattr(data, 'copy', None)):
+        return data.copy()
+
+    return copy.deepcopy(data)
+
+
+def protect_data(data):
+    """Get a read-only copy of data to be kept in a cache"""
+    data_copy = copy_data(data)
+    set_read_only(data_copy)
+
+    return data_copy
+
+
+def get_cache_key(obj, data_type):
+    """Get the key for data of a data-object (None if a file doesn't exist)
+
+    The key consists of the Parameter-Preset, the paths with their modification-time
+    and the entries of the object in the project, thus data is loaded again from disk after its files were rewritten
+    (e.g. by another process) or after entries changed, which the load-methods apply (e.g. bad-channels, ica_exclude).
+    """
+    try:
+        paths = [p for p in obj._return_path_list(data_type) if p is not None]
+    # Paths may be empty (e.g. when no trials are selected)
+    except IndexError:
+        return None
+    if len(paths) == 0:
+        return None
+    path_times = list()
+    for path in paths:
+        existing_path = _get_existing_path(path)
+        if existing_path is None:
+            return None
+        path_times.append((path, os.stat(existing_path).st_mtime_ns))
+
+    object_entries = json.dumps(get_object_entries(obj), sort_keys=True, default=str)
+
+    return obj.p_preset, object_entries, tuple(path_times)
+
+
+class DataCache:
+    """A least-recently-used cache of loaded data, which is limited by a memory-budget
+
+    Parameters
+    ----------
+    budget : int
+        The maximum memory of the cached data in bytes (0 disables the cache)
+    """
+
+    def __init__(self, budget=0):
+        self.budget = budget
+        self._data = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Data is also loaded from the thread of the Prefetcher
+        self._lock = threading.RLock()
+
+    def set_budget(self, budget):
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def get(self, key):
+        """Get a copy of the data for key (None if it is not cached)"""
+        if key is None or self.budget <= 0:
+            return None
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                cached_data = self._data[key][0]
+            else:
+                self.misses += 1
+                return None
+
+        # Copy outside of the lock, the cached data is read-only anyway
+        return copy_data(cached_data)
+
+    def put(self, key, data, is_protected=False):
+        """Cache a read-only copy of data for key (data, which is bigger than the budget, is not cached)
+
+        Data, which is already a read-only copy (see protect_data), is cached without copying it again.
+        """
+        if key is None or self.budget <= 0:
+            return
+        nbytes = get_data_nbytes(data)
+        if nbytes > self.budget:
+            with self._lock:
+                self.remove(key)
+            return
+        if not is_protected:
+            data = protect_data(data)
+        with self._lock:
+            self.remove(key)
+            self._data[key] = (data, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+
+    def _evict(self):
+        # Remove the least recently used data until the cache fits into the budget
+        while self.nbytes > self.budget and len(self._data) > 0:
+            _, (_, nbytes) = self._data.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def get_stats(self):
+        """Get the hits, misses and evictions and the number and memory (in bytes) of the cached data"""
+        with self._lock:
+            n_requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / n_requests if n_requests else None,
+                    'evictions': self.evictions,
+                    'n_items': len(self._data),
+                    'nbytes': self.nbytes,
+                    'budget': self.budget}
+
+
+# The cache shared by all data-objects of this process
+data_cache = DataCache()
+# The budget (in GB) of a worker-process, which gets a share of the setting "cache_memory" (None to use the setting)
+_worker_cache_memory = None
+
+
+def set_worker_cache_memory(cache_memory):
+    """Set the budget (in GB) of the cache in a worker-process (overrides the setting "cache_memory")"""
+    global _worker_cache_memory
+    _worker_cache_memory = cache_memory
+    if cache_memory is not None:
+        data_cache.set_budget(cache_memory * 1024 ** 3)
+
+
+def get_data_cache(qsettings=None):
+    """Get the cache of this process with the budget from the setting "cache_memory" (in GB)"""
+    if qsettings is not None and _worker_cache_memory is None:
+        data_cache.set_budget(float(qsettings.value('cache_memory', defaultValue=0)) * 1024 ** 3)
+
+    return data_cache
+
+
+def format_cache_stats(stats):
+    hit_rate = f'{stats["hit_rate"]:.0%}' if stats['hit_rate'] is not None else '-'
+    return f'Data-Cache: {stats["hits"]} hits, {stats["misses"]} misses (hit-rate {hit_rate}), ' \
+           f'{stats["evictions"]} evictions, {stats["n_items"]} items with ' \
+           f'{stats["nbytes"] / 1024 ** 2:.0f} of {stats["budget"] / 1024 ** 2:.0f} MB'
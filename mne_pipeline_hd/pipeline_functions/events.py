@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+A machine-readable stream of the events of a run (one JSON-object per line) for external monitoring
+
+The events are "run_start", "step_queued", "step_started", "step_finished", "step_failed", "step_skipped"
+and "run_end". Each event has the time, the project, the Parameter-Preset and the process-id,
+the step-events additionally the object and the function and the end of a step the duration in seconds,
+the peak memory in bytes and a one-line error.
+The events can be followed e.g. with:
+    tail -f <project>/_pipeline_scripts/run_events_<project>.jsonl
+"""
+import json
+import os
+import socket
+import threading
+from datetime import datetime
+from os.path import join
+
+from .pipeline_utils import datetime_format
+
+
+class EventStream:
+    """Write the events of a run to a JSONL-file or send them to a local UDP-socket
+
+    Sending to a socket never blocks the run, the events are just lost if nobody is listening.
+
+    Parameters
+    ----------
+    target : str
+        A file-path, to which the events are appended, or "udp://<host>:<port>"
+    main_win : MainWindow | Controller | None
+        The instance holding the project (adds project and Parameter-Preset to the events)
+    """
+
+    def __init__(self, target, main_win=None):
+        self.target = target
+        self.mw = main_win
+        self.sock = None
+        self.address = None
+        self.disabled = False
+        # Events may be sent from the threads of the GUI and the runners
+        self.lock = threading.Lock()
+
+        if target.startswith('udp://'):
+            host, port = target[len('udp://'):].rsplit(':', 1)
+            self.address = (host, int(port))
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, event, **kwargs):
+        if self.disabled:
+            return
+        entry = {'event': event, 'time': datetime.now().strftime(datetime_format), 'pid': os.getpid()}
+        if self.mw is not None:
+            entry.update({'project': self.mw.pr.name, 'p_preset': self.mw.pr.p_preset})
+        entry.update(kwargs)
+        line = json.dumps(entry, default=str) + '\n'
+
+        with self.lock:
+            try:
+                if self.sock is not None:
+                    self.sock.sendto(line.encode('utf-8'), self.address)
+                else:
+                    with open(self.target, 'a') as file:
+                        file.write(line)
+            # Monitoring should never stop the run
+            except OSError as err:
+                print(f'Events could not be sent to {self.target} and are disabled for this run: {err}')
+                self.disabled = True
+
+    def run_started(self, all_steps):
+        self.emit('run_start', n_steps=len(all_steps))
+        for obj_name, func_name in all_steps:
+            self.emit('step_queued', object=obj_name, function=func_name)
+
+    def step_started(self, object_name, func_name):
+        self.emit('step_started', object=object_name, function=func_name)
+
+    def step_finished(self, result):
+        """Send the result of a step (as returned from StepRunner.run_step)"""
+        status = result.get('status')
+        event = {'failed': 'step_failed', 'skipped': 'step_skipped'}.get(status, 'step_finished')
+        error = result.get('error')
+        self.emit(event, object=result['object'], function=result['function'], status=status,
+                  duration=result.get('duration'), peak_memory=result.get('peak_memory'),
+                  error=str(error).splitlines()[0] if error else None)
+
+    def run_ended(self):
+        self.emit('run_end')
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def get_event_stream(main_win, target=None):
+    """Get the EventStream for the setting "event_stream" (None if it is empty)
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the QSettings
+    target : str | None
+        Override the setting, "file" is replaced with the default path in _pipeline_scripts
+    """
+    if target is None:
+        target = main_win.qsettings.value('event_stream', defaultValue='')
+    if not target:
+        return None
+    if target == 'file':
+        target = join(main_win.pr.pscripts_path, f'run_events_{main_win.pr.name}.jsonl')
+
+    return EventStream(target, main_win)
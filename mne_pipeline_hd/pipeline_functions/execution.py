@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import gc
+import inspect
+import logging
+import sys
+import traceback
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from .artifacts import get_step_key, restore_artifacts, use_artifact_store
+from .loading import BaseLoading, FSMRI, Group, MEEG, fsmri_registry, preload_policy, running_function
+from .pipeline_utils import check_up_to_date, clear_function_analysis, get_function_preload
+from .prefetch import get_next_object_step
+from .profiler import StepProfile
+from .writer import flush_writes
+
+
+class BindingPlan:
+    """Where the arguments of a function come from (compiled once, afterwards only the values are looked up)
+
+    The arguments are taken in this order from the object, the MainWindow/Controller, the project,
+    the attributes of the project, the Parameter-Preset, the settings and the QSettings.
+
+    Parameters
+    ----------
+    func_name : str
+        The name of the function
+    func : function
+        The function
+    """
+    # Arguments, which always come from the same source
+    fixed_sources = {'mw': 'main_win', 'main_win': 'main_win',
+                     'pr': 'project', 'project': 'project',
+                     'meeg': 'object', 'fsmri': 'object', 'group': 'object'}
+
+    def __init__(self, func_name, func):
+        self.func_name = func_name
+        self.func = func
+
+        parameters = inspect.signature(func).parameters
+        self.arg_names = [n for n, p in parameters.items() if p.kind not in [p.VAR_POSITIONAL, p.VAR_KEYWORD]]
+        self.optional_args = [n for n, p in parameters.items() if p.default is not p.empty]
+        self.accepts_kwargs = any([p.kind == p.VAR_KEYWORD for p in parameters.values()])
+
+        # arg_name -> source (compiled for the project and the Parameter-Preset in compiled_for)
+        self.sources = dict()
+        self.compiled_for = None
+
+    def compile(self, main_win):
+        """Get the source for each argument and validate, that no required argument is missing"""
+        project_attributes = vars(main_win.pr)
+        parameters = main_win.pr.parameters[main_win.pr.p_preset]
+        qsettings_keys = main_win.qsettings.childKeys()
+
+        sources = dict()
+        missing = list()
+        for arg_name in self.arg_names:
+            if arg_name in self.fixed_sources:
+                sources[arg_name] = self.fixed_sources[arg_name]
+            elif arg_name in project_attributes:
+                sources[arg_name] = 'project_attribute'
+            elif arg_name in parameters:
+                sources[arg_name] = 'parameter'
+            elif arg_name in main_win.settings:
+                sources[arg_name] = 'setting'
+            elif arg_name in qsettings_keys:
+                sources[arg_name] = 'qsetting'
+            # Arguments with a default-value can be left out
+            elif arg_name not in self.optional_args:
+                missing.append(arg_name)
+
+        if len(missing) > 0:
+            raise RuntimeError(f'{missing} for {self.func_name} could not be found in Subject, Project or Parameters')
+
+        self.sources = sources
+        self.compiled_for = (main_win.pr, main_win.pr.p_preset)
+
+    def get_value(self, arg_name, obj, main_win):
+        source = self.sources[arg_name]
+        if source == 'object':
+            return obj
+        elif source == 'main_win':
+            return main_win
+        elif source == 'project':
+            return main_win.pr
+        elif source == 'project_attribute':
+            return vars(main_win.pr)[arg_name]
+        elif source == 'parameter':
+            return main_win.pr.parameters[main_win.pr.p_preset][arg_name]
+        elif source == 'setting':
+            return main_win.settings[arg_name]
+        else:
+            return main_win.qsettings.value(arg_name)
+
+    def bind(self, obj, main_win, overrides=None):
+        """Get the keyword-arguments for calling the function with obj
+
+        Values in overrides replace the values from the sources for arguments of the function (e.g. n_jobs).
+        """
+        if self.compiled_for != (main_win.pr, main_win.pr.p_preset):
+            self.compile(main_win)
+        try:
+            keyword_arguments = {arg_name: self.get_value(arg_name, obj, main_win) for arg_name in self.sources}
+        # e.g. a parameter was removed since compiling
+        except KeyError:
+            self.compile(main_win)
+            keyword_arguments = {arg_name: self.get_value(arg_name, obj, main_win) for arg_name in self.sources}
+
+        # Add additional keyword-arguments if added for function by user
+        for kwarg, value in main_win.pr.add_kwargs.get(self.func_name, dict()).items():
+            if kwarg in self.arg_names or self.accepts_kwargs:
+                keyword_arguments[kwarg] = value
+            else:
+                logging.warning(f'Ignored unexpected keyword \"{kwarg}\" for {self.func_name}')
+
+        if overrides is not None:
+            keyword_arguments.update({k: v for k, v in overrides.items() if k in self.arg_names})
+
+        return keyword_arguments
+
+
+def get_function_module(func_name, main_win):
+    # Get module- and package-name, has to specified in pd_funcs
+    # (which imports from functions.csv or the <custom_package>.csv)
+    pkg_name = main_win.pd_funcs.loc[func_name, 'pkg_name']
+    module_name = main_win.pd_funcs.loc[func_name, 'module']
+
+    return main_win.all_modules[pkg_name][module_name][0]
+
+
+def get_binding_plan(func_name, main_win, module=None):
+    """Get the BindingPlan for a function (a new one is made if the function was reloaded meanwhile)"""
+    if module is None:
+        module = get_function_module(func_name, main_win)
+    func = getattr(module, func_name)
+    plan = main_win.binding_plans.get(func_name)
+    if plan is None or plan.func is not func:
+        plan = BindingPlan(func_name, func)
+        main_win.binding_plans[func_name] = plan
+
+    return plan
+
+
+def make_binding_plans(main_win):
+    """Make the BindingPlans for all functions (after the modules were loaded or reloaded)"""
+    main_win.binding_plans = dict()
+    clear_function_analysis()
+    for func_name in main_win.pd_funcs.index:
+        try:
+            get_binding_plan(func_name, main_win)
+        except (KeyError, AttributeError):
+            logging.warning(f'{func_name} was not found in its module')
+
+
+def validate_binding_plans(func_names, main_win):
+    """Check the arguments of the functions before a run
+
+    Returns
+    -------
+    errors : dict
+        The error-message for each function, which can't be called
+    """
+    errors = dict()
+    for func_name in set(func_names):
+        try:
+            get_binding_plan(func_name, main_win).compile(main_win)
+        except Exception as err:
+            errors[func_name] = str(err)
+
+    return errors
+
+
+def get_arguments(func_name, module, obj, main_win, overrides=None):
+    return get_binding_plan(func_name, main_win, module).bind(obj, main_win, overrides)
+
+
+def func_from_def(func_name, obj, main_win, overrides=None):
+    plan = get_binding_plan(func_name, main_win)
+    # Call Function from specified module with arguments from the BindingPlan
+    with preload_policy(get_function_preload(func_name, main_win)), running_function(func_name):
+        plan.func(**plan.bind(obj, main_win, overrides))
+
+
+def limit_threads(n_threads):
+    """Limit the threads of BLAS- and OpenMP-libraries (e.g. when steps run in parallel processes)
+
+    Returns a context-manager, which doesn't limit anything if n_threads is None
+    or threadpoolctl (which is installed with scikit-learn) is not installed.
+    """
+    if n_threads is None:
+        return nullcontext()
+    try:
+        from threadpoolctl import threadpool_limits
+    except ModuleNotFoundError:
+        return nullcontext()
+
+    return threadpool_limits(limits=n_threads)
+
+
+def get_run_steps(main_win):
+    """Expand the selected functions and objects of the current project into steps
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+
+    Returns
+    -------
+    all_objects : OrderedDict
+        Every object paired with its type, its functions and a status (1 means pending)
+    all_steps : list
+        A list of tuples (object_name, function_name) in the order of execution
+    """
+    all_objects = OrderedDict()
+    all_steps = list()
+
+    # Make sure, every function is in sel_functions
+    for func in [f for f in main_win.pd_funcs.index if f not in main_win.pr.sel_functions]:
+        main_win.pr.sel_functions[func] = 0
+
+    # Lists of selected functions divided into object-types (MEEG, FSMRI, ...)
+    sel_fsmri_funcs = [mf for mf in main_win.fsmri_funcs.index if main_win.pr.sel_functions[mf]]
+    sel_meeg_funcs = [ff for ff in main_win.meeg_funcs.index if main_win.pr.sel_functions[ff]]
+    sel_group_funcs = [gf for gf in main_win.group_funcs.index if main_win.pr.sel_functions[gf]]
+    sel_other_funcs = [of for of in main_win.other_funcs.index if main_win.pr.sel_functions[of]]
+
+    # Get a dict with all objects paired with their functions and their type-definition
+    # Give all objects and functions in all_objects the status 1 (which means pending)
+    for obj_type, sel_objects, sel_funcs in [('FSMRI', main_win.pr.sel_fsmri, sel_fsmri_funcs),
+                                             ('MEEG', main_win.pr.sel_meeg, sel_meeg_funcs),
+                                             ('Group', main_win.pr.sel_groups, sel_group_funcs)]:
+        if len(sel_objects) * len(sel_funcs) != 0:
+            for obj_name in sel_objects:
+                all_objects[obj_name] = {'type': obj_type,
+                                         'functions': {x: 1 for x in sel_funcs},
+                                         'status': 1}
+                for func in sel_funcs:
+                    all_steps.append((obj_name, func))
+
+    if len(sel_other_funcs) != 0:
+        # blank object-name for other functions
+        all_objects[''] = {'type': 'Other',
+                           'functions': {x: 1 for x in sel_other_funcs},
+                           'status': 1}
+        for other_func in sel_other_funcs:
+            all_steps.append(('', other_func))
+
+    return all_objects, all_steps
+
+
+def split_plot_steps(main_win, all_steps):
+    """Separate the steps of plot-functions (marked with matplotlib or mayavi in functions.csv)
+
+    The plots can then be rendered off-screen in parallel processes after the other steps (see ParallelRunner).
+
+    Returns
+    -------
+    other_steps : list
+        The steps, which don't plot (in their order)
+    plot_steps : list
+        The steps of the plot-functions (in their order)
+    """
+    other_steps = list()
+    plot_steps = list()
+    for obj_name, func_name in all_steps:
+        func_info = main_win.pd_funcs.loc[func_name]
+        # Steps without object ("Other") always run in the main-process
+        if obj_name != '' and (func_info['matplotlib'] or func_info['mayavi']):
+            plot_steps.append((obj_name, func_name))
+        else:
+            other_steps.append((obj_name, func_name))
+
+    return other_steps, plot_steps
+
+
+def summarize_results(results):
+    """Get a machine-readable summary of successes and failures from the results of StepRunner.run_step"""
+    finished = [r for r in results if r['status'] == 'finished']
+    failed = [r for r in results if r['status'] == 'failed']
+    skipped = [r for r in results if r['status'] == 'skipped']
+
+    return {'n_steps': len(results),
+            'n_finished': len(finished),
+            'n_failed': len(failed),
+            'n_skipped': len(skipped),
+            'steps': results}
+
+
+def skip_step(func_name, obj, main_win):
+    """Check if a step can be skipped, because its outputs are up to date (with the setting "skip_up_to_date")
+    or can be linked from the artifact-store (with the setting "artifact_store")
+
+    Returns
+    -------
+    skip : bool
+        True, if the step can be skipped
+    reason : str
+        A description of the outcome
+    """
+    if isinstance(obj, BaseLoading):
+        obj.step_key = None
+    skip_up_to_date = main_win.get_setting('skip_up_to_date')
+    use_store = isinstance(obj, BaseLoading) and use_artifact_store(obj)
+    if not isinstance(obj, (MEEG, FSMRI, Group)) or not (skip_up_to_date or use_store):
+        return False, ''
+    # The checks need the files and their parameters of data, which is still saved in the background
+    flush_writes()
+
+    reason = ''
+    if skip_up_to_date:
+        try:
+            skip, reason = check_up_to_date(obj, func_name)
+        # Rather run the function than to skip it wrongly
+        except Exception as err:
+            skip, reason = False, f'up-to-date-check failed: {err}'
+        if skip:
+            return True, reason
+
+    if use_store:
+        try:
+            step_key = get_step_key(obj, func_name)
+            if step_key is not None:
+                if not main_win.get_setting('overwrite'):
+                    restored, reason = restore_artifacts(obj, func_name, step_key)
+                    if restored:
+                        return True, reason
+                # The files saved by the function are stored under this key
+                obj.step_key = step_key
+        except Exception as err:
+            reason = f'artifact-store failed: {err}'
+
+    return False, reason
+
+
+def get_exception_summary():
+    """Get type, value and traceback of the current exception without depending on Qt"""
+    exctype, value = sys.exc_info()[:2]
+    traceback_str = traceback.format_exc(limit=-10)
+    logging.error(f'{exctype}: {value}\n'
+                  f'{traceback_str}')
+
+    return exctype, value, traceback_str
+
+
+def close_plots():
+    """Close all open figures (mayavi is optional and may not be installed on headless machines)"""
+    import matplotlib.pyplot as plt
+    plt.close('all')
+    try:
+        from mayavi import mlab
+    except ModuleNotFoundError:
+        pass
+    else:
+        mlab.close(all=True)
+
+
+class StepRunner:
+    """Run the steps from get_run_steps sequentially without any GUI
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    all_objects : OrderedDict
+        The objects as returned from get_run_steps
+    all_steps : list
+        The steps as returned from get_run_steps
+    journal : RunJournal | None
+        Record the start and the result of each step in this journal
+    n_cores : int | None
+        The cores each step may use (passed as n_jobs and used as limit for BLAS-threads).
+        If None, n_jobs is taken from the QSettings and BLAS-threads are not limited.
+    prefetcher : Prefetcher | None
+        Load the data of the next object with this Prefetcher while a step runs
+    cpu_clock : str
+        The clock for the CPU-time of the steps ("process" if the steps own the process, see StepProfile)
+    """
+
+    def __init__(self, main_win, all_objects, all_steps, journal=None, n_cores=None, prefetcher=None,
+                 cpu_clock='thread'):
+        self.mw = main_win
+        self.all_objects = all_objects
+        self.all_steps = list(all_steps)
+        self.journal = journal
+        self.n_cores = n_cores
+        self.prefetcher = prefetcher
+        self.cpu_clock = cpu_clock
+
+        self.current_object = None
+        self.results = list()
+
+    def load_object(self, object_name):
+        """Initialize the data-object for object_name (FSMRI-objects are shared, see FSMRIRegistry)"""
+        obj_type = self.all_objects[object_name]['type']
+        prefetched_object = self.prefetcher.get_object(object_name) if self.prefetcher else None
+
+        if prefetched_object is not None:
+            obj = prefetched_object
+
+        elif obj_type == 'FSMRI':
+            obj = fsmri_registry.get(object_name, self.mw)
+
+        elif obj_type == 'MEEG':
+            obj = MEEG(object_name, self.mw)
+
+        elif obj_type == 'Group':
+            obj = Group(object_name, self.mw)
+
+        else:
+            obj = BaseLoading(object_name, self.mw)
+
+        return obj
+
+    def run_step(self, object_name, func_name):
+        """Run a single step and return a dictionary describing the outcome"""
+        if not self.current_object or self.current_object.name != object_name:
+            print(f'\n{"=" * 60}\n{object_name}\n{"=" * 60}')
+            self.current_object = self.load_object(object_name)
+
+        print(f'{"-" * 60}\n{func_name}')
+        if self.journal is not None:
+            self.journal.step_started(object_name, func_name)
+        result = {'object': object_name, 'function': func_name}
+        if self.prefetcher is not None:
+            self.start_prefetch()
+        skip, reason = skip_step(func_name, self.current_object, self.mw)
+        profile = StepProfile(self.cpu_clock)
+        try:
+            if skip:
+                print(f'Skipped: {reason}')
+            else:
+                overrides = {'n_jobs': self.n_cores} if self.n_cores else None
+                with profile, limit_threads(self.n_cores):
+                    func_from_def(func_name, self.current_object, self.mw, overrides)
+        except Exception:
+            exctype, value, traceback_str = get_exception_summary()
+            result['status'] = 'failed'
+            result['error'] = f'{exctype.__name__}: {value}'
+            result['traceback'] = traceback_str
+        else:
+            result['status'] = 'skipped' if skip else 'finished'
+        # Wall-time, CPU-time, memory and IO of the function
+        result.update(profile.get_result())
+        # Mark function as done (like in the RunDialog also when it failed)
+        self.all_objects[object_name]['functions'][func_name] = 0
+        if self.prefetcher is not None:
+            self.prefetcher.release(object_name, func_name)
+
+        # Close all plots (they can't be shown anyway) and collect garbage to free memory
+        close_plots()
+        gc.collect()
+
+        self.results.append(result)
+        if self.journal is not None:
+            self.journal.step_finished(result)
+
+        return result
+
+    def start_prefetch(self):
+        """Start loading the data of the next object while the current step runs"""
+        next_step = get_next_object_step(self.all_steps, self.current_object.name)
+        if next_step is None:
+            return
+        obj_name, func_name = next_step
+        try:
+            self.prefetcher.prefetch(obj_name, self.all_objects[obj_name]['type'], func_name)
+        except Exception as err:
+            print(f'Prefetching for {obj_name} failed: {err}')
+
+    def run(self):
+        """Run all steps and return a summary"""
+        while len(self.all_steps) > 0:
+            object_name, func_name = self.all_steps.pop(0)
+            self.run_step(object_name, func_name)
+        # Data saved in the background has to be written before the run ends (or the process exits)
+        write_errors = flush_writes()
+
+        summary = self.get_summary()
+        if len(write_errors) > 0:
+            summary['write_errors'] = write_errors
+
+        return summary
+
+    def get_summary(self):
+        """Get a machine-readable summary of successes and failures"""
+        return summarize_results(self.results)
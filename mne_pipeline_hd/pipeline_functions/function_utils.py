@@ -10,103 +10,31 @@ Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.201
 inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
 """
 import gc
-import inspect
-import logging
-import re
 from collections import OrderedDict
+from functools import partial
+from os.path import join
 
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import (QDialog, QGridLayout, QHBoxLayout, QLabel, QListView, QProgressBar,
+from PyQt5.QtWidgets import (QDialog, QGridLayout, QHBoxLayout, QLabel, QListView, QMessageBox, QProgressBar,
                              QPushButton, QSizePolicy, QStyle, QVBoxLayout)
 
-from mne_pipeline_hd.pipeline_functions.loading import BaseLoading, FSMRI, Group, MEEG
+from mne_pipeline_hd.pipeline_functions.loading import BaseLoading, Group, MEEG, fsmri_registry
+from .data_cache import format_cache_stats, get_data_cache
+from .execution import func_from_def, get_run_steps, skip_step, split_plot_steps, validate_binding_plans
+from .journal import RunJournal, get_resume_steps
+from .parallel import ParallelRunner
 from .pipeline_utils import shutdown
+from .prefetch import Prefetcher, get_next_object_step
+from .profiler import RunReport, StepProfile
+from .scheduler import DAGRunner
+from .writer import flush_writes
 from ..basic_functions.plot import close_all
 from ..gui.base_widgets import SimpleList
 from ..gui.gui_utils import ConsoleWidget, Worker, get_exception_tuple, set_ratio_geometry
 from ..gui.models import RunModel
 
 
-def get_arguments(func_name, module, obj, main_win):
-    keyword_arguments = {}
-    project_attributes = vars(main_win.pr)
-
-    # Get arguments from function signature
-    func = getattr(module, func_name)
-    arg_names = list(inspect.signature(func).parameters)
-
-    # Remove args/kwargs
-    if 'args' in arg_names:
-        arg_names.remove('args')
-    if 'kwargs' in arg_names:
-        arg_names.remove('kwargs')
-
-    # Get the values for parameter-names
-    for arg_name in arg_names:
-        if arg_name == 'mw':
-            keyword_arguments.update({'mw': main_win})
-        elif arg_name == 'main_win':
-            keyword_arguments.update({'main_win': main_win})
-        elif arg_name == 'pr':
-            keyword_arguments.update({'pr': main_win.pr})
-        elif arg_name == 'project':
-            keyword_arguments.update({'project': main_win.pr})
-        elif arg_name == 'meeg':
-            keyword_arguments.update({'meeg': obj})
-        elif arg_name == 'fsmri':
-            keyword_arguments.update({'fsmri': obj})
-        elif arg_name == 'group':
-            keyword_arguments.update({'group': obj})
-        elif arg_name in project_attributes:
-            keyword_arguments.update({arg_name: project_attributes[arg_name]})
-        elif arg_name in main_win.pr.parameters[main_win.pr.p_preset]:
-            keyword_arguments.update({arg_name: main_win.pr.parameters[main_win.pr.p_preset][arg_name]})
-        elif arg_name in main_win.settings:
-            keyword_arguments.update({arg_name: main_win.settings[arg_name]})
-        elif arg_name in main_win.qsettings.childKeys():
-            keyword_arguments.update({arg_name: main_win.qsettings.value(arg_name)})
-        else:
-            raise RuntimeError(f'{arg_name} could not be found in Subject, Project or Parameters')
-
-    # Add additional keyword-arguments if added for function by user
-    if func_name in main_win.pr.add_kwargs:
-        for kwarg in main_win.pr.add_kwargs[func_name]:
-            keyword_arguments[kwarg] = main_win.pr.add_kwargs[func_name][kwarg]
-
-    return keyword_arguments
-
-
-def func_from_def(func_name, obj, main_win):
-    # Get module- and package-name, has to specified in pd_funcs
-    # (which imports from functions.csv or the <custom_package>.csv)
-    pkg_name = main_win.pd_funcs.loc[func_name, 'pkg_name']
-    module_name = main_win.pd_funcs.loc[func_name, 'module']
-    module = main_win.all_modules[pkg_name][module_name][0]
-
-    keyword_arguments = get_arguments(func_name, module, obj, main_win)
-
-    # Catch one error due to unexpected or missing keywords
-    unexp_kw_pattern = r"(.*) got an unexpected keyword argument \'(.*)\'"
-    miss_kw_pattern = r"(.*) missing 1 required positional argument: \'(.*)\'"
-    try:
-        # Call Function from specified module with arguments from unpacked list/dictionary
-        getattr(module, func_name)(**keyword_arguments)
-    except TypeError as te:
-        match_unexp_kw = re.match(unexp_kw_pattern, str(te))
-        match_miss_kw = re.match(miss_kw_pattern, str(te))
-        if match_unexp_kw:
-            keyword_arguments.pop(match_unexp_kw.group(2))
-            logging.warning(f'Caught unexpected keyword \"{match_unexp_kw.group(2)}\" for {func_name}')
-            getattr(module, func_name)(**keyword_arguments)
-        elif match_miss_kw:
-            add_kw_args = get_arguments([match_miss_kw.group(2)], module, obj, main_win)
-            keyword_arguments.update(add_kw_args)
-            logging.warning(f'Caught missing keyword \"{match_miss_kw.group(2)}\" for {func_name}')
-            getattr(module, func_name)(**keyword_arguments)
-        else:
-            raise te
-
-
 class RunDialog(QDialog):
     def __init__(self, main_win):
         super().__init__(main_win)
@@ -115,8 +43,20 @@ class RunDialog(QDialog):
         # Initialize Attributes
         self.init_attributes()
 
-        self.init_lists()
+        # Record the progress to be able to resume after a crash
+        self.journal = RunJournal(self.mw)
+        resume = False
+        if self.journal.is_interrupted():
+            remaining_steps, p_preset = self.journal.get_remaining_steps()
+            answer = QMessageBox.question(self, 'Resume interrupted Run?',
+                                          f'The last run was interrupted with {len(remaining_steps)} steps remaining '
+                                          f'(Parameter-Preset: {p_preset}).\n'
+                                          f'Do you want to resume it instead of starting the selected functions?')
+            resume = answer == QMessageBox.Yes
+
+        self.init_lists(resume)
         self.init_ui()
+        self.check_functions()
 
         set_ratio_geometry(0.6, self)
         self.show()
@@ -126,13 +66,19 @@ class RunDialog(QDialog):
     def init_attributes(self):
         # Initialize class-attributes (in method to be repeatable by self.restart)
         self.all_steps = list()
+        # The steps of plot-functions, which are rendered in parallel processes after all other steps
+        self.plot_steps = list()
         self.thread_idx_count = 0
         self.all_objects = OrderedDict()
         self.current_all_funcs = dict()
         self.current_step = None
         self.current_object = None
-        self.loaded_fsmri = None
         self.current_func = None
+        self.step_profile = None
+        self.step_status = None
+        self.step_error = None
+        # The results of the steps for the run-report
+        self.results = list()
 
         self.errors = dict()
         self.error_count = 0
@@ -140,50 +86,36 @@ class RunDialog(QDialog):
         self.is_prog_text = False
         self.paused = False
 
-    def init_lists(self):
-        # Make sure, every function is in sel_functions
-        for func in [f for f in self.mw.pd_funcs.index if f not in self.mw.pr.sel_functions]:
-            self.mw.pr.sel_functions[func] = 0
-
-        # Lists of selected functions divided into object-types (MEEG, FSMRI, ...)
-        self.sel_fsmri_funcs = [mf for mf in self.mw.fsmri_funcs.index if self.mw.pr.sel_functions[mf]]
-        self.sel_meeg_funcs = [ff for ff in self.mw.meeg_funcs.index if self.mw.pr.sel_functions[ff]]
-        self.sel_group_funcs = [gf for gf in self.mw.group_funcs.index if self.mw.pr.sel_functions[gf]]
-        self.sel_other_funcs = [of for of in self.mw.other_funcs.index if self.mw.pr.sel_functions[of]]
-
-        # Get a dict with all objects paired with their functions and their type-definition
-        # Give all objects and functions in all_objects the status 1 (which means pending)
-        if len(self.mw.pr.sel_fsmri) * len(self.sel_fsmri_funcs) != 0:
-            for fsmri in self.mw.pr.sel_fsmri:
-                self.all_objects[fsmri] = {'type': 'FSMRI',
-                                           'functions': {x: 1 for x in self.sel_fsmri_funcs},
-                                           'status': 1}
-                for fsmri_func in self.sel_fsmri_funcs:
-                    self.all_steps.append((fsmri, fsmri_func))
-
-        if len(self.mw.pr.sel_meeg) * len(self.sel_meeg_funcs) != 0:
-            for meeg in self.mw.pr.sel_meeg:
-                self.all_objects[meeg] = {'type': 'MEEG',
-                                          'functions': {x: 1 for x in self.sel_meeg_funcs},
-                                          'status': 1}
-                for meeg_func in self.sel_meeg_funcs:
-                    self.all_steps.append((meeg, meeg_func))
-
-        if len(self.mw.pr.sel_groups) * len(self.sel_group_funcs) != 0:
-            for group in self.mw.pr.sel_groups:
-                self.all_objects[group] = {'type': 'Group',
-                                           'functions': {x: 1 for x in self.sel_group_funcs},
-                                           'status': 1}
-                for group_func in self.sel_group_funcs:
-                    self.all_steps.append((group, group_func))
-
-        if len(self.sel_other_funcs) != 0:
-            # blank object-name for other functions
-            self.all_objects[''] = {'type': 'Other',
-                                    'functions': {x: 1 for x in self.sel_other_funcs},
-                                    'status': 1}
-            for other_func in self.sel_other_funcs:
-                self.all_steps.append(('', other_func))
+    def init_lists(self, resume=False):
+        if resume:
+            remaining_steps, p_preset = self.journal.get_remaining_steps()
+            # Resume with the Parameter-Preset of the interrupted run
+            if p_preset in self.mw.pr.parameters:
+                if p_preset != self.mw.pr.p_preset:
+                    self.mw.pr.p_preset = p_preset
+                    if hasattr(self.mw, 'parameters_dock'):
+                        self.mw.parameters_dock.update_ppreset_cmbx()
+                        self.mw.parameters_dock.update_all_param_guis()
+            elif p_preset is not None:
+                QMessageBox.warning(self, 'Parameter-Preset not found',
+                                    f'The Parameter-Preset "{p_preset}" of the interrupted run doesn\'t exist anymore, '
+                                    f'the remaining steps run with "{self.mw.pr.p_preset}".')
+            self.all_objects, self.all_steps = get_resume_steps(self.mw, remaining_steps)
+        else:
+            self.all_objects, self.all_steps = get_run_steps(self.mw)
+        self.journal.start_run(self.all_steps)
+        # Drop the FSMRI-objects and the cached data of previous runs
+        fsmri_registry.clear()
+        get_data_cache().clear()
+
+        # Interactive plots can only be shown from the main-process
+        self.plot_processes = int(self.mw.qsettings.value('plot_processes', defaultValue=0))
+        if self.plot_processes > 0 and not self.mw.get_setting('show_plots'):
+            self.all_steps, self.plot_steps = split_plot_steps(self.mw, self.all_steps)
+
+        # Load the data of the next object in the background (the memory-cap is set in GB)
+        prefetch_memory = float(self.mw.qsettings.value('prefetch_memory', defaultValue=0)) * 1024 ** 3
+        self.prefetcher = Prefetcher(self.mw, prefetch_memory) if prefetch_memory > 0 else None
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -212,12 +144,13 @@ class RunDialog(QDialog):
 
         layout.addLayout(view_layout)
 
-        self.console_widget = ConsoleWidget()
+        # The complete output is logged to a rotating file, the console only keeps the latest output
+        self.console_widget = ConsoleWidget(log_path=join(self.mw.pr.pscripts_path, f'console_{self.mw.pr.name}.log'))
         layout.addWidget(self.console_widget)
 
         self.pgbar = QProgressBar()
         self.pgbar.setValue(0)
-        self.pgbar.setMaximum(len(self.all_steps))
+        self.pgbar.setMaximum(len(self.all_steps) + len(self.plot_steps))
         layout.addWidget(self.pgbar)
 
         bt_layout = QHBoxLayout()
@@ -256,6 +189,12 @@ class RunDialog(QDialog):
 
         self.setLayout(layout)
 
+    def check_functions(self):
+        """Show functions, whose arguments can't be bound, before the run starts"""
+        errors = validate_binding_plans([s[1] for s in self.all_steps], self.mw)
+        for func_name, error in errors.items():
+            self.console_widget.add_html(f'<i>{func_name} will fail: {error}</i><br>')
+
     def mark_current_items(self, status):
         # Mark current object with status
         self.all_objects[self.current_object.name]['status'] = status
@@ -282,8 +221,12 @@ class RunDialog(QDialog):
         self.restart_bt.setEnabled(False)
         self.close_bt.setEnabled(False)
 
+        n_processes = int(self.mw.qsettings.value('n_processes', defaultValue=1))
+        if len(self.all_steps) > 0 and n_processes > 1:
+            self.start_parallel(n_processes)
+
         # Take first step of all_steps until there are no steps left
-        if len(self.all_steps) > 0:
+        elif len(self.all_steps) > 0:
             # Getting information as encoded in init_lists
             self.current_step = self.all_steps.pop(0)
             object_name = self.current_step[0]
@@ -294,19 +237,16 @@ class RunDialog(QDialog):
                 # Print Headline for object
                 self.console_widget.add_html(f'<br><h1>{object_name}</h1><br>')
 
-                if self.current_type == 'FSMRI':
-                    self.current_object = FSMRI(object_name, self.mw)
-                    self.loaded_fsmri = self.current_object
+                prefetched_object = self.prefetcher.get_object(object_name) if self.prefetcher else None
+                if prefetched_object is not None:
+                    self.current_object = prefetched_object
+
+                # The same FSMRI-object is shared by all MEEG-objects with this MRI-Subject (see FSMRIRegistry)
+                elif self.current_type == 'FSMRI':
+                    self.current_object = fsmri_registry.get(object_name, self.mw)
 
                 elif self.current_type == 'MEEG':
-                    # Avoid reloading of same MRI-Subject for multiple files (with the same MRI-Subject)
-                    if object_name in self.mw.pr.meeg_to_fsmri \
-                            and self.loaded_fsmri \
-                            and self.loaded_fsmri.name == self.mw.pr.meeg_to_fsmri[object_name]:
-                        self.current_object = MEEG(object_name, self.mw, fsmri=self.loaded_fsmri)
-                    else:
-                        self.current_object = MEEG(object_name, self.mw)
-                    self.loaded_fsmri = self.current_object.fsmri
+                    self.current_object = MEEG(object_name, self.mw)
 
                 elif self.current_type == 'Group':
                     self.current_object = Group(object_name, self.mw)
@@ -327,25 +267,47 @@ class RunDialog(QDialog):
             # Print Headline for function
             self.console_widget.add_html(f'<h2>{self.current_func}</h2><br>')
 
-            if (self.mw.pd_funcs.loc[self.current_func, 'mayavi']
+            self.journal.step_started(object_name, self.current_func)
+            # The Worker-thread shares the process with the GUI
+            self.step_profile = StepProfile(cpu_clock='thread')
+            self.step_status = 'finished'
+            self.step_error = None
+
+            skip, reason = skip_step(self.current_func, self.current_object, self.mw)
+            if skip:
+                self.console_widget.add_html(f'<i>Skipped: {reason}</i><br>')
+                self.step_status = 'skipped'
+                # Return to the event-loop first to avoid a deep recursion when many steps are skipped
+                QTimer.singleShot(0, partial(self.thread_finished, None))
+
+            elif (self.mw.pd_funcs.loc[self.current_func, 'mayavi']
                     or self.mw.pd_funcs.loc[self.current_func, 'matplotlib'] and self.mw.get_setting('show_plots')):
                 # Plot functions with interactive plots currently can't run in a separate thread
                 try:
-                    func_from_def(self.current_func, self.current_object, self.mw)
+                    self.step_profile.run(func_from_def, self.current_func, self.current_object, self.mw)
                 except:
                     exc_tuple = get_exception_tuple()
                     self.thread_error(exc_tuple)
                 else:
                     self.thread_finished(None)
             else:
-                self.fworker = Worker(function=func_from_def,
+                self.fworker = Worker(self.step_profile.run, func_from_def,
                                       func_name=self.current_func, obj=self.current_object, main_win=self.mw)
                 self.fworker.signals.error.connect(self.thread_error)
                 self.fworker.signals.finished.connect(self.thread_finished)
                 self.mw.threadpool.start(self.fworker)
+                self.start_prefetch()
+
+        elif len(self.plot_steps) > 0:
+            # The plot-processes load the data from disk
+            self.wait_for_writes()
+            self.start_plot_rendering()
 
         else:
+            self.wait_for_writes()
             self.console_widget.add_html('<b><big>Finished</big></b><br>')
+            self.journal.end_run()
+            self.show_report()
             # Enable/Disable Buttons
             self.continue_bt.setEnabled(False)
             self.pause_bt.setEnabled(False)
@@ -356,10 +318,116 @@ class RunDialog(QDialog):
                 self.mw.save_main()
                 shutdown()
 
+    def start_prefetch(self):
+        """Start loading the data of the next object while the current function runs"""
+        next_step = get_next_object_step(self.all_steps, self.current_object.name)
+        if self.prefetcher is None or next_step is None:
+            return
+        obj_name, func_name = next_step
+        try:
+            self.prefetcher.prefetch(obj_name, self.all_objects[obj_name]['type'], func_name)
+        except Exception as err:
+            self.console_widget.add_html(f'<i>Prefetching for {obj_name} failed: {err}</i><br>')
+
+    def start_parallel(self, n_processes):
+        """Run all remaining steps with independent objects in parallel processes"""
+        step_objects = list(OrderedDict.fromkeys([s[0] for s in self.all_steps]))
+        self.console_widget.add_html(f'<br><h1>Running {len(step_objects)} objects '
+                                     f'in {n_processes} processes</h1><br>')
+        # Pausing is not possible while the processes are running
+        self.pause_bt.setEnabled(False)
+        for obj_name in step_objects:
+            self.all_objects[obj_name]['status'] = 2
+        self.object_model.layoutChanged.emit()
+
+        # The Memory-Budget is set in GB
+        memory_budget = float(self.mw.qsettings.value('memory_budget', defaultValue=0)) * 1024 ** 3 or None
+        if self.mw.get_setting('dependency_graph'):
+            self.prunner = DAGRunner(self.mw, self.all_objects, self.all_steps, n_processes,
+                                     journal=self.journal, memory_budget=memory_budget)
+        else:
+            self.prunner = ParallelRunner(self.mw, self.all_objects, self.all_steps, n_processes,
+                                          journal=self.journal, memory_budget=memory_budget)
+        # All steps are handled by the ParallelRunner
+        self.all_steps = list()
+        self.fworker = Worker(function=self.prunner.run)
+        # Add the steps, which finished before (e.g. before the plots are rendered)
+        self.fworker.signals.pgbar_n.connect(lambda n: self.pgbar.setValue(self.prog_count + n))
+        self.fworker.signals.pgbar_text.connect(lambda text: self.console_widget.add_html(f'{text}<br>'))
+        self.fworker.signals.finished.connect(self.parallel_finished)
+        self.fworker.signals.error.connect(self.parallel_error)
+        self.mw.threadpool.start(self.fworker)
+
+    def wait_for_writes(self):
+        """Wait for the data, which is still saved in the background (with the setting "async_save")"""
+        self.add_write_errors(flush_writes())
+
+    def add_write_errors(self, write_errors):
+        for err in write_errors:
+            self.errors[f'{self.error_count}: Saving'] = ((RuntimeError, err, ''), self.error_count)
+            self.console_widget.add_html(f'<a name=\"{self.error_count}\" href={self.error_count}>'
+                                         f'<i>Error No.{self.error_count}: {err}</i><br></a>')
+            self.error_count += 1
+        self.error_widget.replace_data(list(self.errors.keys()))
+
+    def start_plot_rendering(self):
+        """Render the plots off-screen in parallel processes after all other steps finished"""
+        self.console_widget.add_html('<br><h1>Rendering Plots</h1><br>')
+        self.all_steps = self.plot_steps
+        self.plot_steps = list()
+        self.start_parallel(self.plot_processes)
+
+    def parallel_finished(self, summary):
+        self.results += summary['steps']
+        self.prog_count += summary['n_steps']
+        self.pgbar.setValue(self.prog_count)
+        for result in [r for r in summary['steps'] if r['status'] == 'failed']:
+            error_cause = f'{self.error_count}: {result["object"]} <- {result["function"]}'
+            self.errors[error_cause] = ((None, result['error'], result['traceback']), self.error_count)
+            self.console_widget.add_html(f'<a name=\"{self.error_count}\" href={self.error_count}>'
+                                         f'<i>Error No.{self.error_count}: {result["error"]}</i><br></a>')
+            self.error_count += 1
+        # Errors of data saved in the background by the processes
+        self.add_write_errors(summary.get('write_errors', list()))
+        self.object_model.layoutChanged.emit()
+        self.func_model.layoutChanged.emit()
+
+        # Finish the run
+        self.start_thread()
+
+    def show_report(self):
+        """Save the run-report and show the summary per function"""
+        if len(self.results) == 0:
+            return
+        report = RunReport(self.results)
+        try:
+            report_path = report.save(self.mw)
+        except OSError as err:
+            self.console_widget.add_html(f'<i>Run-Report could not be saved: {err}</i><br>')
+        else:
+            self.console_widget.add_html(f'Run-Report saved to {report_path}<br>')
+        self.console_widget.add_html(f'<pre>{report.get_table()}</pre>')
+        self.console_widget.add_html(f'{format_cache_stats(get_data_cache().get_stats())}<br>')
+
+    def parallel_error(self, err):
+        self.errors[f'{self.error_count}: Parallel-Run'] = (err, self.error_count)
+        self.error_widget.replace_data(list(self.errors.keys()))
+        self.console_widget.add_html(f'<a name=\"{self.error_count}\" href={self.error_count}>'
+                                     f'<i>Error No.{self.error_count}: {err[1]}</i><br></a>')
+        self.error_count += 1
+        self.start_thread()
+
     def thread_finished(self, _):
         self.prog_count += 1
         self.pgbar.setValue(self.prog_count)
         self.mark_current_items(0)
+        if self.prefetcher is not None:
+            self.prefetcher.release(self.current_object.name, self.current_func)
+        result = {'object': self.current_object.name, 'function': self.current_func,
+                  'status': self.step_status, 'error': self.step_error}
+        result.update(self.step_profile.get_result())
+        self.results.append(result)
+        self.journal.step_finished(result)
 
         # Close all plots if not wanted
         if not self.mw.get_setting('show_plots'):
@@ -381,6 +449,8 @@ class RunDialog(QDialog):
     def thread_error(self, err):
         error_cause = f'{self.error_count}: {self.current_object.name} <- {self.current_func}'
         self.errors[error_cause] = (err, self.error_count)
+        self.step_status = 'failed'
+        self.step_error = f'{err[0].__name__}: {err[1]}'
         # Update Error-Widget
         self.error_widget.replace_data(list(self.errors.keys()))
 
@@ -405,6 +475,7 @@ class RunDialog(QDialog):
 
         # Clear Console-Widget
         self.console_widget.clear()
+        self.check_functions()
 
         # Redo References to display-widgets
         self.object_model._data = self.all_objects
@@ -432,4 +503,7 @@ class RunDialog(QDialog):
 
     def closeEvent(self, event):
         self.mw.pipeline_running = False
+        # Don't lose data, which is still saved in the background
+        flush_writes()
+        self.console_widget.close_log()
         event.accept()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from os.path import isfile, join
+
+from .events import get_event_stream
+from .pipeline_utils import datetime_format
+
+
+class RunJournal:
+    """An append-only record of the steps of the runs of a project (one JSON-object per line)
+
+    Every event is written to disk immediately, thus the progress of a run survives a crash of the process
+    and the remaining steps of an interrupted run can be rebuilt with get_remaining_steps.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project
+    event_stream : EventStream | None
+        Also send the events to this EventStream for external monitoring
+        (None for the EventStream from the setting "event_stream")
+    """
+
+    def __init__(self, main_win, event_stream=None):
+        self.mw = main_win
+        self.journal_path = join(self.mw.pr.pscripts_path, f'run_journal_{self.mw.pr.name}.jsonl')
+        self.event_stream = event_stream or get_event_stream(main_win)
+
+    def write_event(self, event, **kwargs):
+        entry = {'event': event, 'time': datetime.now().strftime(datetime_format)}
+        entry.update(kwargs)
+        with open(self.journal_path, 'a') as file:
+            file.write(json.dumps(entry) + '\n')
+            # Make sure the event is on disk, even if the process dies afterwards
+            file.flush()
+            os.fsync(file.fileno())
+
+    def read_events(self):
+        events = list()
+        if isfile(self.journal_path):
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        events.append(json.loads(line))
+                    # The last line may be incomplete if the process died while writing
+                    except json.JSONDecodeError:
+                        pass
+
+        return events
+
+    def start_run(self, all_steps):
+        self.write_event('run_start', p_preset=self.mw.pr.p_preset, steps=[list(s) for s in all_steps])
+        if self.event_stream is not None:
+            self.event_stream.run_started(all_steps)
+
+    def end_run(self):
+        self.write_event('run_end')
+        if self.event_stream is not None:
+            self.event_stream.run_ended()
+
+    def step_started(self, object_name, func_name):
+        self.write_event('step_start', object=object_name, function=func_name)
+        if self.event_stream is not None:
+            self.event_stream.step_started(object_name, func_name)
+
+    def step_finished(self, result):
+        """Record the result of a step (as returned from StepRunner.run_step)"""
+        self.write_event('step_end', object=result['object'], function=result['function'],
+                         status=result['status'], duration=result.get('duration'), error=result.get('error'))
+        if self.event_stream is not None:
+            self.event_stream.step_finished(result)
+
+    def get_last_run(self):
+        """Get the events of the last run (beginning with "run_start")"""
+        events = self.read_events()
+        start_idxs = [idx for idx, e in enumerate(events) if e['event'] == 'run_start']
+        if len(start_idxs) == 0:
+            return list()
+
+        return events[start_idxs[-1]:]
+
+    def is_interrupted(self):
+        """Check if the last run was started but didn't end"""
+        last_run = self.get_last_run()
+
+        return len(last_run) > 0 and last_run[-1]['event'] != 'run_end'
+
+    def get_remaining_steps(self):
+        """Get the steps of the last run, which didn't finish (failed or interrupted steps are run again)
+
+        Returns
+        -------
+        remaining_steps : list
+            A list of tuples (object_name, function_name) in the order of the last run
+        p_preset : str | None
+            The Parameter-Preset of the last run
+        """
+        last_run = self.get_last_run()
+        if len(last_run) == 0:
+            return list(), None
+
+        done = set([(e['object'], e['function']) for e in last_run
+                    if e['event'] == 'step_end' and e['status'] in ['finished', 'skipped']])
+        remaining_steps = [tuple(s) for s in last_run[0]['steps'] if tuple(s) not in done]
+
+        return remaining_steps, last_run[0]['p_preset']
+
+
+def get_resume_steps(main_win, remaining_steps):
+    """Get objects and steps (like get_run_steps) for the remaining steps of an interrupted run
+
+    The type of each object is taken from the target of its functions,
+    functions, which don't exist anymore (e.g. from a removed custom-package) are dropped.
+    """
+    all_objects = OrderedDict()
+    all_steps = list()
+    for obj_name, func_name in remaining_steps:
+        if func_name not in main_win.pd_funcs.index:
+            print(f'{func_name} for {obj_name} from the interrupted run is not available anymore')
+            continue
+        if obj_name not in all_objects:
+            all_objects[obj_name] = {'type': main_win.pd_funcs.loc[func_name, 'target'],
+                                     'functions': dict(),
+                                     'status': 1}
+        all_objects[obj_name]['functions'][func_name] = 1
+        all_steps.append((obj_name, func_name))
+
+    return all_objects, all_steps
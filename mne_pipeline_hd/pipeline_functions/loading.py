@@ -17,9 +17,12 @@ import itertools
 import json
 import pickle
 import shutil
-from datetime import datetime
-from os import listdir, makedirs, remove, rename
-from os.path import exists, getsize, isdir, isfile, join
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from os import close, listdir, makedirs, remove, rename
+from os.path import exists, isdir, isfile, join
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -37,7 +40,97 @@ import numpy as np
 # ==============================================================================
 # LOADING FUNCTIONS
 # ==============================================================================
-from mne_pipeline_hd.pipeline_functions.pipeline_utils import TypedJSONEncoder, type_json_hook
+from mne_pipeline_hd.pipeline_functions.artifacts import detach_files, store_artifacts
+from mne_pipeline_hd.pipeline_functions.data_cache import (copy_data, get_cache_key, get_data_cache, get_data_nbytes,
+                                                           protect_data)
+from mne_pipeline_hd.pipeline_functions.pipeline_utils import (TypedJSONEncoder, get_function_entries, preload_modes,
+                                                              type_json_hook)
+from mne_pipeline_hd.pipeline_functions.profiler import get_paths_size, is_profiling, record_io
+from mne_pipeline_hd.pipeline_functions.writer import async_writer, is_async_save
+
+
+# The load-functions, which follow the preload-mode
+preload_loads = ['load_raw', 'load_filtered', 'load_erm', 'load_erm_processed']
+_preload_local = threading.local()
+_function_local = threading.local()
+
+
+@contextmanager
+def preload_policy(mode):
+    """Set how raw-data is loaded in this thread (e.g. while a function runs)
+
+    Parameters
+    ----------
+    mode : str
+        "full" reads all data into memory,
+        "memmap" reads the data into a memory-mapped scratch-file (only the used parts are held in memory),
+        "lazy" reads only the info and the data when it is accessed (e.g. only the stim-channels in find_events)
+    """
+    previous_mode = get_preload_mode()
+    _preload_local.mode = mode if mode in preload_modes else 'full'
+    try:
+        yield
+    finally:
+        _preload_local.mode = previous_mode
+
+
+def get_preload_mode():
+    return getattr(_preload_local, 'mode', 'full')
+
+
+@contextmanager
+def running_function(func_name):
+    """Set the function, which runs in this thread (recorded as the function, which saved the files)"""
+    previous_func = get_running_function()
+    _function_local.func_name = func_name
+    try:
+        yield
+    finally:
+        _function_local.func_name = previous_func
+
+
+def get_running_function():
+    return getattr(_function_local, 'func_name', None)
+
+
+def _load_partial(load_func, args, kwargs, picks=None, exclude=(), tmin=None, tmax=None):
+    """Read raw-data lazily and load only the picked channels in the time-window from disk"""
+    with preload_policy('lazy'):
+        raw = load_func(*args, **kwargs)
+    if picks is not None:
+        raw.pick(picks, exclude=exclude)
+    if tmin is not None or tmax is not None:
+        raw.crop(tmin=tmin or 0., tmax=tmax)
+    raw.load_data()
+    record_io('load', get_data_nbytes(raw))
+
+    return raw
+
+
+def _wait_for_writes(obj_instance, data_type):
+    try:
+        paths = obj_instance._return_path_list(data_type)
+    # Paths may be empty (e.g. when no trials are selected)
+    except IndexError:
+        return
+    if async_writer.is_pending(paths):
+        print(f'Waiting until {data_type} for {obj_instance.name} is saved')
+    async_writer.wait_for(paths)
+
+
+def _finish_save(obj_instance, data_type, data, func_name, step_key, qsettings, is_protected=False):
+    """Save the File-Parameters, store the files in the artifact-store and keep the saved data for the next functions"""
+    paths = obj_instance._return_path_list(data_type)
+    for path in paths:
+        obj_instance.save_file_params(path, func_name)
+    if step_key is not None:
+        store_artifacts(obj_instance, step_key, data_type, paths)
+
+    # Keep the saved data with the modification-time of the new files
+    cache_key = get_cache_key(obj_instance, data_type)
+    get_data_cache(qsettings).put(cache_key, data, is_protected=is_protected)
+    if obj_instance.keep_data and cache_key is not None:
+        obj_instance.kept_data[data_type] = (cache_key, data if is_protected else protect_data(data))
 
 
 def load_decorator(load_func):
@@ -49,16 +142,51 @@ def load_decorator(load_func):
         # Get matching data-type from IO-Dict
         data_type = [k for k in obj_instance.io_dict if obj_instance.io_dict[k]['load'] == load_func.__name__][0]
 
+        # Wait until the files are written, if they are still saved in the background
+        _wait_for_writes(obj_instance, data_type)
+
+        # Raw-data can be loaded restricted to channels and a time-window (e.g. load_raw(picks='stim'))
+        partial_kwargs = {key: kwargs.pop(key) for key in ['picks', 'exclude', 'tmin', 'tmax'] if key in kwargs}
+        if len(partial_kwargs) > 0:
+            if load_func.__name__ not in preload_loads:
+                raise TypeError(f'{load_func.__name__} can\'t load parts of {data_type}, '
+                                f'only {", ".join(preload_loads)} can')
+            print(f'Loading part of {data_type} for {obj_instance.name} ({partial_kwargs})')
+            # Parts are not cached
+            return _load_partial(load_func, args, kwargs, **partial_kwargs)
+
         print(f'Loading {data_type} for {obj_instance.name}')
 
+        cache = get_data_cache(QSettings())
+        # Raw-data, which is not fully loaded, is not cached (the copies would be fully loaded)
+        if load_func.__name__ in preload_loads and get_preload_mode() != 'full':
+            cache_key = None
+        else:
+            cache_key = get_cache_key(obj_instance, data_type)
+        # Data prefetched for this object comes first, then data kept by a shared object, then the process-wide cache
         if data_type in obj_instance.data_dict:
             data = obj_instance.data_dict[data_type]
+            record_io('cached')
+        elif cache_key is not None and obj_instance.kept_data.get(data_type, (None,))[0] == cache_key:
+            data = copy_data(obj_instance.kept_data[data_type][1])
+            record_io('cached')
         else:
-            data = load_func(*args, **kwargs)
-
-        # Save data in data-dict for machines with big RAM
-        if QSettings().value('save_ram') == 'false' or QSettings().value('save_ram') is False:
-            obj_instance.data_dict[data_type] = data
+            data = cache.get(cache_key)
+            if data is not None:
+                record_io('cached')
+            else:
+                data = load_func(*args, **kwargs)
+                if is_profiling():
+                    try:
+                        paths = obj_instance._return_path_list(data_type)
+                    # Paths may be empty (e.g. when no trials are selected)
+                    except IndexError:
+                        paths = list()
+                    record_io('load', get_paths_size(paths))
+                cache.put(cache_key, data)
+        if obj_instance.keep_data and cache_key is not None \
+                and obj_instance.kept_data.get(data_type, (None,))[0] != cache_key:
+            obj_instance.kept_data[data_type] = (cache_key, protect_data(data))
 
         return data
 
@@ -82,17 +210,32 @@ def save_decorator(save_func):
         for path in [p for p in paths if not isdir(Path(p).parent)]:
             makedirs(Path(path).parent)
 
-        print(f'Saving {data_type} for {obj_instance.name}')
-        save_func(*args, **kwargs)
-
-        # Save data in data-dict for machines with big RAM
-        if QSettings().value('save_ram') == 'false' or QSettings().value('save_ram') is False:
-            obj_instance.data_dict[data_type] = data
-
-        # Save File-Parameters
-        paths = obj_instance._return_path_list(data_type)
-        for path in paths:
-            obj_instance.save_file_params(path)
+        # The running function (e.g. filter_raw) for the File-Parameters,
+        # outside of a run (e.g. from a dialog) the function calling save
+        func_name = get_running_function() or inspect.currentframe().f_back.f_code.co_name
+        # The key of the running step for the artifact-store (see skip_step)
+        step_key = obj_instance.step_key
+        qsettings = QSettings()
+
+        if is_async_save(qsettings):
+            # Write a read-only copy in the background, the function may change data afterwards
+            snapshot = protect_data(data)
+            record_io('save', get_data_nbytes(snapshot))
+
+            def write_snapshot():
+                print(f'Saving {data_type} for {obj_instance.name} (in background)')
+                detach_files(paths)
+                save_func(obj_instance, snapshot, *args[2:], **kwargs)
+                _finish_save(obj_instance, data_type, snapshot, func_name, step_key, None, is_protected=True)
+
+            async_writer.submit(paths, write_snapshot, f'Saving {data_type} for {obj_instance.name}')
+        else:
+            print(f'Saving {data_type} for {obj_instance.name}')
+            detach_files(paths)
+            save_func(*args, **kwargs)
+            if is_profiling():
+                record_io('save', get_paths_size(paths))
+            _finish_save(obj_instance, data_type, data, func_name, step_key, qsettings)
 
     return save_wrapper
 
@@ -120,14 +263,16 @@ class BaseLoading:
             self.pr.plot_files[self.name][self.p_preset] = dict()
         self.plot_files = self.pr.plot_files[self.name][self.p_preset]
 
-        # Prepare file-parameters-dictionary for Loading-Object
-        if self.name not in self.pr.file_parameters:
-            self.pr.file_parameters[self.name] = dict()
-        self.file_parameters = self.pr.file_parameters[self.name]
-
         self.save_dir = None
         self.io_dict = dict()
         self.data_dict = dict()
+        # Objects shared between other objects (see FSMRIRegistry) keep a read-only copy of their loaded data
+        # independent of the data-cache as data_type: (cache-key, data),
+        # the key with the modification-time invalidates old data
+        self.keep_data = False
+        self.kept_data = dict()
+        # The key of the running step for the artifact-store (set in skip_step, None if it is not used)
+        self.step_key = None
         self.existing_paths = dict()
 
     def _return_path_list(self, data_type):
@@ -149,27 +294,18 @@ class BaseLoading:
 
         return paths
 
-    # Todo: Only save relevant parameters (with dependencies)
-    def save_file_params(self, path):
-        file_name = Path(path).name
+    def save_file_params(self, path, func_name):
+        """Record the function and the parameters, with which a file was saved (see ProvenanceStore)"""
+        # Source-Estimates are saved with suffixes (e.g. -lh.stc/-rh.stc)
+        self.pr.provenance.record(self.name, Path(path).name, path, func_name, self.p_preset, self.p,
+                                  get_paths_size([path]), entries=get_function_entries(self, func_name))
 
-        if file_name not in self.file_parameters:
-            self.file_parameters[file_name] = dict()
-        # Get the name of the calling function (assuming it is 2 Frames above)
-        if 'FUNCTION' in self.file_parameters[file_name]:
-            self.file_parameters[file_name]['FUNCTION'].append(inspect.stack()[2][3])
-        else:
-            self.file_parameters[file_name]['FUNCTION'] = [inspect.stack()[2][3]]
-        self.file_parameters[file_name]['NAME'] = self.name
-        self.file_parameters[file_name]['PATH'] = path
-        if 'TIME' in self.file_parameters[file_name]:
-            self.file_parameters[file_name]['TIME'].append(datetime.now())
-        else:
-            self.file_parameters[file_name]['TIME'] = [datetime.now()]
-        self.file_parameters[file_name]['SIZE'] = getsize(path)
-        self.file_parameters[file_name]['P_PRESET'] = self.p_preset
-        for p_name in self.p:
-            self.file_parameters[file_name][p_name] = self.p[p_name]
+    def get_file_params(self, path):
+        """Get the last record for a file (with "FUNCTION", "TIME", "SIZE", "P_PRESET", "PARAMETERS", ...)
+
+        Returns an empty dictionary, if the file wasn't saved by the pipeline yet.
+        """
+        return self.pr.provenance.get_latest(self.name, Path(path).name) or dict()
 
     def clear_plot_files(self):
         """Clear all entries in plot-files, where the image has already been deleteds"""
@@ -284,8 +420,15 @@ class BaseLoading:
         else:
             print('Not saving plots; set "save_plots" to "True" to save')
 
+    def get_json_path(self, file_name):
+        # If file-ending is supplied, remove it to avoid doubling
+        if file_name[-5:] == '.json':
+            file_name = file_name[:-5]
+
+        return join(self.save_dir, f'{self.name}_{self.p_preset}_{file_name}.json')
+
     def load_json(self, file_name, default=None):
-        file_path = join(self.save_dir, f'{self.name}_{self.p_preset}_{file_name}.json')
+        file_path = self.get_json_path(file_name)
         try:
             with open(file_path, 'r') as file:
                 data = json.load(file, object_hook=type_json_hook)
@@ -299,17 +442,17 @@ class BaseLoading:
         return data
 
     def save_json(self, file_name, data):
-        # If file-ending is supplied, remove it to avoid doubling
-        if file_name[-5:] == '.json':
-            file_name = file_name[:-5]
-        file_path = join(self.save_dir, f'{self.name}_{self.p_preset}_{file_name}.json')
+        file_path = self.get_json_path(file_name)
+        detach_files([file_path])
         try:
             with open(file_path, 'w') as file:
                 json.dump(data, file, cls=TypedJSONEncoder, indent=4)
         except json.JSONDecodeError:
             print(f'{file_path} could not be saved')
 
-        self.save_file_params(file_path)
+        self.save_file_params(file_path, get_running_function() or inspect.currentframe().f_back.f_code.co_name)
+        if self.step_key is not None:
+            store_artifacts(self, self.step_key, 'json', [file_path])
 
     def get_existing_paths(self):
         """Get existing paths and add the mapped File-Type to existing_paths (set)"""
@@ -365,7 +508,8 @@ class MEEG(BaseLoading):
             if not self.suppress_warnings:
                 print(f'No Freesurfer-MRI-Subject assigned for {self.name}, defaulting to "None"')
         if self.fsmri is None or self.fsmri.name != self.mw.pr.meeg_to_fsmri[self.name]:
-            self.fsmri = FSMRI(self.mw.pr.meeg_to_fsmri[self.name], self.mw)
+            # Share the FSMRI-object (and its loaded data) with the other MEEG-objects of the same Freesurfer-MRI
+            self.fsmri = fsmri_registry.get(self.mw.pr.meeg_to_fsmri[self.name], self.mw)
 
         # Transition from 'None' to None (placed 30.01.2021, can be removed soon)
         if self.mw.pr.meeg_to_erm[self.name] == 'None':
@@ -555,9 +699,29 @@ class MEEG(BaseLoading):
     def load_info(self):
         return mne.io.read_info(self.raw_path)
 
+    @staticmethod
+    def _read_raw(path):
+        """Read raw-data with the preload-mode of this thread (see preload_policy)"""
+        mode = get_preload_mode()
+        if mode == 'memmap':
+            # Use another directory for the scratch-files, if the temporary directory is in memory (e.g. tmpfs)
+            file_descriptor, scratch_path = tempfile.mkstemp(suffix='.dat', prefix='mne_pipeline_hd_',
+                                                             dir=QSettings().value('scratch_path') or None)
+            close(file_descriptor)
+            raw = mne.io.read_raw_fif(path, preload=scratch_path)
+            # The memory-map stays valid without the file (on Windows the file is left in the scratch-directory)
+            try:
+                remove(scratch_path)
+            except OSError:
+                pass
+        else:
+            raw = mne.io.read_raw_fif(path, preload=mode == 'full')
+
+        return raw
+
     @load_decorator
     def load_raw(self):
-        raw = mne.io.read_raw_fif(self.raw_path, preload=True)
+        raw = self._read_raw(self.raw_path)
         raw.info['bads'] = self.bad_channels
         return raw
 
@@ -567,7 +731,7 @@ class MEEG(BaseLoading):
 
     @load_decorator
     def load_filtered(self):
-        return mne.io.read_raw_fif(self.raw_filtered_path, preload=True)
+        return self._read_raw(self.raw_filtered_path)
 
     @save_decorator
     def save_filtered(self, raw_filtered):
@@ -575,11 +739,11 @@ class MEEG(BaseLoading):
 
     @load_decorator
     def load_erm(self):
-        return mne.io.read_raw_fif(self.erm_path, preload=True)
+        return self._read_raw(self.erm_path)
 
     @load_decorator
     def load_erm_processed(self):
-        return mne.io.read_raw_fif(self.erm_processed_path, preload=True)
+        return self._read_raw(self.erm_processed_path)
 
     @save_decorator
     def save_erm_processed(self, erm_filtered):
@@ -822,7 +986,7 @@ class MEEG(BaseLoading):
     def save_connectivity(self, con_dict):
         for trial in con_dict:
             for con_method in con_dict[trial]:
-                np.save(self.con_paths[trial][con_method])
+                np.save(self.con_paths[trial][con_method], con_dict[trial][con_method])
 
 
 class FSMRI(BaseLoading):
@@ -911,6 +1075,54 @@ class FSMRI(BaseLoading):
         source_morph.save(self.source_morph_path, overwrite=True)
 
 
+class FSMRIRegistry:
+    """Share one FSMRI-object per Freesurfer-MRI between all MEEG-objects of this process
+
+    The shared objects keep their loaded data (e.g. Source-Space, BEM-Solution, Source-Morph), thus all MEEG-objects
+    of the same Freesurfer-MRI (e.g. of a template like fsaverage) read these files only once.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of shared FSMRI-objects (the least recently used is dropped first).
+        CAVE: Their loaded data is kept in addition to the data-cache and not counted against "cache_memory"
+        (e.g. a BEM-Solution, a Source-Space and a Source-Morph of a template are a few hundred MB per object).
+    """
+
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._fsmris = OrderedDict()
+        # MEEG-objects are also created in the thread of the Prefetcher
+        self._lock = threading.Lock()
+
+    def get(self, name, main_win):
+        """Get the shared FSMRI-object for name (which is created if it doesn't exist)"""
+        p = main_win.pr.parameters[main_win.pr.p_preset]
+        # The paths of the FSMRI-object depend on the project and these parameters
+        # (the FSMRI-object keeps the project, thus a reloaded project with the same name gets a new one)
+        key = (name, id(main_win), main_win.pr.name, id(main_win.pr), main_win.pr.p_preset,
+               p.get('source_space_spacing'), p.get('morph_to'))
+        with self._lock:
+            if key in self._fsmris:
+                self._fsmris.move_to_end(key)
+            else:
+                fsmri = FSMRI(name, main_win)
+                fsmri.keep_data = True
+                self._fsmris[key] = fsmri
+                while len(self._fsmris) > self.max_size:
+                    self._fsmris.popitem(last=False)
+
+            return self._fsmris[key]
+
+    def clear(self):
+        with self._lock:
+            self._fsmris.clear()
+
+
+# The FSMRI-objects shared by all MEEG-objects of this process
+fsmri_registry = FSMRIRegistry()
+
+
 class Group(BaseLoading):
     def __init__(self, name, main_win, suppress_warnings=True):
         super().__init__(name, main_win)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import json
+import threading
+from os.path import getsize, isfile, join
+
+from .pipeline_utils import _get_data_paths, _get_existing_path, get_function_io
+
+# psutil is optional, without it the peak memory of steps is not measured (and nothing is learned)
+try:
+    import psutil
+except ModuleNotFoundError:
+    psutil = None
+
+# The factor between the size of the input-files and the peak memory of a function,
+# which is assumed as long as nothing was learned for the function
+default_multiplier = 3
+# Weight of older observations when learning the multiplier
+decay = 0.8
+
+
+class PeakMemoryMonitor:
+    """Sample the memory of this process in a thread to get the increase of memory at the peak (needs psutil)
+
+    Use as a context-manager around the code, which is measured.
+    """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.start_memory = None
+        self.peak_memory = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        process = psutil.Process()
+        while not self._stop_event.wait(self.interval):
+            self.peak_memory = max(self.peak_memory, process.memory_info().rss)
+
+    def __enter__(self):
+        if psutil is not None:
+            self.start_memory = psutil.Process().memory_info().rss
+            self.peak_memory = self.start_memory
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self.peak_memory = max(self.peak_memory, psutil.Process().memory_info().rss)
+
+    @property
+    def peak_increase(self):
+        """The increase of memory at the peak in bytes (None without psutil)"""
+        if self.start_memory is None:
+            return None
+
+        return self.peak_memory - self.start_memory
+
+
+def get_file_size(obj, path):
+    """Get the size of a file from the file-parameters (or from disk if it was not saved by the pipeline)"""
+    file_size = obj.get_file_params(path).get('SIZE')
+    if file_size is not None:
+        return file_size
+    existing_path = _get_existing_path(path)
+    if existing_path is not None and isfile(existing_path):
+        return getsize(existing_path)
+
+    return 0
+
+
+class MemoryModel:
+    """Estimate the peak memory of steps from the size of their input-files
+
+    The factor between input-size and peak memory is learned for each function from past runs
+    and stored in _pipeline_scripts.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    """
+
+    def __init__(self, main_win):
+        self.mw = main_win
+        self.model_path = join(self.mw.pr.pscripts_path, f'memory_model_{self.mw.pr.name}.json')
+        # func_name -> {'multiplier': float, 'peak': int}
+        self.functions = dict()
+        # Data-Objects initialized for estimation: object_name -> object
+        self.objects = dict()
+
+        self.load()
+
+    def load(self):
+        if isfile(self.model_path):
+            with open(self.model_path, 'r') as file:
+                self.functions = json.load(file)
+
+    def save(self):
+        with open(self.model_path, 'w') as file:
+            json.dump(self.functions, file, indent=4)
+
+    def get_object(self, obj_name, obj_type):
+        # Avoid circular import
+        from .loading import FSMRI, Group, MEEG
+
+        if obj_name not in self.objects:
+            if obj_type == 'MEEG':
+                self.objects[obj_name] = MEEG(obj_name, self.mw)
+            elif obj_type == 'FSMRI':
+                self.objects[obj_name] = FSMRI(obj_name, self.mw)
+            else:
+                self.objects[obj_name] = Group(obj_name, self.mw)
+
+        return self.objects[obj_name]
+
+    def get_input_size(self, obj_name, obj_type, func_name):
+        """Get the size in bytes of the files a function loads for an object (None if unknown)"""
+        io = get_function_io(func_name, self.mw)
+        if io is None or obj_type not in ['MEEG', 'FSMRI', 'Group']:
+            return None
+
+        obj = self.get_object(obj_name, obj_type)
+        input_size = 0
+        for data_type, data_name in io['load']:
+            if data_type == obj_type:
+                data_objects = [obj]
+            elif data_type == 'FSMRI' and obj_type == 'MEEG':
+                data_objects = [obj.fsmri]
+            elif data_type == 'MEEG' and obj_type == 'Group':
+                data_objects = [self.get_object(m, 'MEEG') for m in self.mw.pr.all_groups.get(obj_name, list())]
+            else:
+                data_objects = list()
+            for data_obj in data_objects:
+                for path in _get_data_paths(data_obj, data_name) or list():
+                    input_size += get_file_size(data_obj, path)
+
+        return input_size
+
+    def estimate(self, func_name, input_size):
+        """Estimate the peak memory in bytes of a function for an input-size"""
+        learned = self.functions.get(func_name, dict())
+        if input_size:
+            return input_size * learned.get('multiplier', default_multiplier)
+
+        return learned.get('peak', 0)
+
+    def learn(self, func_name, input_size, peak_memory):
+        """Update the multiplier of a function with the observed peak memory of a step
+
+        Older observations decay, but a new observation is never underestimated to rather be conservative.
+        """
+        if peak_memory is None:
+            return
+        learned = self.functions.setdefault(func_name, dict())
+        observations = {'peak': peak_memory}
+        if input_size:
+            observations['multiplier'] = peak_memory / input_size
+        for key, value in observations.items():
+            if key in learned:
+                learned[key] = max(value, decay * learned[key] + (1 - decay) * value)
+            else:
+                learned[key] = value
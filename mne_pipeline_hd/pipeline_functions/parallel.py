@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import logging
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from copy import deepcopy
+from multiprocessing import get_context
+
+from .cluster import QueueExecutor
+from .data_cache import set_worker_cache_memory
+from .execution import StepRunner, summarize_results
+from .loading import fsmri_registry
+from .memory import MemoryModel
+from .pipeline_utils import get_project_entries
+from .writer import flush_writes
+
+# Entries of the project, which are stored by object-name and can be changed by the functions of an object
+object_attributes = ['plot_files', 'ica_exclude']
+
+# One Controller per worker-process (reused for all objects of the same project, the project is reloaded for each job)
+_worker_controller = None
+
+
+def _init_worker():
+    # Plots can't be shown from a worker-process, so they are only saved
+    import matplotlib
+    matplotlib.use('Agg')
+    # 3D-plots are rendered off-screen
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from mayavi import mlab
+        mlab.options.offscreen = True
+    except ModuleNotFoundError:
+        pass
+    # Configure the root-logger before the Project does,
+    # otherwise each process would truncate _pipeline.log with logging.basicConfig(filemode='w')
+    logging.basicConfig(stream=sys.stderr)
+
+
+def _get_worker_controller(home_path, project, p_preset, settings):
+    """Get the Controller of this worker-process with the project as saved by the main-process
+
+    A worker (e.g. of a queue) runs the jobs of many runs, thus the project is loaded again for each job,
+    otherwise the parameters and entries changed in the GUI since the first job would be ignored.
+    """
+    global _worker_controller
+    from .controller import Controller
+
+    if _worker_controller is None \
+            or _worker_controller.home_path != home_path \
+            or _worker_controller.current_project != project:
+        _worker_controller = Controller(home_path, project, p_preset)
+    else:
+        _worker_controller.pr.load()
+        _worker_controller.pr.p_preset = p_preset
+        # The FSMRI-objects hold the parameters of the last job
+        fsmri_registry.clear()
+    # Use the settings of the main-process (which may not be saved)
+    _worker_controller.settings.update(settings)
+
+    return _worker_controller
+
+
+def get_changed_entries(before, after):
+    """Get only the (nested) entries of the dictionary "after", which differ from "before"
+    """
+    changed = dict()
+    for key in after:
+        if key not in before:
+            changed[key] = after[key]
+        elif isinstance(after[key], dict) and isinstance(before[key], dict):
+            changed_sub = get_changed_entries(before[key], after[key])
+            if len(changed_sub) > 0:
+                changed[key] = changed_sub
+        elif str(after[key]) != str(before[key]):
+            changed[key] = after[key]
+
+    return changed
+
+
+def merge_entries(target, source):
+    """Merge the (nested) entries from source into target (CAVE: target is changed in place)"""
+    for key in source:
+        if isinstance(source[key], dict) and isinstance(target.get(key), dict):
+            merge_entries(target[key], source[key])
+        else:
+            target[key] = source[key]
+
+
+def apply_object_entries(pr, object_entries):
+    """Set the entries from the main-process in the project of a worker-process
+
+    Parameters
+    ----------
+    pr : Project
+        The project of the worker-process
+    object_entries : dict
+        {attribute-name: {object-name: entry}} (see ParallelRunner.get_object_entries)
+    """
+    for attr_name, entries in object_entries.items():
+        attribute = getattr(pr, attr_name, None)
+        if isinstance(attribute, dict):
+            attribute.update(deepcopy(entries))
+
+
+def run_object_steps(home_path, project, p_preset, settings, obj_name, obj_type, functions, n_cores=None,
+                     cache_memory=None, object_entries=None, n_workers=1):
+    """Run the functions of one object in order inside a worker-process
+
+    The functions get n_cores as n_jobs and the BLAS-threads are limited to n_cores (see CoreAllocator).
+    The data-cache of the process gets cache_memory (in GB), its share of the setting "cache_memory"
+    (counted with the job against the memory-budget, see ParallelRunner.get_job_memory).
+    If n_cores and cache_memory are None (e.g. for a job from a queue, which runs on another machine),
+    they are the share of this worker from the settings "n_jobs" and "cache_memory" of this machine,
+    which are split between the n_workers worker-processes of this machine.
+    The object_entries from the main-process are set in the project before the functions run
+    (e.g. ica_exclude set by run_ica in another process of the same run, which is not saved yet).
+
+    Returns
+    -------
+    results : list
+        The result of each step (see StepRunner.run_step)
+    project_entries : dict
+        The entries for obj_name from object_attributes, which were changed by the functions
+        (to be merged into the project of the main-process)
+    write_errors : list
+        The error-messages of the data, which failed to save in the background (with the setting "async_save")
+    """
+    controller = _get_worker_controller(home_path, project, p_preset, settings)
+    n_workers = max(1, n_workers)
+    if n_cores is None:
+        n_cores = max(1, CoreAllocator(int(controller.qsettings.value('n_jobs', defaultValue=-1))).n_cores
+                      // n_workers)
+    if cache_memory is None:
+        cache_memory = float(controller.qsettings.value('cache_memory', defaultValue=0)) / n_workers
+    set_worker_cache_memory(cache_memory)
+    apply_object_entries(controller.pr, object_entries or dict())
+    before = {attr_name: deepcopy(getattr(controller.pr, attr_name).get(obj_name, dict()))
+              for attr_name in object_attributes}
+
+    all_objects = OrderedDict({obj_name: {'type': obj_type,
+                                          'functions': {f: 1 for f in functions},
+                                          'status': 1}})
+    # The steps run one after another in this process, thus the CPU-time of the whole process is measured
+    runner = StepRunner(controller, all_objects, [(obj_name, f) for f in functions], n_cores=n_cores,
+                        cpu_clock='process')
+    summary = runner.run()
+
+    project_entries = dict()
+    for attr_name in object_attributes:
+        after = getattr(controller.pr, attr_name).get(obj_name)
+        if isinstance(after, dict):
+            changed = get_changed_entries(before[attr_name], after)
+            if len(changed) > 0:
+                project_entries[attr_name] = changed
+        # e.g. ica_exclude stores lists
+        elif after is not None and after != before[attr_name]:
+            project_entries[attr_name] = after
+
+    return runner.results, project_entries, summary.get('write_errors', list())
+
+
+class CoreAllocator:
+    """Split a machine-wide budget of cores between the jobs running at the same time
+
+    Each job gets an equal share of the free cores for the slots, which can still be filled,
+    thus fewer jobs at the end of a run get more cores.
+
+    Parameters
+    ----------
+    n_cores : int | None
+        The budget of cores (None or values < 1 like n_jobs=-1 for all cores of the machine)
+    """
+
+    def __init__(self, n_cores=None):
+        if n_cores is None or n_cores < 1:
+            n_cores = os.cpu_count()
+        self.n_cores = n_cores
+        # The allocated cores for each running job: job_id -> n_cores
+        self.allocated = dict()
+
+    def allocate(self, job_id, n_slots):
+        """Allocate cores for a job, when n_slots jobs (including this one) can start now"""
+        free_cores = self.n_cores - sum(self.allocated.values())
+        self.allocated[job_id] = max(1, free_cores // max(1, n_slots))
+
+        return self.allocated[job_id]
+
+    def release(self, job_id):
+        self.allocated.pop(job_id, None)
+
+
+class ParallelRunner:
+    """Run the steps of independent objects in parallel in a pool of processes
+
+    The functions of each object still run in order inside one process.
+    MEEG-objects wait for their FSMRI-object and Groups wait for all of their MEEG-objects
+    (if they are part of the run). Steps without object ("Other") run afterwards in the main-process.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    all_objects : OrderedDict
+        The objects as returned from get_run_steps
+    all_steps : list
+        The steps as returned from get_run_steps
+    n_processes : int | None
+        The number of worker-processes (None for the number of cores)
+    journal : RunJournal | None
+        Record the start and the result of each step in this journal (from the main-process)
+    memory_budget : int | None
+        Only start jobs while the sum of their estimated peak memory (in bytes) fits into this budget
+        (see MemoryModel). If None, the memory is not considered.
+    executor : concurrent.futures.Executor | None
+        Run the jobs with this executor (e.g. a QueueExecutor for a cluster),
+        if None, they run in a local pool of n_processes processes.
+    """
+
+    def __init__(self, main_win, all_objects, all_steps, n_processes=None, journal=None, memory_budget=None,
+                 executor=None):
+        self.mw = main_win
+        self.all_objects = all_objects
+        self.all_steps = list(all_steps)
+        self.n_processes = n_processes or os.cpu_count()
+        self.journal = journal
+        self.memory_budget = memory_budget
+        self.executor = executor
+        # The setting n_jobs is the budget of cores for all processes together
+        self.core_allocator = CoreAllocator(int(self.mw.qsettings.value('n_jobs', defaultValue=-1)))
+
+        if self.memory_budget:
+            self.memory_model = MemoryModel(self.mw)
+        else:
+            self.memory_model = None
+        # The estimated peak memory of each job: job_id -> bytes
+        self.job_memory = dict()
+        # The size of the input-files of each step: (object_name, function_name) -> bytes
+        self.input_sizes = dict()
+
+        self.results = list()
+        # The errors of data saved in the background by the processes (with the setting "async_save")
+        self.write_errors = list()
+
+        self.other_steps = [s for s in self.all_steps if self.all_objects[s[0]]['type'] == 'Other']
+        # Jobs are sent to the worker-processes as a whole: job_id -> (object_name, [functions])
+        self.jobs = self.get_jobs()
+        # The jobs, which have to be finished before a job can start: job_id -> set(job_ids)
+        self.dependencies = self.get_dependencies()
+
+    def get_jobs(self):
+        """Get one job with all functions for each object (in order of execution)"""
+        jobs = OrderedDict()
+        for obj_name, func_name in [s for s in self.all_steps if s not in self.other_steps]:
+            jobs.setdefault(obj_name, (obj_name, list()))[1].append(func_name)
+
+        return jobs
+
+    def get_dependencies(self):
+        """Get the objects, which have to be finished before an object can start"""
+        dependencies = dict()
+        for obj_name in self.jobs:
+            obj_type = self.all_objects[obj_name]['type']
+            if obj_type == 'MEEG':
+                fsmri = self.mw.pr.meeg_to_fsmri.get(obj_name)
+                dependencies[obj_name] = {fsmri} if fsmri in self.jobs else set()
+            elif obj_type == 'Group':
+                dependencies[obj_name] = {m for m in self.mw.pr.all_groups.get(obj_name, list())
+                                          if m in self.jobs}
+            else:
+                dependencies[obj_name] = set()
+
+        return dependencies
+
+    def merge_project_entries(self, obj_name, project_entries):
+        for attr_name in project_entries:
+            attribute = getattr(self.mw.pr, attr_name)
+            if isinstance(project_entries[attr_name], dict) and isinstance(attribute.get(obj_name), dict):
+                merge_entries(attribute[obj_name], project_entries[attr_name])
+            else:
+                attribute[obj_name] = project_entries[attr_name]
+
+    def job_finished(self, obj_name, results, worker_signals=None):
+        self.results += results
+        for result in results:
+            self.all_objects[obj_name]['functions'][result['function']] = 0
+            print(f'{result["status"].capitalize()}: {obj_name} <- {result["function"]}')
+            if self.journal is not None:
+                self.journal.step_finished(result)
+            if self.memory_model is not None and result['status'] == 'finished':
+                self.memory_model.learn(result['function'], self.input_sizes.get((obj_name, result['function'])),
+                                        result.get('peak_memory'))
+        if all([v == 0 for v in self.all_objects[obj_name]['functions'].values()]):
+            self.all_objects[obj_name]['status'] = 0
+        if worker_signals is not None:
+            worker_signals.pgbar_n.emit(len(self.results))
+            worker_signals.pgbar_text.emit(f'{obj_name} <- {", ".join([r["function"] for r in results])} finished')
+
+    def get_job_name(self, job_id):
+        obj_name, functions = self.jobs[job_id]
+
+        return f'{obj_name} <- {", ".join(functions)}'
+
+    def get_failed_results(self, job_id, error):
+        """Get a failed result for each step of a job"""
+        obj_name, functions = self.jobs[job_id]
+
+        return [{'object': obj_name, 'function': func_name, 'status': 'failed', 'error': error, 'traceback': '',
+                 'duration': 0} for func_name in functions]
+
+    def block_failed_dependents(self, pending, done, failed, worker_signals=None):
+        """Mark the pending jobs, which depend on failed jobs, as failed without running them
+
+        They would run on missing or stale data (e.g. a Group after one of its MEEG-objects failed).
+        Jobs are pending in order of execution, thus also the dependents of blocked jobs are found in one pass.
+        """
+        for job_id in list(pending):
+            failed_dependencies = [d for d in self.dependencies[job_id] if d in failed]
+            if len(failed_dependencies) > 0:
+                pending.remove(job_id)
+                upstream = ', '.join([self.get_job_name(d) for d in failed_dependencies])
+                self.job_finished(self.jobs[job_id][0],
+                                  self.get_failed_results(job_id, f'Not run, because {upstream} failed'),
+                                  worker_signals)
+                done.add(job_id)
+                failed.add(job_id)
+
+    def get_ready_jobs(self, pending, done):
+        """Get the pending jobs, whose dependencies are done"""
+        return [job_id for job_id in pending if self.dependencies[job_id] <= done]
+
+    def get_cache_memory(self):
+        """Get the share of the setting "cache_memory" (in GB) for the data-cache of each worker-process"""
+        return float(self.mw.qsettings.value('cache_memory', defaultValue=0)) / self.n_processes
+
+    def get_job_memory(self, job_id):
+        """Get the estimated peak memory of a job (the maximum of its steps, because they run in order)
+
+        The data-cache of the worker-process keeps copies of the data in addition to the data of the functions,
+        thus its share of the setting "cache_memory" is added.
+        """
+        if job_id not in self.job_memory:
+            obj_name, functions = self.jobs[job_id]
+            obj_type = self.all_objects[obj_name]['type']
+            estimates = [0]
+            for func_name in functions:
+                try:
+                    input_size = self.memory_model.get_input_size(obj_name, obj_type, func_name)
+                except Exception as err:
+                    print(f'Input-size of {obj_name} <- {func_name} could not be determined: {err}')
+                    input_size = None
+                self.input_sizes[(obj_name, func_name)] = input_size
+                estimates.append(self.memory_model.estimate(func_name, input_size))
+            self.job_memory[job_id] = max(estimates) + self.get_cache_memory() * 1024 ** 3
+
+        return self.job_memory[job_id]
+
+    def admit_jobs(self, ready_jobs, running):
+        """Get the ready jobs, which can start now (limited by the free processes and the memory-budget)"""
+        n_free = self.n_processes - len(running)
+        if not self.memory_budget:
+            return ready_jobs[:n_free]
+
+        used_memory = sum([self.get_job_memory(job_id) for job_id in running.values()])
+        admitted = list()
+        for job_id in ready_jobs:
+            if len(admitted) == n_free:
+                break
+            job_memory = self.get_job_memory(job_id)
+            # Always start one job if nothing is running, otherwise a job bigger than the budget would never start
+            if used_memory + job_memory <= self.memory_budget or len(running) + len(admitted) == 0:
+                admitted.append(job_id)
+                used_memory += job_memory
+
+        return admitted
+
+    def submit_job(self, executor, job_id, n_slots=1):
+        obj_name, functions = self.jobs[job_id]
+        if isinstance(executor, QueueExecutor):
+            # The job may run on another machine, which sizes the cores and the data-cache itself
+            n_cores = None
+            cache_memory = None
+        else:
+            n_cores = self.core_allocator.allocate(job_id, n_slots)
+            # Each worker-process has its own data-cache, they share the setting "cache_memory"
+            cache_memory = self.get_cache_memory()
+        self.all_objects[obj_name]['status'] = 2
+        for func_name in functions:
+            self.all_objects[obj_name]['functions'][func_name] = 2
+            if self.journal is not None:
+                self.journal.step_started(obj_name, func_name)
+
+        return executor.submit(run_object_steps, self.mw.home_path, self.mw.pr.name, self.mw.pr.p_preset,
+                               dict(self.mw.settings), obj_name, self.all_objects[obj_name]['type'], functions,
+                               n_cores, cache_memory, self.get_object_entries(obj_name))
+
+    def get_object_entries(self, obj_name):
+        """Get the current entries of the project for the objects, whose data the job of obj_name uses
+
+        The entries changed by finished jobs are only merged into the project of the main-process
+        (see merge_project_entries), thus they are sent with each job.
+
+        Returns
+        -------
+        object_entries : dict
+            {attribute-name: {object-name: entry}}
+        """
+        # A Group uses the data of its MEEG-objects
+        obj_names = [obj_name] + list(self.mw.pr.all_groups.get(obj_name, list()))
+        object_entries = dict()
+        for name in obj_names:
+            for attr_name, entry in get_project_entries(self.mw.pr, name).items():
+                object_entries.setdefault(attr_name, dict())[name] = deepcopy(entry)
+
+        return object_entries
+
+    def run(self, worker_signals=None):
+        """Run all steps and return a summary (like StepRunner.run)"""
+        # Worker-processes load the project from disk
+        self.mw.pr.save()
+
+        pending = list(self.jobs)
+        running = dict()
+        done = set()
+        failed = set()
+
+        if self.executor is None:
+            # Spawn instead of fork, because forking a process with a running Qt-Event-Loop is not safe
+            executor = ProcessPoolExecutor(max_workers=self.n_processes, mp_context=get_context('spawn'),
+                                           initializer=_init_worker)
+        else:
+            executor = self.executor
+        with executor:
+            while len(pending) > 0 or len(running) > 0:
+                self.block_failed_dependents(pending, done, failed, worker_signals)
+                # Only submit as many jobs as there are processes to keep the order of jobs
+                for job_id in self.admit_jobs(self.get_ready_jobs(pending, done), running):
+                    pending.remove(job_id)
+                    # Share the free cores with the jobs, which can still start (limited by the processes)
+                    n_slots = min(self.n_processes - len(running), len(pending) + 1)
+                    running[self.submit_job(executor, job_id, n_slots)] = job_id
+
+                if len(running) == 0:
+                    # The last jobs were not run, because jobs they depend on failed
+                    if len(pending) == 0:
+                        break
+                    raise RuntimeError(f'Dependencies of {pending} can\'t be resolved')
+
+                finished_futures, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished_futures:
+                    job_id = running.pop(future)
+                    self.core_allocator.release(job_id)
+                    obj_name = self.jobs[job_id][0]
+                    try:
+                        results, project_entries, write_errors = future.result()
+                    except Exception as err:
+                        # e.g. if the worker-process was killed
+                        results = self.get_failed_results(job_id, f'{type(err).__name__}: {err}')
+                    else:
+                        self.merge_project_entries(obj_name, project_entries)
+                        self.write_errors += write_errors
+                    self.job_finished(obj_name, results, worker_signals)
+                    done.add(job_id)
+                    if any([r['status'] == 'failed' for r in results]):
+                        failed.add(job_id)
+
+        # Run functions without object in the main-process
+        if len(self.other_steps) > 0:
+            runner = StepRunner(self.mw, self.all_objects, self.other_steps)
+            for obj_name, func_name in self.other_steps:
+                if self.journal is not None:
+                    self.journal.step_started(obj_name, func_name)
+                runner.run_step(obj_name, func_name)
+            self.write_errors += flush_writes()
+            self.job_finished('', runner.results, worker_signals)
+
+        if self.memory_model is not None:
+            self.memory_model.save()
+
+        return self.get_summary()
+
+    def get_summary(self):
+        summary = summarize_results(self.results)
+        if len(self.write_errors) > 0:
+            summary['write_errors'] = self.write_errors
+
+        return summary
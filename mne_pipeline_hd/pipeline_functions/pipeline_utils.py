@@ -12,7 +12,10 @@ inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
 import inspect
 import json
 import os
+import re
+from copy import deepcopy
 from datetime import datetime
+from os.path import getmtime, isdir, isfile
 from pathlib import Path
 
 import numpy as np
@@ -90,10 +93,11 @@ def compare_filep(obj, path, target_parameters=None, verbose=True):
 
     result_dict = dict()
     file_name = Path(path).name
+    # The last record for the file
+    file_params = obj.get_file_params(path)
     # Try to get the parameters relevant for the last function, which altered the data at path
     try:
-        # The last entry in FUNCTION should be the most recent
-        function = obj.file_parameters[file_name]['FUNCTION'][-1]
+        function = file_params['FUNCTION']
         critical_params_str = obj.mw.pd_funcs[function]['func_args']
         # Make sure there are no spaces left
         critical_params_str = critical_params_str.replace(' ', '')
@@ -106,7 +110,7 @@ def compare_filep(obj, path, target_parameters=None, verbose=True):
         target_parameters = obj.p.keys()
     for param in target_parameters:
         try:
-            previous_value = obj.file_parameters[file_name][param]
+            previous_value = file_params['PARAMETERS'][param]
             current_value = obj.p[param]
 
             equality = str(previous_value) == str(current_value)
@@ -138,6 +142,276 @@ def compare_filep(obj, path, target_parameters=None, verbose=True):
     return result_dict
 
 
+# Matches calls to load-/save-methods of the data-objects inside the basic-/custom-functions,
+# the variable-name determines the type of the object (e.g. meeg.fsmri.load_source_space())
+io_call_pattern = re.compile(r'\b(meeg\.fsmri|meeg|fsmri|group)\.(load|save)_(\w+)\(')
+io_obj_types = {'meeg': 'MEEG', 'meeg.fsmri': 'FSMRI', 'fsmri': 'FSMRI', 'group': 'Group'}
+# Methods, which read data saved by another method
+io_aliases = {'info': 'raw'}
+# Entries of the project, which only keep records and don't change the data
+record_attributes = ['plot_files']
+# Parameters read directly from the Parameter-Preset (e.g. meeg.p['lowpass'])
+param_pattern = re.compile(r'\.p\[[\'"](\w+)[\'"]\]')
+# Entries of the project set by a function (e.g. meeg.pr.ica_exclude[meeg.name] = ica.exclude)
+entry_write_pattern = re.compile(r'\.pr\.(\w+)\[[^\]]+\]\s*=(?!=)')
+# How raw-data is loaded for a function (see preload_policy in loading.py)
+preload_modes = ['full', 'memmap', 'lazy']
+# The analysis of the source-code for each function: func_name -> analysis (see _get_function_analysis)
+_function_analysis = dict()
+
+
+def _get_source_calls(func, module, visited):
+    """Get the source of a function and of the module-level helper-functions called from it"""
+    visited.add(func.__name__)
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        return ''
+
+    module_functions = {name: obj for name, obj in vars(module).items()
+                        if inspect.isfunction(obj) and obj.__module__ == module.__name__}
+    for called_name in re.findall(r'\b(\w+)\(', source):
+        if called_name in module_functions and called_name not in visited:
+            source += _get_source_calls(module_functions[called_name], module, visited)
+
+    return source
+
+
+def _get_function_analysis(func_name, main_win):
+    """Get the analysis of the source-code of a function (made once for each function, see clear_function_analysis)
+
+    Returns
+    -------
+    analysis : dict
+        {'func': function, 'source': source-code with helper-functions, 'io': see get_function_io,
+         'param_names': set of parameters (see get_function_parameters),
+         'entry_writes': set of project-entries set by the function (see get_function_entries)}
+    """
+    pkg_name = main_win.pd_funcs.loc[func_name, 'pkg_name']
+    module_name = main_win.pd_funcs.loc[func_name, 'module']
+    module = main_win.all_modules[pkg_name][module_name][0]
+    func = getattr(module, func_name)
+
+    analysis = _function_analysis.get(func_name)
+    # A new analysis if the function was reloaded meanwhile
+    if analysis is None or analysis['func'] is not func:
+        source = _get_source_calls(func, module, set())
+        if source == '':
+            io = None
+        else:
+            io = {'load': set(), 'save': set()}
+            for var_name, mode, data_name in io_call_pattern.findall(source):
+                io[mode].add((io_obj_types[var_name], io_aliases.get(data_name, data_name)))
+        analysis = {'func': func, 'source': source, 'io': io,
+                    'param_names': set(inspect.signature(func).parameters) | set(param_pattern.findall(source)),
+                    'entry_writes': set(entry_write_pattern.findall(source))}
+        _function_analysis[func_name] = analysis
+
+    return analysis
+
+
+def clear_function_analysis():
+    """Clear the analysis of the source-code of the functions (after the modules were loaded or reloaded)"""
+    _function_analysis.clear()
+
+
+def _get_function_source(func_name, main_win):
+    """Get a function and its source-code (with the module-level helper-functions it calls)"""
+    analysis = _get_function_analysis(func_name, main_win)
+
+    return analysis['func'], analysis['source']
+
+
+def get_function_io(func_name, main_win):
+    """Get the data, which a function loads and saves, from its source-code
+
+    Data is identified by the object-type and the name of the load-/save-method without prefix
+    (e.g. ('MEEG', 'epochs') for load_epochs/save_epochs, which are the methods in the io_dict of MEEG).
+
+    Returns
+    -------
+    io : dict
+        {'load': set of (obj_type, data_name), 'save': set of (obj_type, data_name)}
+        or None if the source-code couldn't be inspected
+    """
+    io = _get_function_analysis(func_name, main_win)['io']
+    if io is None:
+        return None
+
+    # The analysis is shared, thus the sets are copied
+    return {'load': set(io['load']), 'save': set(io['save'])}
+
+
+def get_function_preload(func_name, main_win):
+    """Get how the function loads raw-data from the column "preload" of functions.csv (see preload_policy)"""
+    mode = main_win.pd_funcs.loc[func_name, 'preload'] if 'preload' in main_win.pd_funcs.columns else None
+    # Empty cells are read as NaN
+    if isinstance(mode, str) and mode.strip() in preload_modes:
+        return mode.strip()
+
+    return 'full'
+
+
+def _get_data_paths(obj, data_name):
+    """Get the paths for the data (identified like in get_function_io) from the io_dict of obj"""
+    for data_type in obj.io_dict:
+        if obj.io_dict[data_type]['load'] == f'load_{data_name}' \
+                or obj.io_dict[data_type]['save'] == f'save_{data_name}':
+            try:
+                return [p for p in obj._return_path_list(data_type) or list() if p is not None]
+            # Paths may be empty (e.g. when no trials are selected)
+            except IndexError:
+                return list()
+
+    return None
+
+
+def get_object_entries(obj):
+    """Get the entries for a data-object in the dictionaries of the project (e.g. bad-channels, event-id, ica_exclude)
+
+    The entries change the data loaded for the object (e.g. raw.info['bads']) and the results of functions.
+    """
+    return get_project_entries(obj.pr, obj.name)
+
+
+def get_project_entries(pr, obj_name):
+    """Get the entries for the object with obj_name in the dictionaries of the project (see get_object_entries)"""
+    return {attr_name: value[obj_name] for attr_name, value in vars(pr).items()
+            if attr_name not in record_attributes and isinstance(value, dict) and obj_name in value}
+
+
+def get_function_parameters(obj, func_name):
+    """Get the values from the Parameter-Preset, which change the results of a function
+
+    These are the parameters in its signature, those it reads with .p[...] (also in the helper-functions it calls)
+    and those in the column "func_args" of functions.csv.
+    """
+    param_names = set(_get_function_analysis(func_name, obj.mw)['param_names'])
+    critical_params_str = obj.mw.pd_funcs.loc[func_name, 'func_args']
+    if isinstance(critical_params_str, str):
+        param_names |= set(critical_params_str.replace(' ', '').split(','))
+
+    return {p_name: obj.p[p_name] for p_name in sorted(param_names) if p_name in obj.p}
+
+
+def get_function_entries(obj, func_name):
+    """Get the entries for a data-object in the project, which change the results of a function
+
+    Entries the function sets itself are results, not inputs (e.g. ica_exclude set by run_ica).
+    """
+    entries = get_object_entries(obj)
+    if func_name in obj.mw.pd_funcs.index:
+        for attr_name in _get_function_analysis(func_name, obj.mw)['entry_writes']:
+            entries.pop(attr_name, None)
+
+    return entries
+
+
+def _encode_entries(entries):
+    """Encode the values of entries to compare them with the entries from the records"""
+    entries = deepcopy(entries)
+    encode_tuples(entries)
+
+    return {key: json.dumps(value, cls=TypedJSONEncoder, sort_keys=True) for key, value in entries.items()}
+
+
+def _get_data_objects(obj, obj_type):
+    """Get the data-objects of obj_type, from which a function for obj loads or to which it saves"""
+    # Avoid circular import
+    from .loading import MEEG
+
+    if obj_type == 'FSMRI' and isinstance(obj, MEEG):
+        return [obj.fsmri]
+    elif obj_type == 'MEEG' and hasattr(obj, 'group_list'):
+        return [MEEG(name, obj.mw) for name in obj.group_list]
+    return [obj]
+
+
+def _get_existing_path(path):
+    """Get the path of the file on disk (Source-Estimates are saved with the suffixes -lh.stc/-rh.stc)"""
+    for existing_path in [path, path + '-lh.stc']:
+        if isfile(existing_path) or isdir(existing_path):
+            return existing_path
+
+    return None
+
+
+def check_up_to_date(obj, func_name):
+    """Check if the outputs of a function are up to date for the data-object (like make)
+
+    The outputs are up to date, if all files the function saves exist, were saved last by this function with the
+    same parameters (see get_function_parameters) and project-entries (see get_function_entries) as now
+    and if they are newer than all files the function loads. The same parameters and entries are part of the
+    key in the artifact-store (see artifacts.get_step_key).
+
+    Parameters
+    ----------
+    obj : MEEG | FSMRI | Group
+        A Data-Object to get the information needed
+    func_name : str
+        The name of the function
+
+    Returns
+    -------
+    up_to_date : bool
+        True, if the function doesn't need to run again
+    reason : str
+        A description of the outcome
+    """
+    if obj.mw.get_setting('overwrite'):
+        return False, 'Overwrite=True (Settings)'
+
+    io = get_function_io(func_name, obj.mw)
+    if io is None:
+        return False, 'source-code could not be inspected'
+
+    # JSON-files are used by many functions for secondary data (which is not in the io_dict)
+    outputs = [(ot, dn) for ot, dn in io['save'] if dn != 'json']
+    if len(outputs) == 0:
+        return False, 'no outputs to compare'
+
+    parameters = get_function_parameters(obj, func_name)
+
+    output_mtimes = list()
+    for obj_type, data_name in outputs:
+        for data_obj in _get_data_objects(obj, obj_type):
+            paths = _get_data_paths(data_obj, data_name)
+            if not paths:
+                return False, f'no paths for {data_name}'
+            entries = _encode_entries(get_function_entries(data_obj, func_name))
+            for path in paths:
+                existing_path = _get_existing_path(path)
+                if existing_path is None:
+                    return False, f'{path} is missing'
+                file_params = data_obj.get_file_params(path)
+                if file_params.get('FUNCTION') != func_name:
+                    return False, f'{Path(path).name} was not saved by {func_name}'
+                saved_params = file_params['PARAMETERS']
+                for param, value in parameters.items():
+                    if param not in saved_params:
+                        return False, f'{param} is missing in records for {Path(path).name}'
+                    if str(saved_params[param]) != str(value):
+                        return False, f'{param} changed from {saved_params[param]} to {value}'
+                # Records imported from the old File-Parameters have no entries (see import_file_parameters),
+                # they are compared like before by function, parameters and time
+                if file_params.get('ENTRIES') is not None:
+                    saved_entries = _encode_entries(file_params['ENTRIES'])
+                    changed = sorted([key for key in set(entries) | set(saved_entries)
+                                      if entries.get(key) != saved_entries.get(key)])
+                    if len(changed) > 0:
+                        return False, f'{", ".join(changed)} of {data_obj.name} changed'
+                output_mtimes.append(getmtime(existing_path))
+
+    for obj_type, data_name in io['load']:
+        for data_obj in _get_data_objects(obj, obj_type):
+            for path in _get_data_paths(data_obj, data_name) or list():
+                existing_path = _get_existing_path(path)
+                if existing_path is not None and getmtime(existing_path) > min(output_mtimes):
+                    return False, f'{Path(path).name} is newer than the outputs'
+
+    return True, f'outputs of {func_name} are up to date'
+
+
 def check_kwargs(kwargs, function):
     kwargs = kwargs.copy()
 
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import csv
+from glob import glob
+from os.path import join
+from statistics import median
+
+from .memory import MemoryModel
+from .pipeline_utils import check_up_to_date, get_function_io
+
+
+def load_timing_history(main_win):
+    """Get (duration, bytes_read) of the finished steps of each function from the run-reports of the project
+
+    Returns
+    -------
+    history : dict
+        function_name -> list of tuples (duration in seconds, bytes read from disk)
+    """
+    history = dict()
+    for report_path in sorted(glob(join(main_win.pr.pscripts_path, f'run_report_{main_win.pr.name}_*.csv'))):
+        with open(report_path, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                if row.get('status') != 'finished' or not row.get('duration'):
+                    continue
+                history.setdefault(row['function'], list()).append((float(row['duration']),
+                                                                    int(float(row['bytes_read'] or 0))))
+
+    return history
+
+
+class RunPlanner:
+    """Plan a run without executing it (dry-run)
+
+    For each step it is determined, if it would be skipped as up to date (with the setting "skip_up_to_date"),
+    and the runtime and peak memory are estimated from the run-reports of past runs
+    and the size of the input-files (from the provenance-records).
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    """
+
+    def __init__(self, main_win):
+        self.mw = main_win
+        self.memory_model = MemoryModel(main_win)
+        self.history = load_timing_history(main_win)
+
+    def estimate_runtime(self, func_name, input_size):
+        """Estimate the runtime of a step in seconds (None if the function never finished before)
+
+        If past steps read data, the runtime is scaled by the input-size with the median of seconds per byte,
+        otherwise the median of the past runtimes is taken.
+        """
+        timings = self.history.get(func_name)
+        if not timings:
+            return None
+        rates = [duration / bytes_read for duration, bytes_read in timings if bytes_read > 0]
+        if input_size and rates:
+            return median(rates) * input_size
+
+        return median([duration for duration, _ in timings])
+
+    def _get_data_names(self, obj_name, obj_type, data_obj_type):
+        """Get the names of the objects, whose data of data_obj_type a step of an object uses"""
+        if data_obj_type == obj_type:
+            return [obj_name]
+        elif data_obj_type == 'FSMRI' and obj_type == 'MEEG':
+            return [self.mw.pr.meeg_to_fsmri.get(obj_name)]
+        elif data_obj_type == 'MEEG' and obj_type == 'Group':
+            return self.mw.pr.all_groups.get(obj_name, list())
+
+        return list()
+
+    def plan(self, all_objects, all_steps):
+        """Make the plan for the steps (as returned from get_run_steps)
+
+        A step is only planned as skipped, if none of its inputs are rewritten by a step planned before.
+
+        Returns
+        -------
+        plan : dict
+            The planned steps (with object, function, action "run"/"skip", reason, input_size,
+            runtime and peak_memory) and the totals
+        """
+        skip_up_to_date = self.mw.get_setting('skip_up_to_date')
+        # Data, which will be rewritten by planned steps: (object_type, object_name, data_name)
+        rewritten = set()
+        steps = list()
+        for obj_name, func_name in all_steps:
+            obj_type = all_objects[obj_name]['type']
+            step = {'object': obj_name, 'function': func_name, 'action': 'run', 'reason': '',
+                    'input_size': None, 'runtime': None, 'peak_memory': None}
+            io = get_function_io(func_name, self.mw)
+
+            if obj_type in ['MEEG', 'FSMRI', 'Group']:
+                obj = self.memory_model.get_object(obj_name, obj_type)
+                stale_inputs = list()
+                if io is not None:
+                    stale_inputs = [data_name for data_obj_type, data_name in io['load']
+                                    for name in self._get_data_names(obj_name, obj_type, data_obj_type)
+                                    if (data_obj_type, name, data_name) in rewritten]
+                if stale_inputs:
+                    step['reason'] = f'{", ".join(sorted(set(stale_inputs)))} will be rewritten before'
+                else:
+                    try:
+                        up_to_date, step['reason'] = check_up_to_date(obj, func_name)
+                    except Exception as err:
+                        up_to_date, step['reason'] = False, f'up-to-date-check failed: {err}'
+                    if up_to_date and skip_up_to_date:
+                        step['action'] = 'skip'
+                    elif up_to_date:
+                        step['reason'] += ', but skip_up_to_date is off'
+                # e.g. a file can't be read or its paths can't be determined
+                try:
+                    step['input_size'] = self.memory_model.get_input_size(obj_name, obj_type, func_name)
+                except Exception as err:
+                    step['reason'] = ', '.join([r for r in [step['reason'], f'input-size unknown: {err}'] if r])
+
+            if step['action'] == 'run':
+                step['runtime'] = self.estimate_runtime(func_name, step['input_size'])
+                step['peak_memory'] = self.memory_model.estimate(func_name, step['input_size']) or None
+                if io is not None:
+                    for data_obj_type, data_name in io['save']:
+                        for name in self._get_data_names(obj_name, obj_type, data_obj_type):
+                            rewritten.add((data_obj_type, name, data_name))
+            steps.append(step)
+
+        run_steps = [s for s in steps if s['action'] == 'run']
+        peaks = [s['peak_memory'] for s in run_steps if s['peak_memory'] is not None]
+        totals = {'n_steps': len(steps),
+                  'n_run': len(run_steps),
+                  'n_skip': len(steps) - len(run_steps),
+                  'n_unknown': len([s for s in run_steps if s['runtime'] is None]),
+                  'runtime': sum([s['runtime'] for s in run_steps if s['runtime'] is not None]),
+                  'peak_memory': max(peaks) if peaks else None}
+
+        return {'steps': steps, 'totals': totals}
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '?'
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f'{hours}h {minutes:02d}m'
+    elif minutes:
+        return f'{minutes}m {seconds:02d}s'
+
+    return f'{seconds}s'
+
+
+def get_plan_table(plan):
+    """Get the plan as a text-table with the totals"""
+    header = f'{"Object":<25}{"Function":<30}{"Action":<8}{"Input [MB]":>12}{"Runtime":>10}{"Peak [MB]":>11}  Reason'
+    lines = [header, '-' * len(header)]
+    for s in plan['steps']:
+        if s['input_size'] is None:
+            size_str = 'unknown'
+        else:
+            size_str = f'{s["input_size"] / 1024 ** 2:.1f}' if s['input_size'] else '-'
+        runtime_str = format_duration(s['runtime']) if s['action'] == 'run' else '-'
+        peak_str = f'{s["peak_memory"] / 1024 ** 2:.0f}' if s['peak_memory'] else '-'
+        lines.append(f'{s["object"]:<25}{s["function"]:<30}{s["action"]:<8}{size_str:>12}{runtime_str:>10}'
+                     f'{peak_str:>11}  {s["reason"]}')
+
+    t = plan['totals']
+    peak_str = f'{t["peak_memory"] / 1024 ** 3:.2f} GB' if t['peak_memory'] else 'unknown'
+    lines.append('-' * len(header))
+    lines.append(f'{t["n_steps"]} steps: {t["n_run"]} to run, {t["n_skip"]} to skip')
+    lines.append(f'Estimated runtime: {format_duration(t["runtime"])}'
+                 + (f' (+ {t["n_unknown"]} steps without past runs)' if t['n_unknown'] else ''))
+    lines.append(f'Estimated peak memory of a step: {peak_str}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import logging
+import threading
+
+from .loading import Group, MEEG, fsmri_registry, preload_loads
+from .memory import get_file_size
+from .pipeline_utils import _get_data_paths, get_function_io, get_function_preload
+
+
+class Prefetcher:
+    """Load the input-data of the next object in a background-thread, while the current step computes
+
+    Only the data of the next object, which its first function loads, is read into the data_dict of the object.
+    Because functions may change loaded data in place, the prefetched data is only used by this first function
+    (see release), later functions get it from the data-cache, if it fits into its budget.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    memory_cap : int
+        Don't prefetch if the input-files are bigger than this (in bytes)
+    """
+
+    def __init__(self, main_win, memory_cap):
+        self.mw = main_win
+        self.memory_cap = memory_cap
+
+        self.obj = None
+        self.func_name = None
+        self.data_types = list()
+        self._thread = None
+
+    def prefetch(self, obj_name, obj_type, func_name, fsmri=None):
+        """Start prefetching the data, which func_name loads, for a new object in the background"""
+        if self.obj is not None and self.obj.name == obj_name:
+            return
+        self.wait()
+
+        io = get_function_io(func_name, self.mw)
+        if io is None or obj_type not in ['MEEG', 'FSMRI', 'Group']:
+            self.obj = None
+            return
+
+        if obj_type == 'MEEG':
+            self.obj = MEEG(obj_name, self.mw, fsmri=fsmri)
+        elif obj_type == 'FSMRI':
+            self.obj = fsmri_registry.get(obj_name, self.mw)
+        else:
+            self.obj = Group(obj_name, self.mw)
+        self.func_name = func_name
+
+        # Get the data-types from the io_dict of the object (only own data), which fit into the memory-cap
+        self.data_types = list()
+        size = 0
+        # Raw-data isn't prefetched for functions, which don't load it fully (see preload_policy)
+        full_preload = get_function_preload(func_name, self.mw) == 'full'
+        for data_obj_type, data_name in io['load']:
+            if data_obj_type != obj_type or (not full_preload and f'load_{data_name}' in preload_loads):
+                continue
+            for data_type in self.obj.io_dict:
+                if self.obj.io_dict[data_type]['load'] == f'load_{data_name}':
+                    paths = _get_data_paths(self.obj, data_name) or list()
+                    data_size = sum([get_file_size(self.obj, p) for p in paths])
+                    # Only data, which exists, can be loaded
+                    if 0 < data_size and size + data_size <= self.memory_cap:
+                        self.data_types.append(data_type)
+                        size += data_size
+
+        if len(self.data_types) > 0:
+            self._thread = threading.Thread(target=self._load, args=(self.obj, list(self.data_types)), daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _load(obj, data_types):
+        for data_type in data_types:
+            try:
+                data = getattr(obj, obj.io_dict[data_type]['load'])()
+            # The function will show the error when it loads the data itself
+            except Exception as err:
+                logging.warning(f'Prefetching {data_type} for {obj.name} failed: {err}')
+            else:
+                obj.data_dict[data_type] = data
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_object(self, obj_name):
+        """Get the prefetched object (after its data is loaded) or None, if obj_name was not prefetched"""
+        if self.obj is None or self.obj.name != obj_name:
+            return None
+        self.wait()
+
+        return self.obj
+
+    def release(self, obj_name, func_name):
+        """Remove the prefetched data after the function it was prefetched for ran"""
+        if self.obj is None or self.obj.name != obj_name or self.func_name != func_name:
+            return
+        for data_type in self.data_types:
+            self.obj.data_dict.pop(data_type, None)
+        self.obj = None
+        self.data_types = list()
+
+
+def get_next_object_step(all_steps, current_name):
+    """Get the first step of the next object in all_steps (or None)"""
+    for obj_name, func_name in all_steps:
+        if obj_name != current_name:
+            return obj_name, func_name
+
+    return None
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+import csv
+import json
+import threading
+from datetime import datetime
+from os.path import getsize, isfile, join
+from time import perf_counter, process_time, thread_time
+
+from .memory import PeakMemoryMonitor
+
+# The IO-statistics of the step, which is profiled in the current thread
+# (loads in other threads, e.g. from the Prefetcher, are not counted)
+_local = threading.local()
+
+# The clocks for the CPU-time of a step
+cpu_clocks = {'process': process_time, 'thread': thread_time}
+
+# The columns of the run-report
+report_columns = ['object', 'function', 'status', 'duration', 'cpu_time', 'cpu_clock', 'peak_memory', 'peak_rss',
+                  'bytes_read', 'bytes_written', 'n_loads', 'n_cached_loads', 'n_saves']
+
+
+def is_profiling():
+    """Check if a step is profiled in the current thread"""
+    return getattr(_local, 'stats', None) is not None
+
+
+def get_paths_size(paths):
+    """Get the size of the files on disk (Source-Estimates are saved with the suffixes -lh.stc/-rh.stc/-vl.stc)"""
+    size = 0
+    for path in [p for p in paths if p is not None]:
+        for existing_path in [path, path + '-lh.stc', path + '-rh.stc', path + '-vl.stc']:
+            if isfile(existing_path):
+                size += getsize(existing_path)
+
+    return size
+
+
+def record_io(kind, n_bytes=0):
+    """Record a load from disk ("load"), a load from memory ("cached") or a save ("save")"""
+    if not is_profiling():
+        return
+    if kind == 'load':
+        _local.stats['n_loads'] += 1
+        _local.stats['bytes_read'] += n_bytes
+    elif kind == 'cached':
+        _local.stats['n_cached_loads'] += 1
+    elif kind == 'save':
+        _local.stats['n_saves'] += 1
+        _local.stats['bytes_written'] += n_bytes
+
+
+class StepProfile:
+    """Measure wall-time, CPU-time, memory and IO of a step
+
+    Use as context-manager in the thread, which runs the step, or call the step with run.
+
+    Parameters
+    ----------
+    cpu_clock : str
+        "process" to measure the CPU-time of all threads of the process including the threads started
+        by the function (e.g. BLAS or n_jobs), where the step owns the process (e.g. in a worker-process).
+        "thread" to measure the CPU-time of this thread only, where other threads of the process
+        would be counted too (e.g. the GUI). CAVE: The threads started by the function are not counted then.
+    """
+
+    def __init__(self, cpu_clock='thread'):
+        self.monitor = PeakMemoryMonitor()
+        self.cpu_clock = cpu_clocks[cpu_clock]
+        self.stats = {'duration': 0, 'cpu_time': 0, 'cpu_clock': cpu_clock, 'bytes_read': 0, 'bytes_written': 0,
+                      'n_loads': 0, 'n_cached_loads': 0, 'n_saves': 0}
+        self._start_wall = None
+        self._start_cpu = None
+
+    def __enter__(self):
+        _local.stats = self.stats
+        self.monitor.__enter__()
+        self._start_wall = perf_counter()
+        self._start_cpu = self.cpu_clock()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats['duration'] = perf_counter() - self._start_wall
+        self.stats['cpu_time'] = self.cpu_clock() - self._start_cpu
+        self.monitor.__exit__(exc_type, exc_val, exc_tb)
+        _local.stats = None
+
+    def run(self, function, *args, **kwargs):
+        with self:
+            return function(*args, **kwargs)
+
+    def get_result(self):
+        """Get the measurements (the memory is None without psutil)"""
+        result = dict(self.stats)
+        # The increase of memory at the peak and the peak of the process
+        result['peak_memory'] = self.monitor.peak_increase
+        result['peak_rss'] = self.monitor.peak_memory
+
+        return result
+
+
+class RunReport:
+    """A report of the measurements of the steps of a run (see StepProfile)
+
+    Parameters
+    ----------
+    results : list
+        The results of the steps (see StepRunner.run_step)
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def save(self, main_win):
+        """Save the steps as CSV and the summary per function as JSON into _pipeline_scripts
+
+        Returns
+        -------
+        report_path : str
+            The path of the CSV-file
+        """
+        time_str = datetime.now().strftime('%Y%m%d-%H%M%S')
+        report_path = join(main_win.pr.pscripts_path, f'run_report_{main_win.pr.name}_{time_str}.csv')
+        with open(report_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=report_columns, extrasaction='ignore')
+            writer.writeheader()
+            for result in self.results:
+                writer.writerow(result)
+        with open(report_path.replace('.csv', '.json'), 'w') as file:
+            json.dump(self.get_function_summary(), file, indent=4)
+
+        return report_path
+
+    def get_function_summary(self):
+        """Sum up the measurements for each function (sorted by the total wall-time)"""
+        summary = dict()
+        for result in self.results:
+            func_summary = summary.setdefault(result['function'], {'n_steps': 0, 'duration': 0, 'cpu_time': 0,
+                                                                   'cpu_clock': None, 'peak_rss': None,
+                                                                   'bytes_read': 0, 'bytes_written': 0,
+                                                                   'n_cached_loads': 0})
+            func_summary['n_steps'] += 1
+            # Steps from the GUI and from worker-processes are measured with different clocks
+            cpu_clock = result.get('cpu_clock')
+            if cpu_clock is not None:
+                if func_summary['cpu_clock'] in [None, cpu_clock]:
+                    func_summary['cpu_clock'] = cpu_clock
+                else:
+                    func_summary['cpu_clock'] = 'mixed'
+            for key in ['duration', 'cpu_time', 'bytes_read', 'bytes_written', 'n_cached_loads']:
+                func_summary[key] += result.get(key) or 0
+            if result.get('peak_rss') is not None:
+                func_summary['peak_rss'] = max(func_summary['peak_rss'] or 0, result['peak_rss'])
+
+        return dict(sorted(summary.items(), key=lambda item: item[1]['duration'], reverse=True))
+
+    def get_table(self):
+        """Get the summary per function as a text-table (with the clock of the CPU-time, see StepProfile)"""
+        header = f'{"Function":<35}{"Steps":>6}{"Wall [s]":>11}{"CPU [s]":>11}{"CPU-Clock":>11}{"Peak [MB]":>11}' \
+                 f'{"Read [MB]":>11}{"Written [MB]":>14}{"Cached":>8}'
+        lines = [header, '-' * len(header)]
+        for func_name, s in self.get_function_summary().items():
+            peak_str = f'{s["peak_rss"] / 1024 ** 2:.0f}' if s['peak_rss'] is not None else '-'
+            lines.append(f'{func_name:<35}{s["n_steps"]:>6}{s["duration"]:>11.1f}{s["cpu_time"]:>11.1f}'
+                         f'{s["cpu_clock"] or "-":>11}'
+                         f'{peak_str:>11}{s["bytes_read"] / 1024 ** 2:>11.1f}'
+                         f'{s["bytes_written"] / 1024 ** 2:>14.1f}{s["n_cached_loads"]:>8}')
+
+        return '\n'.join(lines)
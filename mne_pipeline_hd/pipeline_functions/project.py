@@ -15,12 +15,13 @@ import os
 import sys
 from ast import literal_eval
 from copy import deepcopy
-from os import listdir, makedirs
+from os import listdir, makedirs, rename
 from os.path import exists, isfile, join
 
 import numpy as np
 
 from .pipeline_utils import TypedJSONEncoder, encode_tuples, type_json_hook
+from .provenance import ProvenanceStore
 
 
 class Project:
@@ -98,8 +99,6 @@ class Project:
         self.parameters = dict()
         # Parameter-Preset
         self.p_preset = 'Default'
-        # Stores parameters for each file saved to disk from the current run (know, what you did to your data)
-        self.file_parameters = dict()
 
         # Attributes, which have their own special function for loading
         self.special_loads = ['parameters', 'p_preset']
@@ -127,7 +126,9 @@ class Project:
         self.add_kwargs_path = join(self.pscripts_path, f'additional_kwargs_{self.name}.json')
         self.parameters_path = join(self.pscripts_path, f'parameters_{self.name}.json')
         self.sel_p_preset_path = join(self.pscripts_path, f'sel_p_preset_{self.name}.json')
-        self.file_parameters_path = join(self.pscripts_path, f'file_parameters_{self.name}.json')
+        # Stores the function and parameters for each file saved to disk (know, what you did to your data)
+        self.provenance_path = join(self.pscripts_path, f'provenance_{self.name}.db')
+        self.provenance = ProvenanceStore(self.provenance_path)
 
         # Map the paths to their attribute in the Project-Class
         self.path_to_attribute = {self.all_meeg_path: 'all_meeg',
@@ -147,8 +148,7 @@ class Project:
                                   self.sel_functions_path: 'sel_functions',
                                   self.add_kwargs_path: 'add_kwargs',
                                   self.parameters_path: 'parameters',
-                                  self.sel_p_preset_path: 'p_preset',
-                                  self.file_parameters_path: 'file_parameters'}
+                                  self.sel_p_preset_path: 'p_preset'}
 
     def set_logging(self):
         # Set logging
@@ -260,6 +260,23 @@ class Project:
         self.load_lists()
         self.load_parameters()
         self.load_last_p_preset()
+        self.import_file_parameters()
+
+    def import_file_parameters(self):
+        """Import the File-Parameters from the old JSON-file into the provenance-database (transition, 16.10.2026)"""
+        file_parameters_path = join(self.pscripts_path, f'file_parameters_{self.name}.json')
+        if not isfile(file_parameters_path):
+            return
+        try:
+            with open(file_parameters_path, 'r') as file:
+                file_parameters = json.load(file, object_hook=type_json_hook)
+        except json.JSONDecodeError:
+            file_parameters = dict()
+        if file_parameters:
+            print(f'Importing File-Parameters into {self.provenance_path}')
+            self.provenance.import_file_parameters(file_parameters)
+        # Keep the old file, but don't import it again
+        rename(file_parameters_path, file_parameters_path.replace('.json', '_imported.json'))
 
     def save(self):
         for path in self.path_to_attribute:
@@ -293,10 +310,7 @@ class Project:
         self.save()
 
     def clean_file_parameters(self):
-        remove_keys = list()
-        for key in [k for k in self.file_parameters
-                    if k not in self.all_meeg + self.all_erm + self.all_fsmri + list(self.all_groups.keys())]:
-            remove_keys.append(key)
-        for remove_key in remove_keys:
+        removed = self.provenance.keep_objects(self.all_meeg + self.all_erm + self.all_fsmri
+                                               + list(self.all_groups.keys()))
+        for remove_key in removed:
             print(f'Removed {remove_key} from File-Parameters')
-            self.file_parameters.pop(remove_key)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+The provenance of the files saved by the pipeline (know, what you did to your data)
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from copy import deepcopy
+from datetime import datetime
+
+from .pipeline_utils import TypedJSONEncoder, datetime_format, encode_tuples, type_json_hook
+
+# The keys of the old file_parameters_<project>.json, which are not parameters
+record_keys = ['FUNCTION', 'NAME', 'PATH', 'TIME', 'SIZE', 'P_PRESET']
+
+
+class ProvenanceStore:
+    """Records of the saved files in a SQLite-database
+
+    Each save of a file adds a record with the object, the file-name and path, the function which saved it,
+    the Parameter-Preset, the time, the size and the entries for the object in the project (e.g. bad-channels).
+    The parameters are stored once for each distinct parameter-set and referenced from the records by their hash.
+    Each thread keeps its own connection to the database (e.g. the background-writer and the thread of the run).
+
+    Parameters
+    ----------
+    db_path : str
+        The path to the database-file (created if it doesn't exist)
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        connection = self.connect()
+        connection.executescript('CREATE TABLE IF NOT EXISTS parameter_sets ('
+                                 'hash TEXT PRIMARY KEY, '
+                                 'parameters TEXT NOT NULL);'
+                                 'CREATE TABLE IF NOT EXISTS records ('
+                                 'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                 'object TEXT NOT NULL, '
+                                 'file_name TEXT NOT NULL, '
+                                 'path TEXT, '
+                                 'function TEXT, '
+                                 'p_preset TEXT, '
+                                 'param_hash TEXT REFERENCES parameter_sets (hash), '
+                                 'time TEXT, '
+                                 'size INTEGER, '
+                                 'entries TEXT);'
+                                 'CREATE INDEX IF NOT EXISTS records_file ON records (object, file_name, id);'
+                                 'CREATE INDEX IF NOT EXISTS records_function ON records (function);'
+                                 'CREATE INDEX IF NOT EXISTS records_param_hash ON records (param_hash);')
+        # Databases created before the entries were recorded
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(records)')]
+        if 'entries' not in columns:
+            connection.execute('ALTER TABLE records ADD COLUMN entries TEXT')
+
+    def connect(self):
+        """Get the connection of this thread (opened on first use)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Parallel processes and the background-writer record to the same file, wait for their locks
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+
+        return connection
+
+    @staticmethod
+    def _encode_parameters(parameters):
+        # Make sure the tuples are encoded correctly
+        parameters = deepcopy(parameters)
+        encode_tuples(parameters)
+        param_str = json.dumps(parameters, cls=TypedJSONEncoder, sort_keys=True)
+
+        return hashlib.sha1(param_str.encode('utf-8')).hexdigest(), param_str
+
+    @staticmethod
+    def _decode(value_str):
+        return json.loads(value_str, object_hook=type_json_hook) if value_str else None
+
+    def record(self, obj_name, file_name, path, func_name, p_preset, parameters, size, time=None, entries=None):
+        """Add a record for a saved file
+
+        Parameters
+        ----------
+        obj_name : str
+            The name of the data-object (e.g. of MEEG)
+        file_name : str
+            The name of the file (the key for the records of an object)
+        path : str
+            The path of the file
+        func_name : str
+            The name of the function, which saved the file
+        p_preset : str
+            The Parameter-Preset
+        parameters : dict
+            The parameters of the Parameter-Preset
+        size : int
+            The size of the file in bytes
+        time : datetime | None
+            The time of the save (None for now)
+        entries : dict | None
+            The entries for the object in the project, which were used by the function (see get_function_entries)
+        """
+        self._record_many([(obj_name, file_name, path, func_name, p_preset, parameters, size,
+                            time or datetime.now(), entries)])
+
+    def _record_many(self, records):
+        # All records in one transaction, unknown values (None) are stored as NULL
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for obj_name, file_name, path, func_name, p_preset, parameters, size, time, entries in records:
+                if parameters is not None:
+                    param_hash, param_str = self._encode_parameters(parameters)
+                    connection.execute('INSERT OR IGNORE INTO parameter_sets (hash, parameters) VALUES (?, ?)',
+                                       (param_hash, param_str))
+                else:
+                    param_hash = None
+                time = time.strftime(datetime_format) if time is not None else None
+                entries_str = self._encode_parameters(entries)[1] if entries is not None else None
+                connection.execute('INSERT INTO records (object, file_name, path, function, p_preset, '
+                                   'param_hash, time, size, entries) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (obj_name, file_name, path, func_name, p_preset, param_hash, time, size,
+                                    entries_str))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def _get_record(row):
+        return {'ID': row['id'], 'NAME': row['object'], 'FILE_NAME': row['file_name'], 'PATH': row['path'],
+                'FUNCTION': row['function'], 'P_PRESET': row['p_preset'], 'PARAM_HASH': row['param_hash'],
+                'TIME': datetime.strptime(row['time'], datetime_format) if row['time'] else None,
+                'SIZE': row['size'], 'ENTRIES': ProvenanceStore._decode(row['entries'])}
+
+    def get_latest(self, obj_name, file_name):
+        """Get the last record for a file with its parameters (in "PARAMETERS") or None if it wasn't saved yet"""
+        connection = self.connect()
+        row = connection.execute('SELECT records.*, parameter_sets.parameters FROM records '
+                                 'LEFT JOIN parameter_sets ON records.param_hash = parameter_sets.hash '
+                                 'WHERE object = ? AND file_name = ? ORDER BY id DESC LIMIT 1',
+                                 (obj_name, file_name)).fetchone()
+        if row is None:
+            return None
+        record = self._get_record(row)
+        record['PARAMETERS'] = self._decode(row['parameters']) or dict()
+
+        return record
+
+    def get_history(self, obj_name=None, file_name=None, func_name=None, p_preset=None, param_hash=None):
+        """Get the records (oldest first) matching all given arguments (without the parameters, see get_parameters)
+
+        Returns
+        -------
+        records : list
+            A dictionary for each record with "NAME", "FILE_NAME", "PATH", "FUNCTION", "P_PRESET", "PARAM_HASH",
+            "TIME", "SIZE" and "ENTRIES"
+        """
+        conditions = {'object': obj_name, 'file_name': file_name, 'function': func_name,
+                      'p_preset': p_preset, 'param_hash': param_hash}
+        conditions = {column: value for column, value in conditions.items() if value is not None}
+        query = 'SELECT * FROM records'
+        if len(conditions) > 0:
+            query += ' WHERE ' + ' AND '.join([f'{column} = ?' for column in conditions])
+        connection = self.connect()
+        rows = connection.execute(query + ' ORDER BY id', tuple(conditions.values())).fetchall()
+
+        return [self._get_record(row) for row in rows]
+
+    def get_parameters(self, param_hash):
+        """Get the parameter-set for a hash from the records (None if it doesn't exist)"""
+        connection = self.connect()
+        row = connection.execute('SELECT parameters FROM parameter_sets WHERE hash = ?', (param_hash,)).fetchone()
+
+        return self._decode(row[0]) if row else None
+
+    def remove(self, obj_name, file_name=None):
+        """Remove the records for an object (or only for one of its files)"""
+        connection = self.connect()
+        if file_name is None:
+            connection.execute('DELETE FROM records WHERE object = ?', (obj_name,))
+        else:
+            connection.execute('DELETE FROM records WHERE object = ? AND file_name = ?', (obj_name, file_name))
+        self._remove_unused_parameters(connection)
+
+    def keep_objects(self, obj_names):
+        """Remove the records of all objects, which are not in obj_names
+
+        Returns
+        -------
+        removed : list
+            The names of the removed objects
+        """
+        connection = self.connect()
+        recorded = [row[0] for row in connection.execute('SELECT DISTINCT object FROM records')]
+        removed = [obj_name for obj_name in recorded if obj_name not in obj_names]
+        connection.executemany('DELETE FROM records WHERE object = ?', [(obj_name,) for obj_name in removed])
+        self._remove_unused_parameters(connection)
+
+        return removed
+
+    @staticmethod
+    def _remove_unused_parameters(connection):
+        connection.execute('DELETE FROM parameter_sets WHERE hash NOT IN '
+                           '(SELECT DISTINCT param_hash FROM records WHERE param_hash IS NOT NULL)')
+
+    def import_file_parameters(self, file_parameters):
+        """Import the records from the old file_parameters_<project>.json
+
+        Parameters
+        ----------
+        file_parameters : dict
+            {object-name: {file-name: {"FUNCTION": list, "TIME": list, "SIZE", "PATH", "P_PRESET", *parameters}}}
+
+        The JSON-file kept only the function and the time of earlier saves, thus only the record of the last save
+        gets the path, the Parameter-Preset, the size and the parameters, the other fields stay empty (NULL).
+        """
+        records = list()
+        for obj_name, obj_file_params in file_parameters.items():
+            for file_name, file_params in obj_file_params.items():
+                functions = file_params.get('FUNCTION') or [None]
+                times = file_params.get('TIME') or [None]
+                # The lists were appended together on each save
+                history = list(zip(functions, times))
+                for func_name, time in history[:-1]:
+                    records.append((obj_name, file_name, None, func_name, None, None, None,
+                                    time if isinstance(time, datetime) else None, None))
+                func_name, time = history[-1]
+                parameters = {key: value for key, value in file_params.items() if key not in record_keys}
+                records.append((obj_name, file_name, file_params.get('PATH'), func_name, file_params.get('P_PRESET'),
+                                parameters or None, file_params.get('SIZE'),
+                                time if isinstance(time, datetime) else None, None))
+        self._record_many(records)
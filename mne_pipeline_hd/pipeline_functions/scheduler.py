@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+"""
+from collections import OrderedDict
+
+import pandas as pd
+
+from .parallel import ParallelRunner
+from .pipeline_utils import get_function_io
+
+
+def get_declared_dependencies(func_name, main_win):
+    """Get the functions declared in the column "dependencies" of functions.csv"""
+    dependencies = main_win.pd_funcs.loc[func_name, 'dependencies']
+    if pd.isna(dependencies) or str(dependencies).strip() == '':
+        return list()
+
+    return [d.strip() for d in str(dependencies).split(',') if d.strip() != '']
+
+
+class StepGraph:
+    """A directed acyclic graph of the steps (object_name, function_name) of a run
+
+    The edges are derived from the load-/save-calls of the functions (reading after writing, writing after reading
+    and writing after writing the same data of the same object like in a sequential run)
+    and from the declared dependencies in functions.csv.
+    Functions, whose source can't be inspected or in whose source no load-/save-calls are found
+    (e.g. when the data is loaded through another variable-name or by a helper-function of another module),
+    are executed in order with all steps of their object, unless their dependencies are declared.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    all_objects : OrderedDict
+        The objects as returned from get_run_steps
+    steps : list
+        The steps as returned from get_run_steps (without steps of "Other")
+    """
+
+    def __init__(self, main_win, all_objects, steps):
+        self.mw = main_win
+        self.all_objects = all_objects
+        self.steps = list(steps)
+        # The predecessors for each step
+        self.predecessors = OrderedDict([(step, set()) for step in self.steps])
+
+        self.function_io = dict()
+        for func_name in set([s[1] for s in self.steps]):
+            self.function_io[func_name] = get_function_io(func_name, self.mw)
+
+        # The last step, which saved the data for an object: (object_name, data_name) -> step
+        self.last_writer = dict()
+        # The steps, which loaded the data since it was saved: (object_name, data_name) -> [steps]
+        self.readers = dict()
+        # The last step of a function without inspectable source or io for each object
+        self.last_barrier = dict()
+        self.object_steps = dict()
+
+        self.build()
+
+    def get_data_objects(self, obj_name, obj_type):
+        """Get the object-names, which hold the data of obj_type, for an object"""
+        own_type = self.all_objects[obj_name]['type']
+        if obj_type == own_type:
+            return [obj_name]
+        elif own_type == 'MEEG' and obj_type == 'FSMRI':
+            fsmri = self.mw.pr.meeg_to_fsmri.get(obj_name)
+            return [fsmri] if fsmri else list()
+        elif own_type == 'Group' and obj_type == 'MEEG':
+            return list(self.mw.pr.all_groups.get(obj_name, list()))
+
+        return list()
+
+    def add_edge(self, predecessor, step):
+        if predecessor is not None and predecessor != step and predecessor in self.predecessors:
+            self.predecessors[step].add(predecessor)
+
+    def build(self):
+        # Steps are in the order of the sequential run, thus every edge points forward
+        for step in self.steps:
+            obj_name, func_name = step
+            io = self.function_io[func_name]
+            declared_dependencies = get_declared_dependencies(func_name, self.mw)
+
+            # Keep the order of the sequential run for functions, whose source can't be inspected
+            # or whose data can't be found in the source (unless their dependencies are declared)
+            if io is None or (len(io['load']) == 0 and len(io['save']) == 0 and len(declared_dependencies) == 0):
+                for prev_step in self.object_steps.get(obj_name, list()):
+                    self.add_edge(prev_step, step)
+                self.last_barrier[obj_name] = step
+            else:
+                self.add_edge(self.last_barrier.get(obj_name), step)
+                for obj_type, data_name in io['load']:
+                    for data_obj in self.get_data_objects(obj_name, obj_type):
+                        key = (data_obj, data_name)
+                        # Read after write
+                        self.add_edge(self.last_writer.get(key), step)
+                        self.readers.setdefault(key, list()).append(step)
+                for obj_type, data_name in io['save']:
+                    for data_obj in self.get_data_objects(obj_name, obj_type):
+                        key = (data_obj, data_name)
+                        # Write after write
+                        self.add_edge(self.last_writer.get(key), step)
+                        # Write after read
+                        for reader in self.readers.get(key, list()):
+                            self.add_edge(reader, step)
+                        self.last_writer[key] = step
+                        self.readers[key] = list()
+
+            # Declared dependencies
+            for dependency in declared_dependencies:
+                if dependency not in self.mw.pd_funcs.index:
+                    continue
+                dep_type = self.mw.pd_funcs.loc[dependency, 'target']
+                for data_obj in self.get_data_objects(obj_name, dep_type):
+                    self.add_edge((data_obj, dependency), step)
+
+            self.object_steps.setdefault(obj_name, list()).append(step)
+
+
+class DAGRunner(ParallelRunner):
+    """Run each step in a pool of processes as soon as the steps it depends on are finished
+
+    (see StepGraph for how the dependencies are determined)
+    e.g. create_forward_solution for a MEEG-object starts as soon as prepare_bem and setup_src
+    for its FSMRI-object are finished and not after all steps of all FSMRI-objects.
+
+    Parameters
+    ----------
+    main_win : MainWindow | Controller
+        The instance holding the project and the function-definitions (pd_funcs)
+    all_objects : OrderedDict
+        The objects as returned from get_run_steps
+    all_steps : list
+        The steps as returned from get_run_steps
+    n_processes : int | None
+        The number of worker-processes (None for the number of cores)
+    journal : RunJournal | None
+        Record the start and the result of each step in this journal (from the main-process)
+    memory_budget : int | None
+        Only start steps while the sum of their estimated peak memory (in bytes) fits into this budget
+        (see MemoryModel). If None, the memory is not considered.
+    executor : concurrent.futures.Executor | None
+        Run the jobs with this executor (e.g. a QueueExecutor for a cluster),
+        if None, they run in a local pool of n_processes processes.
+    """
+
+    def get_jobs(self):
+        """Get one job for each step"""
+        return OrderedDict([(step, (step[0], [step[1]])) for step in self.all_steps if step not in self.other_steps])
+
+    def get_dependencies(self):
+        self.graph = StepGraph(self.mw, self.all_objects, list(self.jobs))
+
+        return self.graph.predecessors
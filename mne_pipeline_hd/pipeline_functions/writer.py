@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Write-behind saving of data in a background-thread (used by save_decorator with the setting "async_save")
+"""
+import logging
+import queue
+import sys
+import threading
+import traceback
+
+
+class AsyncWriter:
+    """Write data in a background-thread, while the next functions already compute
+
+    Loading data, which is still written, waits for the write (see wait_for)
+    and at the end of a run all writes are waited for (see flush).
+
+    Parameters
+    ----------
+    max_pending : int
+        The maximum number of writes in the queue, further saves wait until a write finished
+        (limits the memory of the data waiting to be written)
+    """
+
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        # The number of pending writes for each path
+        self._pending = dict()
+        self._condition = threading.Condition()
+        self._thread = None
+        # Tuples of (paths, error-message) of failed writes
+        self.errors = list()
+
+    def submit(self, paths, write_func, description):
+        """Queue write_func, which writes the files at paths (blocks if max_pending writes are queued)"""
+        with self._condition:
+            for path in paths:
+                self._pending[path] = self._pending.get(path, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((paths, write_func, description))
+
+    def _run(self):
+        while True:
+            paths, write_func, description = self._queue.get()
+            try:
+                write_func()
+            except Exception:
+                exctype, value = sys.exc_info()[:2]
+                logging.error(f'{description} failed:\n{traceback.format_exc(limit=-10)}')
+                with self._condition:
+                    self.errors.append((paths, f'{description} failed: {exctype.__name__}: {value}'))
+            finally:
+                with self._condition:
+                    for path in paths:
+                        self._pending[path] -= 1
+                        if self._pending[path] == 0:
+                            self._pending.pop(path)
+                    self._condition.notify_all()
+                self._queue.task_done()
+
+    def is_pending(self, paths):
+        with self._condition:
+            return any([path in self._pending for path in paths])
+
+    def wait_for(self, paths):
+        """Wait until the pending writes of the files at paths are finished (raises an error, if one failed)"""
+        with self._condition:
+            self._condition.wait_for(lambda: not any([path in self._pending for path in paths]))
+            errors = [err for err_paths, err in self.errors if set(err_paths) & set(paths)]
+        if len(errors) > 0:
+            raise RuntimeError('\n'.join(errors))
+
+    def flush(self):
+        """Wait until all pending writes are finished
+
+        Returns
+        -------
+        errors : list
+            The error-messages of the writes, which failed since the last flush
+        """
+        self._queue.join()
+        with self._condition:
+            errors = [err for _, err in self.errors]
+            self.errors = list()
+
+        return errors
+
+
+# The writer shared by all data-objects of this process
+async_writer = AsyncWriter()
+
+
+def is_async_save(qsettings):
+    """Check the setting "async_save" (QSettings may store booleans as strings)"""
+    return qsettings.value('async_save', defaultValue=False) in [True, 'true']
+
+
+def flush_writes():
+    """Wait for all pending writes (e.g. at the end of a run) and print the errors of failed writes
+
+    Returns
+    -------
+    errors : list
+        The error-messages of the failed writes
+    """
+    errors = async_writer.flush()
+    for err in errors:
+        print(err)
+
+    return errors
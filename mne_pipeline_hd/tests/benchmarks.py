@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Micro-benchmarks of the functions in basic_functions/operations.py on synthetic data
+
+Run the benchmarks and store the results as baseline:
+    python -m mne_pipeline_hd.tests.benchmarks run --save-baseline
+Run them again later and flag regressions against the baseline:
+    python -m mne_pipeline_hd.tests.benchmarks run --compare
+Compare stored results:
+    python -m mne_pipeline_hd.tests.benchmarks compare results.json --baseline baseline.json
+
+The timings depend on the machine, thus no baseline is shipped with the package: store one on your machine
+before your changes. Without a baseline the comparison is skipped with the exit-code 77
+(functions missing in the baseline are listed as skipped).
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import traceback
+from datetime import datetime
+from os.path import dirname, isfile, join
+from statistics import median
+
+import mne
+import numpy as np
+
+from mne_pipeline_hd.pipeline_functions.data_cache import get_data_cache, set_worker_cache_memory
+from mne_pipeline_hd.pipeline_functions.execution import func_from_def
+from mne_pipeline_hd.pipeline_functions.loading import Group, MEEG
+from mne_pipeline_hd.pipeline_functions.pipeline_utils import datetime_format
+from mne_pipeline_hd.pipeline_functions.profiler import StepProfile
+from mne_pipeline_hd.tests.synthetic import add_group_inputs, add_inverse_operators, make_synthetic_project
+
+default_baseline_path = join(dirname(__file__), 'benchmark_baseline.json')
+# The exit-code, when the comparison is skipped because no baseline exists (like in automake)
+skip_exit_code = 77
+
+# The size of the synthetic recordings
+benchmark_sizes = {'small': {'n_channels': 32, 'duration': 60.},
+                   'medium': {'n_channels': 64, 'duration': 300.},
+                   'large': {'n_channels': 128, 'duration': 900.}}
+
+# The benchmarked functions
+benchmark_functions = ['filter_raw', 'find_6ch_binary_events', 'epoch_raw', 'tfr', 'source_estimate',
+                       'grand_avg_evokeds', 'grand_avg_tfr', 'grand_avg_morphed', 'grand_avg_ltc',
+                       'grand_avg_connect']
+
+# The order in which the functions run, including the untimed steps, which make the inputs for the next functions
+# (names are run as pipeline-functions, callables get the Controller)
+benchmark_chain = ['filter_raw', 'find_6ch_binary_events', 'epoch_raw', 'get_evokeds', 'tfr', add_inverse_operators,
+                   'source_estimate', add_group_inputs, 'grand_avg_evokeds', 'grand_avg_tfr', 'grand_avg_morphed',
+                   'grand_avg_ltc', 'grand_avg_connect']
+
+
+def run_function(func_name, controller):
+    """Run a pipeline-function for all objects of its target and return the profiles of the calls"""
+    if controller.pd_funcs.loc[func_name, 'target'] == 'Group':
+        objects = [Group(name, controller) for name in controller.pr.all_groups]
+    else:
+        objects = [MEEG(name, controller) for name in controller.pr.all_meeg]
+
+    profiles = list()
+    for obj in objects:
+        profile = StepProfile(cpu_clock='process')
+        # Single-threaded, thus the results don't depend on the n_jobs-setting
+        profile.run(func_from_def, func_name, obj, controller, overrides={'n_jobs': 1})
+        profiles.append(profile.get_result())
+
+    return profiles
+
+
+def summarize_profiles(profiles):
+    """Summarize the profiles of the repeated calls of a function"""
+    durations = [p['duration'] for p in profiles]
+    peaks = [p['peak_memory'] for p in profiles if p['peak_memory'] is not None]
+
+    return {'median': median(durations),
+            'min': min(durations),
+            'cpu_time': median([p['cpu_time'] for p in profiles]),
+            'peak_memory': max(peaks) if peaks else None,
+            'bytes_read': median([p['bytes_read'] for p in profiles]),
+            'bytes_written': median([p['bytes_written'] for p in profiles]),
+            'n_calls': len(profiles)}
+
+
+def run_benchmarks(sizes=None, functions=None, repeats=3, n_meeg=2):
+    """Run the benchmarks for each size in a temporary project
+
+    Parameters
+    ----------
+    sizes : list | None
+        The names of the sizes from benchmark_sizes (None for all)
+    functions : list | None
+        The functions to benchmark (None for all from benchmark_functions),
+        the functions they depend on still run, but are not timed
+    repeats : int
+        How often each function is repeated for each object
+    n_meeg : int
+        The number of synthetic recordings (which form one group)
+
+    Returns
+    -------
+    benchmark_results : dict
+        The system-info and for each size and function the median/min of the wall-time in seconds,
+        the median CPU-time, the maximum of the peak-memory and the median IO in bytes
+    """
+    sizes = sizes or list(benchmark_sizes)
+    functions = functions or benchmark_functions
+    # Stop the chain after the last selected function
+    last_idx = max([benchmark_chain.index(f) for f in functions])
+
+    benchmark_results = {'info': {'time': datetime.now().strftime(datetime_format),
+                                  'platform': platform.platform(),
+                                  'python': platform.python_version(),
+                                  'mne': mne.__version__,
+                                  'numpy': np.__version__,
+                                  'repeats': repeats,
+                                  'n_meeg': n_meeg,
+                                  'cache_memory': 0},
+                         'results': dict()}
+
+    # Without data-cache every repetition loads its data from disk (independent of the setting "cache_memory")
+    set_worker_cache_memory(0)
+    get_data_cache().clear()
+    try:
+        for size in sizes:
+            benchmark_size(size, functions, last_idx, repeats, n_meeg, benchmark_results['results'])
+    finally:
+        # The setting "cache_memory" applies again
+        set_worker_cache_memory(None)
+
+    return benchmark_results
+
+
+def benchmark_size(size, functions, last_idx, repeats, n_meeg, results):
+    """Run the benchmark-chain up to last_idx for one size and add the results for the functions to results"""
+    size_results = results[size] = dict()
+    with tempfile.TemporaryDirectory() as home_path:
+        controller = make_synthetic_project(home_path, n_meeg=n_meeg, **benchmark_sizes[size])
+        # Functions like filter_raw would otherwise skip the repetitions
+        controller.settings['overwrite'] = True
+        for step in benchmark_chain[:last_idx + 1]:
+            if callable(step):
+                step(controller)
+                continue
+            n_runs = repeats if step in functions else 1
+            profiles = list()
+            try:
+                for _ in range(n_runs):
+                    profiles += run_function(step, controller)
+            except Exception:
+                traceback.print_exc()
+                if step in functions:
+                    size_results[step] = {'error': traceback.format_exc(limit=1)}
+                continue
+            if step in functions:
+                size_results[step] = summarize_profiles(profiles)
+                print(f'{size}: {step} took {size_results[step]["median"]:.3f} s (median)')
+
+
+def compare_results(benchmark_results, baseline, threshold=0.2, min_difference=0.05):
+    """Compare benchmark-results with a baseline
+
+    Parameters
+    ----------
+    benchmark_results : dict
+        The results from run_benchmarks
+    baseline : dict
+        The results of a previous run of run_benchmarks
+    threshold : float
+        The relative increase of the median wall-time, which is flagged as regression
+    min_difference : float
+        The minimum increase in seconds to be flagged (avoids flagging noise of very fast functions)
+
+    Returns
+    -------
+    comparison : list
+        A dictionary for each size and function of the results
+        (with size, function, baseline, current, ratio, regression and skipped, the reason why it wasn't compared,
+        a function, which failed in benchmark_results, is a regression)
+    """
+    comparison = list()
+    for size, size_results in benchmark_results['results'].items():
+        for func_name, result in size_results.items():
+            base_result = baseline['results'].get(size, dict()).get(func_name)
+            # A function, which fails now, is a regression
+            if 'median' not in result:
+                comparison.append({'size': size, 'function': func_name,
+                                   'baseline': (base_result or dict()).get('median'), 'current': None,
+                                   'ratio': None, 'regression': True, 'skipped': None})
+                continue
+            if base_result is None:
+                skipped = 'not in baseline'
+            elif 'median' not in base_result:
+                skipped = 'failed in baseline'
+            else:
+                skipped = None
+            if skipped is not None:
+                comparison.append({'size': size, 'function': func_name, 'baseline': None,
+                                   'current': result['median'], 'ratio': None, 'regression': False,
+                                   'skipped': skipped})
+                continue
+            ratio = result['median'] / base_result['median'] if base_result['median'] else None
+            regression = ratio is not None and ratio > 1 + threshold \
+                and result['median'] - base_result['median'] > min_difference
+            comparison.append({'size': size, 'function': func_name, 'baseline': base_result['median'],
+                               'current': result['median'], 'ratio': ratio, 'regression': regression,
+                               'skipped': None})
+
+    return comparison
+
+
+def print_comparison(comparison):
+    header = f'{"Size":<8}{"Function":<25}{"Baseline [s]":>14}{"Current [s]":>13}{"Ratio":>8}'
+    print(header)
+    print('-' * len(header))
+    for c in comparison:
+        baseline_str = f'{c["baseline"]:.3f}' if c['baseline'] is not None else '-'
+        current_str = f'{c["current"]:.3f}' if c['current'] is not None else '-'
+        ratio_str = f'{c["ratio"]:.2f}' if c['ratio'] is not None else '-'
+        if c['skipped']:
+            flag = f'  SKIPPED ({c["skipped"]})'
+        else:
+            flag = '  REGRESSION' if c['regression'] else ''
+        print(f'{c["size"]:<8}{c["function"]:<25}{baseline_str:>14}{current_str:>13}{ratio_str:>8}{flag}')
+
+
+def load_results(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_results(benchmark_results, path):
+    with open(path, 'w') as file:
+        json.dump(benchmark_results, file, indent=4)
+    print(f'Results saved to {path}')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m mne_pipeline_hd.tests.benchmarks',
+                                     description='Benchmark the basic functions on synthetic data '
+                                                 'and compare with a baseline.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--sizes', nargs='+', choices=list(benchmark_sizes),
+                            help='The sizes of the synthetic data (default: all)')
+    run_parser.add_argument('--functions', nargs='+', choices=benchmark_functions,
+                            help='The functions to benchmark (default: all)')
+    run_parser.add_argument('--repeats', type=int, default=3,
+                            help='How often each function is repeated')
+    run_parser.add_argument('--n-meeg', type=int, default=2,
+                            help='The number of synthetic recordings')
+    run_parser.add_argument('--output', help='Save the results as JSON to this path')
+    run_parser.add_argument('--save-baseline', action='store_true',
+                            help='Store the results as new baseline')
+    run_parser.add_argument('--compare', action='store_true',
+                            help='Compare the results with the baseline')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare stored results with the baseline')
+    compare_parser.add_argument('results', help='The path to the results to compare')
+
+    for sub_parser in [run_parser, compare_parser]:
+        sub_parser.add_argument('--baseline', default=default_baseline_path,
+                                help='The path to the baseline')
+        sub_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='The relative increase of wall-time, which is flagged as regression')
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    if args.command == 'run':
+        benchmark_results = run_benchmarks(args.sizes, args.functions, args.repeats, args.n_meeg)
+        if args.output:
+            save_results(benchmark_results, args.output)
+        if args.save_baseline:
+            save_results(benchmark_results, args.baseline)
+        if not args.compare:
+            return 0
+    else:
+        benchmark_results = load_results(args.results)
+
+    if not isfile(args.baseline):
+        print(f'SKIPPED: No baseline found at {args.baseline}, nothing was compared '
+              f'(store one on this machine before your changes with "run --save-baseline")')
+        return skip_exit_code
+    comparison = compare_results(benchmark_results, load_results(args.baseline), args.threshold)
+    print_comparison(comparison)
+    n_skipped = len([c for c in comparison if c['skipped']])
+    if n_skipped > 0:
+        print(f'{n_skipped} of {len(comparison)} benchmark(s) skipped')
+    n_regressions = len([c for c in comparison if c['regression']])
+    if n_regressions > 0:
+        print(f'{n_regressions} regression(s) above {args.threshold:.0%}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
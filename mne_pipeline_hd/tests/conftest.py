@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Fixtures shared by the tests
+"""
+from os.path import dirname
+
+import pytest
+
+
+@pytest.fixture
+def isolated_settings(tmp_path, monkeypatch):
+    """Keep the SUBJECTS_DIR in the MNE-config and the QSettings of the GUI untouched by the Controllers of a test
+
+    The QSettings start empty in tmp_path (like on a machine, where the GUI never ran).
+    """
+    # Only the tests with Controllers need MNE and PyQt5
+    mne = pytest.importorskip('mne')
+    QtCore = pytest.importorskip('PyQt5.QtCore')
+    QSettings = QtCore.QSettings
+
+    monkeypatch.setattr(mne.utils, 'set_config', lambda *args, **kwargs: None)
+    default_format = QSettings.defaultFormat()
+    # The directory of the user-scope for INI-files (<path>/<organization>/<application>.ini)
+    user_path = dirname(dirname(QSettings(QSettings.IniFormat, QSettings.UserScope, 'org', 'app').fileName()))
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, str(tmp_path / 'qsettings'))
+    yield
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, user_path)
+    QSettings.setDefaultFormat(default_format)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+End-to-end scaling-benchmark with the number of MEEG-objects in a project
+
+For each number of MEEG-objects a synthetic project is created and a fixed pipeline is run headless.
+The project-level code-paths (Project.save/load, the file-tables of the File-Management, grand-averages)
+should scale linearly with the number of objects, which is checked with the exponent of a power-law-fit:
+    python -m mne_pipeline_hd.tests.scaling --n-meeg 1 10 50 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from os.path import getsize, join
+from time import perf_counter
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from mne_pipeline_hd.gui.loading_widgets import FileManagment
+from mne_pipeline_hd.headless import get_parser as get_headless_parser, run_headless
+from mne_pipeline_hd.pipeline_functions.memory import PeakMemoryMonitor
+from mne_pipeline_hd.pipeline_functions.project import Project
+from mne_pipeline_hd.tests.synthetic import make_synthetic_project
+
+# The pipeline, which is run for each project
+scaling_functions = ['filter_raw', 'find_6ch_binary_events', 'epoch_raw', 'get_evokeds', 'grand_avg_evokeds']
+
+# The measurements, which are checked for linear scaling (all in seconds)
+scaling_metrics = ['run_time', 'project_save', 'project_load', 'file_tables', 'grand_average']
+
+# Exponents of the power-law-fit above this are flagged as superlinear
+max_exponent = 1.3
+
+
+def get_directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += getsize(join(root, file))
+
+    return size
+
+
+def time_file_tables(controller):
+    """Time the scan of the File-Management over all objects (without the Qt-Widget)"""
+    pr = controller.pr
+    # get_file_tables only needs these attributes of the FileManagment-Widget
+    file_management = SimpleNamespace(mw=controller, param_results=dict())
+    for kind, obj_list in [('meeg', pr.all_meeg), ('fsmri', pr.all_fsmri), ('group', pr.all_groups)]:
+        for suffix in ['', '_time', '_size']:
+            setattr(file_management, f'pd_{kind}{suffix}', pd.DataFrame(index=obj_list))
+
+    start = perf_counter()
+    for kind in ['MEEG', 'Group']:
+        FileManagment.get_file_tables(file_management, kind)
+
+    return perf_counter() - start
+
+
+def run_scaling_step(home_path, n_meeg, n_groups, n_channels, duration, functions):
+    """Create a project with n_meeg MEEG-objects, run the pipeline and measure it
+
+    Returns
+    -------
+    result : dict
+        The measurements (times in seconds, memory and disk-footprint in bytes)
+    """
+    result = {'n_meeg': n_meeg, 'n_groups': min(n_groups, n_meeg)}
+
+    start = perf_counter()
+    controller = make_synthetic_project(home_path, n_meeg=n_meeg, n_channels=n_channels, duration=duration,
+                                        n_groups=result['n_groups'])
+    result['create_time'] = perf_counter() - start
+
+    args = get_headless_parser().parse_args(['--home-path', home_path, '--project', controller.pr.name,
+                                             '--functions', *functions, '--n-processes', '1',
+                                             '--prefetch-memory', '0'])
+    with PeakMemoryMonitor() as monitor:
+        start = perf_counter()
+        summary = run_headless(args)
+        result['run_time'] = perf_counter() - start
+    result['peak_memory'] = monitor.peak_increase
+    result['n_failed'] = summary['n_failed']
+    result['grand_average'] = sum([s.get('duration') or 0 for s in summary['steps']
+                                   if s['function'].startswith('grand_avg')])
+
+    # Reload the project with the file-parameters of the run
+    start = perf_counter()
+    controller.pr = Project(controller, controller.pr.name)
+    result['project_load'] = perf_counter() - start
+
+    start = perf_counter()
+    controller.pr.save()
+    result['project_save'] = perf_counter() - start
+
+    result['file_tables'] = time_file_tables(controller)
+
+    result['disk_size'] = get_directory_size(controller.pr.project_path)
+    result['pscripts_size'] = get_directory_size(controller.pr.pscripts_path)
+
+    return result
+
+
+def get_scaling_exponents(results):
+    """Fit a power-law (time ~ N^exponent) for each metric (1 means linear, 2 quadratic)
+
+    Projects with only one object are left out, because their times are dominated by constant overhead.
+    """
+    fit_results = [r for r in results if r['n_meeg'] > 1]
+    exponents = dict()
+    if len(fit_results) < 2:
+        return exponents
+    n_meeg = np.log([r['n_meeg'] for r in fit_results])
+    for metric in scaling_metrics:
+        values = [r[metric] for r in fit_results]
+        if min(values) > 0:
+            exponents[metric] = float(np.polyfit(n_meeg, np.log(values), 1)[0])
+
+    return exponents
+
+
+def run_scaling(n_meeg_list=(1, 10, 50, 200), n_groups=2, n_channels=16, duration=30., functions=None):
+    """Run the scaling-benchmark for each number of MEEG-objects in a temporary Home-Path
+
+    Parameters
+    ----------
+    n_meeg_list : list
+        The numbers of MEEG-objects
+    n_groups : int
+        The number of groups (at most the number of MEEG-objects)
+    n_channels : int
+        The number of EEG-channels of each synthetic recording
+    duration : float
+        The duration of each synthetic recording in seconds
+    functions : list | None
+        The functions of the pipeline (None for scaling_functions)
+
+    Returns
+    -------
+    scaling_results : dict
+        The measurements for each number of MEEG-objects and the exponents of the power-law-fits
+    """
+    functions = functions or scaling_functions
+    results = list()
+    for n_meeg in n_meeg_list:
+        with tempfile.TemporaryDirectory() as home_path:
+            results.append(run_scaling_step(home_path, n_meeg, n_groups, n_channels, duration, functions))
+
+    return {'functions': functions, 'results': results, 'exponents': get_scaling_exponents(results)}
+
+
+def print_scaling(scaling_results):
+    header = f'{"N":>5}{"Run [s]":>10}{"Save [s]":>10}{"Load [s]":>10}{"Tables [s]":>12}{"GA [s]":>9}' \
+             f'{"Peak [MB]":>11}{"Disk [MB]":>11}{"Scripts [MB]":>14}{"Failed":>8}'
+    print(header)
+    print('-' * len(header))
+    for r in scaling_results['results']:
+        peak_str = f'{r["peak_memory"] / 1024 ** 2:.0f}' if r['peak_memory'] is not None else '-'
+        print(f'{r["n_meeg"]:>5}{r["run_time"]:>10.1f}{r["project_save"]:>10.2f}{r["project_load"]:>10.2f}'
+              f'{r["file_tables"]:>12.2f}{r["grand_average"]:>9.2f}{peak_str:>11}'
+              f'{r["disk_size"] / 1024 ** 2:>11.1f}{r["pscripts_size"] / 1024 ** 2:>14.2f}{r["n_failed"]:>8}')
+
+    print('\nScaling-exponents (1 = linear, 2 = quadratic):')
+    for metric, exponent in scaling_results['exponents'].items():
+        flag = '  SUPERLINEAR' if exponent > max_exponent else ''
+        print(f'{metric:<15}{exponent:>6.2f}{flag}')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m mne_pipeline_hd.tests.scaling',
+                                     description='Run a fixed pipeline on synthetic projects with an increasing '
+                                                 'number of MEEG-objects and check for linear scaling.')
+    parser.add_argument('--n-meeg', nargs='+', type=int, default=[1, 10, 50, 200],
+                        help='The numbers of MEEG-objects')
+    parser.add_argument('--n-groups', type=int, default=2, help='The number of groups')
+    parser.add_argument('--n-channels', type=int, default=16,
+                        help='The number of EEG-channels of each recording')
+    parser.add_argument('--duration', type=float, default=30., help='The duration of each recording in seconds')
+    parser.add_argument('--functions', nargs='+', help='The functions of the pipeline')
+    parser.add_argument('--output', help='Save the results as JSON to this path')
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    scaling_results = run_scaling(args.n_meeg, args.n_groups, args.n_channels, args.duration, args.functions)
+    print_scaling(scaling_results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(scaling_results, file, indent=4)
+
+    # Non-zero exit-code if any metric scales superlinear
+    return int(any([e > max_exponent for e in scaling_results['exponents'].values()]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
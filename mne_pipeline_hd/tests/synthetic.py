@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Synthetic projects with simulated MEG/EEG-recordings (no sample-data needed) for benchmarks
+"""
+import os
+from os.path import join
+
+import mne
+import numpy as np
+
+from mne_pipeline_hd.pipeline_functions.controller import Controller
+from mne_pipeline_hd.pipeline_functions.loading import MEEG
+
+# The stimulus-channels of the binary coding in the Biomagnetism Lab Heidelberg (see find_6ch_binary_events)
+stim_channels = [f'STI 00{idx}' for idx in range(1, 7)]
+# Trials with their binary codes (3 is coded on two stim-channels simultaneously)
+synthetic_event_id = {'Auditory': 1, 'Visual': 2, 'Combined': 3}
+# Labels for the label-time-courses (only names, no parcellation is needed for the grand-average)
+synthetic_labels = ['synthetic-lh', 'synthetic-rh']
+# The name of the template for the sphere-model source-space
+template_name = 'synthetic_template'
+
+# Parameters adjusted to the synthetic data (EEG-only with a sampling-frequency of 600 Hz)
+synthetic_parameters = {'ch_types': ['eeg'],
+                        'highpass': 1,
+                        'lowpass': 40,
+                        't_epoch': (-0.2, 0.5),
+                        'baseline': (-0.2, 0),
+                        'target_labels': synthetic_labels}
+
+
+def make_synthetic_raw(n_channels, duration, sfreq=600., event_interval=1., seed=42):
+    """Simulate an EEG-recording with evoked responses and 6 binary-coded stimulus-channels
+
+    Parameters
+    ----------
+    n_channels : int
+        The number of EEG-channels (taken from the standard_1005-montage, max. 343)
+    duration : float
+        The duration of the recording in seconds
+    sfreq : float
+        The sampling-frequency
+    event_interval : float
+        The seconds between two events (the trials of synthetic_event_id are repeated in turns)
+    seed : int
+        The seed for the random noise
+
+    Returns
+    -------
+    raw : mne.io.RawArray
+        The simulated recording with an average-reference-projection
+    """
+    rng = np.random.default_rng(seed)
+    montage = mne.channels.make_standard_montage('standard_1005')
+    eeg_channels = montage.ch_names[:n_channels]
+    info = mne.create_info(eeg_channels + stim_channels, sfreq, ['eeg'] * n_channels + ['stim'] * 6)
+
+    n_times = int(duration * sfreq)
+    data = np.zeros((n_channels + 6, n_times))
+    # Gaussian background-noise
+    data[:n_channels] = rng.standard_normal((n_channels, n_times)) * 5e-6
+
+    # Add an evoked response (a damped 10 Hz-oscillation with a random topography) after each event
+    response_times = np.arange(int(0.4 * sfreq)) / sfreq
+    response = np.sin(2 * np.pi * 10 * response_times) * np.exp(-response_times / 0.1)
+    trial_codes = list(synthetic_event_id.values())
+    topographies = {code: rng.standard_normal(n_channels) * 3e-6 for code in trial_codes}
+    pulse_samples = int(0.01 * sfreq)
+    onsets = np.arange(sfreq, n_times - sfreq, event_interval * sfreq).astype(int)
+    for idx, onset in enumerate(onsets):
+        code = trial_codes[idx % len(trial_codes)]
+        data[:n_channels, onset:onset + len(response)] += np.outer(topographies[code], response)
+        # Set the stim-channels of the bits of the code
+        for bit in range(6):
+            if code & 2 ** bit:
+                data[n_channels + bit, onset:onset + pulse_samples] = 1
+
+    raw = mne.io.RawArray(data, info)
+    raw.set_montage(montage)
+    raw.set_eeg_reference(projection=True)
+
+    return raw
+
+
+def make_template_source_space(info, spacing=20.):
+    """Make a small volume-source-space and the forward-solution in a sphere-model (no MRI needed)
+
+    Parameters
+    ----------
+    info : mne.Info
+        The measurement-info with the EEG-channel-positions
+    spacing : float
+        The distance between the sources in mm (bigger spacing means fewer sources)
+
+    Returns
+    -------
+    src : mne.SourceSpaces
+        The volume-source-space
+    forward : mne.Forward
+        The forward-solution for the EEG-channels
+    """
+    sphere = mne.make_sphere_model('auto', 'auto', info)
+    src = mne.setup_volume_source_space(subject=None, pos=spacing, sphere=sphere, sphere_units='m')
+    forward = mne.make_forward_solution(info, trans=None, src=src, bem=sphere, meg=False, eeg=True)
+
+    return src, forward
+
+
+def make_synthetic_project(home_path, n_meeg=4, n_channels=32, duration=60., n_groups=1,
+                           project_name='synthetic', seed=42):
+    """Create a project with simulated recordings in home_path and return its Controller
+
+    Parameters
+    ----------
+    home_path : str
+        The Home-Path for the project (e.g. a temporary directory)
+    n_meeg : int
+        The number of MEEG-objects with a simulated recording each
+    n_channels : int
+        The number of EEG-channels of each recording
+    duration : float
+        The duration of each recording in seconds
+    n_groups : int
+        The number of groups the MEEG-objects are divided into (for the grand-averages)
+    project_name : str
+        The name of the project
+    seed : int
+        The seed for the first recording (incremented for each further recording)
+
+    Returns
+    -------
+    controller : Controller
+        The Controller holding the new project
+    """
+    os.makedirs(join(home_path, 'projects', project_name, 'data'), exist_ok=True)
+    controller = Controller(home_path, project_name)
+    pr = controller.pr
+    pr.parameters[pr.p_preset].update(synthetic_parameters)
+
+    meeg_names = [f'synthetic_{idx:03d}' for idx in range(n_meeg)]
+    pr.all_meeg = list(meeg_names)
+    pr.sel_meeg = list(meeg_names)
+    pr.all_fsmri = [template_name]
+    pr.sel_fsmri = [template_name]
+    for name in meeg_names:
+        pr.meeg_to_fsmri[name] = template_name
+        pr.meeg_event_id[name] = dict(synthetic_event_id)
+        pr.sel_event_id[name] = list(synthetic_event_id)
+    pr.all_groups = {f'group_{g}': meeg_names[g::n_groups] for g in range(n_groups)}
+    pr.sel_groups = list(pr.all_groups)
+
+    for idx, name in enumerate(meeg_names):
+        meeg = MEEG(name, controller)
+        meeg.save_raw(make_synthetic_raw(n_channels, duration, seed=seed + idx))
+    pr.save()
+
+    return controller
+
+
+def add_inverse_operators(controller, meeg_names=None, spacing=20.):
+    """Add the forward-solution, noise-covariance and inverse-operator to MEEG-objects with evokeds
+
+    The forward-solution is computed once in the template-sphere-model,
+    because all synthetic recordings share the same channels.
+    """
+    meeg_names = meeg_names or controller.pr.all_meeg
+    forward = None
+    for name in meeg_names:
+        meeg = MEEG(name, controller)
+        if forward is None:
+            _, forward = make_template_source_space(meeg.load_info(), spacing)
+        epochs = meeg.load_epochs()
+        noise_covariance = mne.compute_covariance(epochs, tmax=0, method='empirical')
+        inverse_operator = mne.minimum_norm.make_inverse_operator(epochs.info, forward, noise_covariance)
+        meeg.save_forward(forward)
+        meeg.save_noise_covariance(noise_covariance)
+        meeg.save_inverse_operator(inverse_operator)
+
+
+def add_group_inputs(controller, meeg_names=None, n_vertices=2562, n_times=421, seed=42):
+    """Add simulated morphed source-estimates, label-time-courses and connectivity to MEEG-objects
+
+    These are the inputs of grand_avg_morphed, grand_avg_ltc and grand_avg_connect,
+    which would otherwise need a Freesurfer-segmentation.
+    """
+    rng = np.random.default_rng(seed)
+    meeg_names = meeg_names or controller.pr.all_meeg
+    times = np.linspace(-0.2, 0.5, n_times)
+    vertices = [np.arange(n_vertices), np.arange(n_vertices)]
+    n_labels = len(synthetic_labels)
+    for name in meeg_names:
+        meeg = MEEG(name, controller)
+        morphed_stcs = dict()
+        ltcs = dict()
+        con_dict = dict()
+        for trial in meeg.sel_trials:
+            morphed_stcs[trial] = mne.SourceEstimate(rng.standard_normal((2 * n_vertices, n_times)), vertices,
+                                                     tmin=times[0], tstep=times[1] - times[0], subject='fsaverage')
+            ltcs[trial] = {label: np.vstack((rng.standard_normal(n_times), times)) for label in synthetic_labels}
+            con_dict[trial] = {con_method: rng.random((n_labels, n_labels)) for con_method in meeg.p['con_methods']}
+        meeg.save_morphed_source_estimates(morphed_stcs)
+        meeg.save_ltc(ltcs)
+        meeg.save_connectivity(con_dict)
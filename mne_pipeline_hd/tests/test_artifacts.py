@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the artifact-store (without MNE)
+"""
+import os
+import sys
+from os.path import isfile, join
+from types import SimpleNamespace
+
+import pytest
+
+from mne_pipeline_hd.pipeline_functions import artifacts
+from mne_pipeline_hd.pipeline_functions.artifacts import (_link, get_step_key, get_store_path, prune_artifacts,
+                                                         restore_artifacts, store_artifacts)
+
+
+@pytest.fixture
+def main_win(tmp_path):
+    return SimpleNamespace(pr=SimpleNamespace(data_path=str(tmp_path)))
+
+
+def _store_file(main_win, file_name, project_path=None):
+    store_file = join(get_store_path(main_win), file_name[:2], file_name)
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    with open(store_file, 'w') as file:
+        file.write(file_name)
+    if project_path is not None:
+        _link(store_file, project_path)
+
+    return store_file
+
+
+def test_prune(main_win, tmp_path):
+    used_file = _store_file(main_win, 'ab_used-epo.fif', str(tmp_path / 'sub1-epo.fif'))
+    unused_file = _store_file(main_win, 'cd_unused-epo.fif')
+
+    assert prune_artifacts(main_win) == (1, len('cd_unused-epo.fif'))
+    assert isfile(used_file)
+    assert not isfile(unused_file)
+    # Empty directories are removed
+    assert sorted(os.listdir(get_store_path(main_win))) == ['ab']
+
+
+def test_no_prune_of_copies(main_win, tmp_path, monkeypatch):
+    # Without support for hard-links the files are copied into the store
+    def no_link(source_path, target_path):
+        raise OSError('Hard-links are not supported')
+    monkeypatch.setattr(artifacts.os, 'link', no_link)
+
+    project_path = tmp_path / 'sub1_Default-epo.fif'
+    project_path.write_text('epochs')
+    store_artifacts(SimpleNamespace(mw=main_win, p_preset='Default'), 'step_key', 'epochs', [str(project_path)])
+
+    assert prune_artifacts(main_win) == (0, 0)
+    assert len([f for _, _, files in os.walk(get_store_path(main_win)) for f in files if f.endswith('-epo.fif')]) == 1
+
+
+def make_epochs(meeg, epochs_tmin):
+    """A function for the step-key (its source-code is inspected)"""
+    raw = meeg.load_filtered()
+    meeg.save_epochs(raw)
+
+
+class MEEG:
+    """A data-object with the attributes used by the artifact-store"""
+
+    def __init__(self, main_win, p_preset):
+        self.name = 'sub1'
+        self.mw = main_win
+        self.pr = SimpleNamespace(meeg_bad_channels={'sub1': ['EEG 001']})
+        self.p_preset = p_preset
+        self.p = {'epochs_tmin': -0.2}
+        self.save_dir = main_win.pr.data_path
+        self.io_dict = {'filtered': {'path': join(self.save_dir, f'sub1_{p_preset}-raw.fif'),
+                                     'load': 'load_filtered', 'save': 'save_filtered'},
+                        'epochs': {'path': join(self.save_dir, f'sub1_{p_preset}-epo.fif'),
+                                   'load': 'load_epochs', 'save': 'save_epochs'}}
+        self.data_dict = dict()
+        self.saved_paths = list()
+
+    def _return_path_list(self, data_type):
+        return [self.io_dict[data_type]['path']]
+
+    def get_json_path(self, file_name):
+        return join(self.save_dir, f'{self.name}_{self.p_preset}_{file_name}.json')
+
+    def save_file_params(self, path, func_name):
+        self.saved_paths.append(path)
+
+
+@pytest.fixture
+def function_win(main_win, monkeypatch):
+    pd = pytest.importorskip('pandas')
+    main_win.pd_funcs = pd.DataFrame({'pkg_name': ['tests'], 'module': ['test_artifacts'], 'func_args': ['']},
+                                     index=['make_epochs'])
+    main_win.all_modules = {'tests': {'test_artifacts': (sys.modules[__name__], None)}}
+    # The data-objects are the fake objects of this module
+    monkeypatch.setattr(artifacts, '_get_data_objects', lambda obj, obj_type: [obj])
+
+    return main_win
+
+
+def test_store_and_restore(function_win):
+    meeg_a = MEEG(function_win, 'A')
+    filtered_path_a = meeg_a.io_dict['filtered']['path']
+    with open(filtered_path_a, 'w') as file:
+        file.write('filtered')
+    step_key = get_step_key(meeg_a, 'make_epochs')
+    assert isinstance(step_key, str)
+    epochs_path_a = meeg_a.io_dict['epochs']['path']
+    with open(epochs_path_a, 'w') as file:
+        file.write('epochs')
+    store_artifacts(meeg_a, step_key, 'epochs', [epochs_path_a])
+
+    # Another Parameter-Preset with the same input-file (restored from the store before), parameters and entries
+    meeg_b = MEEG(function_win, 'B')
+    _link(filtered_path_a, meeg_b.io_dict['filtered']['path'])
+    assert get_step_key(meeg_b, 'make_epochs') == step_key
+    restored, _ = restore_artifacts(meeg_b, 'make_epochs', step_key)
+    assert restored
+    epochs_path_b = meeg_b.io_dict['epochs']['path']
+    with open(epochs_path_b) as file:
+        assert file.read() == 'epochs'
+    assert os.stat(epochs_path_b).st_ino == os.stat(epochs_path_a).st_ino
+    assert meeg_b.saved_paths == [epochs_path_b]
+
+    # Changed parameters and entries change the key
+    meeg_b.p['epochs_tmin'] = -0.1
+    assert get_step_key(meeg_b, 'make_epochs') != step_key
+    meeg_b.p['epochs_tmin'] = -0.2
+    meeg_b.pr.meeg_bad_channels['sub1'] = ['EEG 002']
+    assert get_step_key(meeg_b, 'make_epochs') != step_key
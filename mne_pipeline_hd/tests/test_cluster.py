@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the job-queue of distributed runs (without MNE)
+"""
+from mne_pipeline_hd.pipeline_functions.cluster import SQLiteQueue
+
+job = {'project': 'test', 'obj_name': 'sub1', 'functions': ['filter_raw', 'epoch_raw']}
+
+
+def _get_queue(tmp_path, **kwargs):
+    return SQLiteQueue(str(tmp_path / 'queue.db'), **kwargs)
+
+
+def test_fetch_complete(tmp_path):
+    queue = _get_queue(tmp_path)
+    job_id = queue.submit(job, run_id='run1')
+    assert queue.get_finished([job_id]) == list()
+
+    assert queue.fetch('worker1') == (job_id, job)
+    # A running job is not taken by another worker
+    assert queue.fetch('worker2') is None
+
+    results = [{'object': 'sub1', 'function': 'filter_raw', 'status': 'finished'}]
+    # Tuples in the project-entries are kept
+    project_entries = {'meeg_event_id': {'Auditory': (1, 2)}}
+    queue.complete(job_id, (results, project_entries, ['Saving sub1-epo.fif failed']))
+    assert queue.get_finished([job_id]) == [(job_id, [results, project_entries, ['Saving sub1-epo.fif failed']],
+                                             None)]
+
+
+def test_fail(tmp_path):
+    queue = _get_queue(tmp_path)
+    job_id = queue.submit(job)
+    queue.fetch('worker1')
+    queue.fail(job_id, 'RuntimeError: Worker died')
+
+    assert queue.get_finished([job_id]) == [(job_id, None, 'RuntimeError: Worker died')]
+    assert queue.fetch('worker2') is None
+
+
+def test_order(tmp_path):
+    queue = _get_queue(tmp_path)
+    job_ids = [queue.submit(dict(job, obj_name=obj_name)) for obj_name in ['sub1', 'sub2']]
+
+    assert [queue.fetch('worker1')[0] for _ in job_ids] == job_ids
+
+
+def test_expired_lease(tmp_path):
+    # The lease of each running job is already expired
+    queue = _get_queue(tmp_path, lease_timeout=-1, max_attempts=2)
+    job_id = queue.submit(job)
+    assert queue.fetch('worker1')[0] == job_id
+    # The job is taken again by the next worker
+    assert queue.fetch('worker2')[0] == job_id
+    # And fails after max_attempts
+    assert queue.fetch('worker3') is None
+    assert 'Lease expired 2 times' in queue.get_finished([job_id])[0][2]
+
+
+def test_heartbeat(tmp_path):
+    queue = _get_queue(tmp_path, lease_timeout=3600)
+    job_id = queue.submit(job)
+    queue.fetch('worker1')
+    queue.heartbeat(job_id)
+
+    assert queue.fetch('worker2') is None
+
+
+def test_cancel(tmp_path):
+    queue = _get_queue(tmp_path)
+    running_id = queue.submit(job, run_id='run1')
+    queue.fetch('worker1')
+    pending_id = queue.submit(job, run_id='run1')
+    other_id = queue.submit(job, run_id='run2')
+
+    # Only the pending jobs of the run are removed
+    assert queue.cancel('run1') == [pending_id]
+    assert queue.fetch('worker2')[0] == other_id
+    queue.complete(running_id, (list(), dict(), list()))
+    assert queue.get_finished([running_id])[0][0] == running_id
+
+
+def test_job_entries(tmp_path):
+    queue = _get_queue(tmp_path)
+    # The entries of the project are sent with the job (see ParallelRunner.get_object_entries)
+    entries_job = dict(job, object_entries={'meeg_event_id': {'sub1': {'Auditory': (1, 2)}}})
+    job_id = queue.submit(entries_job)
+
+    assert queue.fetch('worker1') == (job_id, entries_job)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the invalidation of the data-cache (without MNE)
+"""
+import os
+
+import numpy as np
+
+from mne_pipeline_hd.pipeline_functions.data_cache import DataCache, get_cache_key
+
+
+class FakeProject:
+    def __init__(self):
+        self.meeg_bad_channels = {'sub1': ['EEG 001']}
+        self.ica_exclude = {'sub1': [0]}
+        self.plot_files = {'sub1': dict()}
+
+
+class FakeMEEG:
+    def __init__(self, path):
+        self.name = 'sub1'
+        self.p_preset = 'Default'
+        self.pr = FakeProject()
+        self.path = str(path)
+
+    def _return_path_list(self, data_type):
+        return [self.path]
+
+
+def _get_object(tmp_path):
+    path = tmp_path / 'sub1-raw.fif'
+    path.write_text('raw')
+
+    return FakeMEEG(path)
+
+
+def test_key_changes_with_mtime(tmp_path):
+    meeg = _get_object(tmp_path)
+    key = get_cache_key(meeg, 'raw')
+    assert key == get_cache_key(meeg, 'raw')
+
+    # The file was rewritten (e.g. by another process)
+    mtime_ns = os.stat(meeg.path).st_mtime_ns + 10 ** 9
+    os.utime(meeg.path, ns=(mtime_ns, mtime_ns))
+    assert get_cache_key(meeg, 'raw') != key
+
+
+def test_key_changes_with_entries(tmp_path):
+    meeg = _get_object(tmp_path)
+    key = get_cache_key(meeg, 'raw')
+
+    meeg.pr.meeg_bad_channels['sub1'].append('EEG 002')
+    bads_key = get_cache_key(meeg, 'raw')
+    assert bads_key != key
+
+    meeg.pr.ica_exclude['sub1'] = [0, 1]
+    assert get_cache_key(meeg, 'raw') != bads_key
+
+
+def test_key_ignores_records(tmp_path):
+    meeg = _get_object(tmp_path)
+    key = get_cache_key(meeg, 'raw')
+
+    meeg.pr.plot_files['sub1']['plot_raw'] = ['sub1-raw.png']
+    assert get_cache_key(meeg, 'raw') == key
+
+
+def test_key_for_missing_file(tmp_path):
+    meeg = FakeMEEG(tmp_path / 'sub1-raw.fif')
+    assert get_cache_key(meeg, 'raw') is None
+
+
+def test_cache_invalidation(tmp_path):
+    meeg = _get_object(tmp_path)
+    cache = DataCache(budget=1024 ** 2)
+    key = get_cache_key(meeg, 'raw')
+    data = np.arange(10)
+    cache.put(key, data)
+
+    cached_data = cache.get(key)
+    assert np.array_equal(cached_data, data)
+    # The cache returns copies, changing them doesn't change the cached data
+    cached_data[0] = 100
+    assert cache.get(key)[0] == 0
+
+    meeg.pr.meeg_bad_channels['sub1'] = list()
+    assert cache.get(get_cache_key(meeg, 'raw')) is None
+    assert cache.get_stats()['hits'] == 2
+
+
+def test_cache_budget():
+    cache = DataCache(budget=0)
+    cache.put('key', np.arange(10))
+    assert cache.get('key') is None
+
+    # Least recently used data is evicted
+    cache.set_budget(np.arange(10).nbytes * 2)
+    for key in ['first', 'second', 'third']:
+        cache.put(key, np.arange(10))
+    assert cache.get('first') is None
+    assert cache.get('third') is not None
+    assert cache.get_stats()['evictions'] == 1
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the binding of the arguments of the functions (needs MNE, but no data)
+"""
+import os
+import sys
+from os.path import join
+
+import pytest
+
+pytest.importorskip('mne')
+pytest.importorskip('pandas')
+pytest.importorskip('PyQt5')
+
+from mne_pipeline_hd.pipeline_functions.controller import Controller  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.execution import (BindingPlan, get_binding_plan,  # noqa: E402
+                                                          validate_binding_plans)
+
+
+def bound_function(meeg, pr, entry_arg, param_arg, setting_arg, qsetting_arg, default_arg='default'):
+    pass
+
+
+def unbound_function(meeg, missing_arg):
+    pass
+
+
+@pytest.fixture
+def controller(tmp_path, isolated_settings):
+    home_path = str(tmp_path)
+    os.makedirs(join(home_path, 'projects', 'test', 'data'))
+
+    return Controller(home_path, 'test')
+
+
+def test_all_functions_bind(controller):
+    # The QSettings are empty like on a machine, where the GUI never ran (e.g. a worker of the queue)
+    assert validate_binding_plans(list(controller.pd_funcs.index), controller) == dict()
+
+
+def test_binding_priority(controller):
+    pr = controller.pr
+    parameters = pr.parameters[pr.p_preset]
+    # Each argument is available from its source and all sources of lower priority
+    parameters['meeg'] = 'parameter'
+    pr.entry_arg = 'project_attribute'
+    for arg_name in ['entry_arg', 'param_arg']:
+        parameters[arg_name] = 'parameter'
+    for arg_name in ['param_arg', 'setting_arg']:
+        controller.settings[arg_name] = 'setting'
+    for arg_name in ['param_arg', 'setting_arg', 'qsetting_arg']:
+        controller.qsettings.setValue(arg_name, 'qsetting')
+
+    obj = object()
+    plan = BindingPlan('bound_function', bound_function)
+    # Optional arguments without a source are left to their default
+    assert plan.bind(obj, controller) == {'meeg': obj, 'pr': pr, 'entry_arg': 'project_attribute',
+                                          'param_arg': 'parameter', 'setting_arg': 'setting',
+                                          'qsetting_arg': 'qsetting'}
+
+    # Overrides replace the values from all sources, but only for arguments of the function
+    kwargs = plan.bind(obj, controller, overrides={'meeg': 'override', 'param_arg': 'override', 'n_jobs': 1})
+    assert (kwargs['meeg'], kwargs['param_arg']) == ('override', 'override')
+    assert 'n_jobs' not in kwargs
+
+
+def test_missing_argument(controller):
+    # Functions, which are not in functions.csv, get their BindingPlan from the given module
+    plan = get_binding_plan('unbound_function', controller, module=sys.modules[__name__])
+    assert 'unbound_function' not in controller.pd_funcs.index
+    with pytest.raises(RuntimeError, match=r"\['missing_arg'\] for unbound_function could not be found"):
+        plan.bind(object(), controller)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for resuming interrupted runs from the run-journal (without MNE)
+"""
+from types import SimpleNamespace
+
+from mne_pipeline_hd.pipeline_functions.journal import RunJournal
+
+steps = [('sub1', 'filter_raw'), ('sub1', 'epoch_raw'), ('sub2', 'filter_raw'), ('sub2', 'epoch_raw')]
+
+
+class FakeQSettings:
+    def value(self, key, defaultValue=None):
+        return defaultValue
+
+
+def _get_journal(tmp_path):
+    main_win = SimpleNamespace(pr=SimpleNamespace(name='test', p_preset='Default', pscripts_path=str(tmp_path)),
+                               qsettings=FakeQSettings())
+
+    return RunJournal(main_win)
+
+
+def _finish_step(journal, obj_name, func_name, status='finished'):
+    journal.step_started(obj_name, func_name)
+    journal.step_finished({'object': obj_name, 'function': func_name, 'status': status, 'duration': 1})
+
+
+def test_no_run(tmp_path):
+    journal = _get_journal(tmp_path)
+
+    assert not journal.is_interrupted()
+    assert journal.get_remaining_steps() == (list(), None)
+
+
+def test_resume(tmp_path):
+    journal = _get_journal(tmp_path)
+    journal.start_run(steps)
+    _finish_step(journal, 'sub1', 'filter_raw')
+    _finish_step(journal, 'sub1', 'epoch_raw', status='failed')
+    _finish_step(journal, 'sub2', 'filter_raw', status='skipped')
+    # The process died while running this step
+    journal.step_started('sub2', 'epoch_raw')
+
+    # A new journal reads the events from disk (like after a restart)
+    journal = _get_journal(tmp_path)
+    assert journal.is_interrupted()
+    # Failed and interrupted steps are run again
+    assert journal.get_remaining_steps() == ([('sub1', 'epoch_raw'), ('sub2', 'epoch_raw')], 'Default')
+
+
+def test_incomplete_line(tmp_path):
+    journal = _get_journal(tmp_path)
+    journal.start_run(steps)
+    _finish_step(journal, 'sub1', 'filter_raw')
+    # The process died while writing an event
+    with open(journal.journal_path, 'a') as file:
+        file.write('{"event": "step_e')
+
+    assert journal.get_remaining_steps()[0] == steps[1:]
+
+
+def test_finished_run(tmp_path):
+    journal = _get_journal(tmp_path)
+    journal.start_run(steps)
+    _finish_step(journal, 'sub1', 'filter_raw')
+    journal.end_run()
+    assert not journal.is_interrupted()
+
+    # Only the last run counts
+    journal.start_run(steps[2:])
+    assert journal.get_remaining_steps()[0] == steps[2:]
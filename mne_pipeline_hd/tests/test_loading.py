@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for loading parts of raw-data (needs MNE, but no data)
+"""
+import numpy as np
+import pytest
+
+mne = pytest.importorskip('mne')
+pytest.importorskip('pandas')
+pytest.importorskip('PyQt5')
+
+from PyQt5.QtCore import QSettings  # noqa: E402
+
+from mne_pipeline_hd.pipeline_functions.data_cache import data_cache  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.loading import MEEG  # noqa: E402
+from mne_pipeline_hd.tests.synthetic import make_synthetic_project, stim_channels  # noqa: E402
+
+
+@pytest.fixture
+def meeg(tmp_path, isolated_settings):
+    controller = make_synthetic_project(str(tmp_path), n_meeg=1, n_channels=8, duration=20.)
+    QSettings().setValue('cache_memory', 1)
+    data_cache.clear()
+    yield MEEG(controller.pr.all_meeg[0], controller)
+    data_cache.clear()
+
+
+def test_partial_load_not_cached(meeg):
+    meeg.keep_data = True
+    raw = meeg.load_raw(picks='stim')
+    assert raw.ch_names == stim_channels
+    # Parts are neither kept nor cached as the full data
+    assert meeg.kept_data == dict()
+    assert data_cache.get_stats()['n_items'] == 0
+    assert len(meeg.load_raw().ch_names) == 8 + len(stim_channels)
+
+    # Parts are read from the file, even when the full data is cached or prefetched
+    assert data_cache.get_stats()['n_items'] == 1
+    assert meeg.load_raw(picks='stim').ch_names == stim_channels
+    meeg.data_dict['raw'] = meeg.load_raw()
+    raw = meeg.load_raw(picks='stim', tmin=2, tmax=5)
+    assert raw.ch_names == stim_channels
+    assert raw.times[-1] == pytest.approx(3)
+    assert len(meeg.load_raw().ch_names) == 8 + len(stim_channels)
+
+
+def test_stim_events(meeg):
+    events = mne.find_events(meeg.load_raw(picks='stim'), stim_channel=stim_channels)
+    assert len(events) > 0
+    assert np.array_equal(events, mne.find_events(meeg.load_raw(), stim_channel=stim_channels))
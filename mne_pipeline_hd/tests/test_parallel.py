@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the project of the worker-processes of parallel runs (needs MNE, but no data)
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import Future
+from os.path import join
+
+import pytest
+
+pytest.importorskip('mne')
+pytest.importorskip('pandas')
+pytest.importorskip('PyQt5')
+
+from mne_pipeline_hd.pipeline_functions import parallel  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.cluster import QueueExecutor  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.controller import Controller  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.parallel import run_object_steps  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.scheduler import DAGRunner  # noqa: E402
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch, isolated_settings):
+    # Start every test with a new worker-controller
+    monkeypatch.setattr(parallel, '_worker_controller', None)
+    home_path = str(tmp_path)
+    os.makedirs(join(home_path, 'projects', 'test', 'data'))
+    controller = Controller(home_path, 'test')
+    controller.pr.all_meeg = ['sub1']
+    controller.pr.save()
+
+    return controller
+
+
+def _run_job(controller):
+    """Run a job without functions in this process like in a worker and return the worker-controller"""
+    run_object_steps(controller.home_path, controller.pr.name, controller.pr.p_preset, dict(controller.settings),
+                     'sub1', 'MEEG', list())
+
+    return parallel._worker_controller
+
+
+class RecordingExecutor:
+    """Record the submitted jobs instead of running them"""
+
+    def __init__(self):
+        self.jobs = list()
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+
+class RecordingQueueExecutor(RecordingExecutor, QueueExecutor):
+    """Record the jobs like a QueueExecutor without a queue"""
+
+
+def test_worker_reloads_project(controller):
+    pr = controller.pr
+    pr.parameters[pr.p_preset]['lowpass'] = 40
+    pr.meeg_bad_channels['sub1'] = ['EEG 001']
+    pr.save()
+    worker_pr = _run_job(controller).pr
+    assert worker_pr.parameters[worker_pr.p_preset]['lowpass'] == 40
+    assert worker_pr.meeg_bad_channels['sub1'] == ['EEG 001']
+
+    # Changes saved in the GUI between two jobs are used by the next job
+    pr.parameters[pr.p_preset]['lowpass'] = 30
+    pr.meeg_bad_channels['sub1'] = ['EEG 002']
+    pr.save()
+    worker_pr = _run_job(controller).pr
+    assert worker_pr.parameters[worker_pr.p_preset]['lowpass'] == 30
+    assert worker_pr.meeg_bad_channels['sub1'] == ['EEG 002']
+
+
+def test_entries_from_other_jobs(controller):
+    steps = [('sub1', 'run_ica'), ('sub1', 'apply_ica')]
+    all_objects = OrderedDict([('sub1', {'type': 'MEEG', 'functions': {'run_ica': 1, 'apply_ica': 1}, 'status': 1})])
+    runner = DAGRunner(controller, all_objects, steps, n_processes=2)
+    assert list(runner.jobs) == steps
+
+    # run_ica finished in another worker-process and its entries are only merged into the main-process
+    runner.merge_project_entries('sub1', {'ica_exclude': [0, 3]})
+    executor = RecordingExecutor()
+    runner.submit_job(executor, ('sub1', 'apply_ica'))
+    fn, args = executor.jobs[0]
+    assert args[6] == ['apply_ica']
+
+    # Run the job of apply_ica without its function in a new worker-process
+    parallel._worker_controller = None
+    fn(*args[:6], list(), *args[7:])
+    assert parallel._worker_controller.pr.ica_exclude['sub1'] == [0, 3]
+
+
+def test_queue_jobs_sized_by_worker(controller, monkeypatch):
+    all_objects = OrderedDict([('sub1', {'type': 'MEEG', 'functions': {'apply_ica': 1}, 'status': 1})])
+    runner = parallel.ParallelRunner(controller, all_objects, [('sub1', 'apply_ica')], n_processes=2)
+    executor = RecordingQueueExecutor()
+    runner.submit_job(executor, 'sub1')
+    fn, args = executor.jobs[0]
+    # The cores and the data-cache are not sized on the submitting machine
+    assert args[7:9] == (None, None)
+
+    # The worker-process takes its share of the settings of its own machine
+    class WorkerQSettings:
+        def value(self, key, defaultValue=None):
+            return {'n_jobs': 8, 'cache_memory': 4}.get(key, defaultValue)
+
+    controller.qsettings = WorkerQSettings()
+    monkeypatch.setattr(parallel, '_get_worker_controller', lambda *args: controller)
+    cache_memory = list()
+    monkeypatch.setattr(parallel, 'set_worker_cache_memory', cache_memory.append)
+    n_cores = list()
+    monkeypatch.setattr(parallel.StepRunner, '__init__',
+                        lambda self, *args, **kwargs: n_cores.append(kwargs['n_cores']) or None)
+    monkeypatch.setattr(parallel.StepRunner, 'run', lambda self: dict())
+    monkeypatch.setattr(parallel.StepRunner, 'results', list(), raising=False)
+    fn(*args[:6], list(), *args[7:], n_workers=2)
+    assert n_cores == [4]
+    assert cache_memory == [2]
+
+
+def test_job_memory_with_cache(controller, monkeypatch):
+    all_objects = OrderedDict([('sub1', {'type': 'MEEG', 'functions': {'apply_ica': 1}, 'status': 1})])
+    runner = parallel.ParallelRunner(controller, all_objects, [('sub1', 'apply_ica')], n_processes=2,
+                                     memory_budget=4 * 1024 ** 3)
+
+    class CacheQSettings:
+        def value(self, key, defaultValue=None):
+            return {'cache_memory': 4}.get(key, defaultValue)
+
+    controller.qsettings = CacheQSettings()
+    monkeypatch.setattr(runner.memory_model, 'get_input_size', lambda *args: 1024 ** 3)
+    monkeypatch.setattr(runner.memory_model, 'estimate', lambda func_name, input_size: input_size)
+    # The data-cache of the worker-process (its share of "cache_memory") is counted with the job
+    assert runner.get_job_memory('sub1') == 3 * 1024 ** 3
+
+
+class FailingExecutor:
+    """Run the jobs immediately, the functions of the objects in failing fail"""
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.submitted = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def submit(self, fn, *args):
+        obj_name, functions = args[4], args[6]
+        self.submitted.append(obj_name)
+        status = 'failed' if obj_name in self.failing else 'finished'
+        future = Future()
+        future.set_result(([{'object': obj_name, 'function': f, 'status': status} for f in functions],
+                           dict(), list()))
+
+        return future
+
+
+def test_failed_dependencies(controller):
+    controller.pr.all_groups = {'group1': ['sub1', 'sub2']}
+    all_objects = OrderedDict([('sub1', {'type': 'MEEG', 'functions': {'epoch_raw': 1}, 'status': 1}),
+                               ('sub2', {'type': 'MEEG', 'functions': {'epoch_raw': 1}, 'status': 1}),
+                               ('group1', {'type': 'Group', 'functions': {'grand_avg_evokeds': 1}, 'status': 1})])
+    steps = [('sub1', 'epoch_raw'), ('sub2', 'epoch_raw'), ('group1', 'grand_avg_evokeds')]
+    executor = FailingExecutor(['sub1'])
+    summary = parallel.ParallelRunner(controller, all_objects, steps, n_processes=2, executor=executor).run()
+
+    # The Group is not started after one of its MEEG-objects failed
+    assert executor.submitted == ['sub1', 'sub2']
+    group_result = [r for r in summary['steps'] if r['object'] == 'group1'][0]
+    assert group_result['status'] == 'failed'
+    assert group_result['error'] == 'Not run, because sub1 <- epoch_raw failed'
+    assert summary['n_failed'] == 2
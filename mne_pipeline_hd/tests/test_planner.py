@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the propagation of rewritten data in the dry-run (without MNE)
+"""
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from mne_pipeline_hd.pipeline_functions import planner
+from mne_pipeline_hd.pipeline_functions.planner import RunPlanner
+
+# The data, which the functions load and save (like from get_function_io)
+function_io = {'filter_raw': {'load': {('MEEG', 'raw')}, 'save': {('MEEG', 'raw_filtered')}},
+               'epoch_raw': {'load': {('MEEG', 'raw_filtered')}, 'save': {('MEEG', 'epochs')}},
+               'estimate_noise_covariance': {'load': {('MEEG', 'epochs')}, 'save': {('MEEG', 'noise_cov')}},
+               'grand_avg_evokeds': {'load': {('MEEG', 'epochs')}, 'save': {('Group', 'ga_evokeds')}}}
+
+
+class FakeMemoryModel:
+    def __init__(self, main_win):
+        pass
+
+    def get_object(self, obj_name, obj_type):
+        return obj_name
+
+    def get_input_size(self, obj_name, obj_type, func_name):
+        return None
+
+    def estimate(self, func_name, input_size):
+        return 0
+
+
+class FakeController:
+    def __init__(self):
+        self.pr = SimpleNamespace(meeg_to_fsmri={'sub1': 'fsaverage', 'sub2': 'fsaverage'},
+                                  all_groups={'group1': ['sub1', 'sub2']})
+
+    def get_setting(self, setting):
+        return setting == 'skip_up_to_date'
+
+
+@pytest.fixture
+def run_planner(monkeypatch):
+    monkeypatch.setattr(planner, 'MemoryModel', FakeMemoryModel)
+    monkeypatch.setattr(planner, 'load_timing_history', lambda main_win: dict())
+    monkeypatch.setattr(planner, 'get_function_io', lambda func_name, main_win: function_io[func_name])
+
+    return RunPlanner(FakeController())
+
+
+def _get_run_steps(steps):
+    all_objects = OrderedDict()
+    for obj_name, _ in steps:
+        all_objects[obj_name] = {'type': 'Group' if obj_name.startswith('group') else 'MEEG'}
+
+    return all_objects, steps
+
+
+def _get_actions(plan):
+    return {(s['object'], s['function']): s['action'] for s in plan['steps']}
+
+
+def test_all_up_to_date(run_planner, monkeypatch):
+    monkeypatch.setattr(planner, 'check_up_to_date', lambda obj, func_name: (True, 'outputs are up to date'))
+    plan = run_planner.plan(*_get_run_steps([('sub1', 'filter_raw'), ('sub1', 'epoch_raw')]))
+
+    assert set(_get_actions(plan).values()) == {'skip'}
+    assert plan['totals']['n_skip'] == 2
+
+
+def test_rewritten_inputs_propagate(run_planner, monkeypatch):
+    # Only filter_raw of sub1 is out of date
+    monkeypatch.setattr(planner, 'check_up_to_date',
+                        lambda obj, func_name: (not (obj == 'sub1' and func_name == 'filter_raw'), ''))
+    steps = [('sub1', 'filter_raw'), ('sub2', 'filter_raw'),
+             ('sub1', 'epoch_raw'), ('sub2', 'epoch_raw'),
+             ('sub1', 'estimate_noise_covariance'), ('sub2', 'estimate_noise_covariance'),
+             ('group1', 'grand_avg_evokeds')]
+    plan = run_planner.plan(*_get_run_steps(steps))
+    actions = _get_actions(plan)
+
+    # The steps after filter_raw of sub1 run, because their inputs are rewritten
+    for step in [('sub1', 'filter_raw'), ('sub1', 'epoch_raw'), ('sub1', 'estimate_noise_covariance'),
+                 ('group1', 'grand_avg_evokeds')]:
+        assert actions[step] == 'run'
+    for step in [('sub2', 'filter_raw'), ('sub2', 'epoch_raw'), ('sub2', 'estimate_noise_covariance')]:
+        assert actions[step] == 'skip'
+
+    reasons = {(s['object'], s['function']): s['reason'] for s in plan['steps']}
+    assert reasons[('sub1', 'epoch_raw')] == 'raw_filtered will be rewritten before'
+    assert plan['totals']['n_run'] == 4
+
+
+def test_unknown_input_size(run_planner, monkeypatch):
+    monkeypatch.setattr(planner, 'check_up_to_date', lambda obj, func_name: (False, 'sub1-raw.fif is missing'))
+
+    def get_input_size(obj_name, obj_type, func_name):
+        raise FileNotFoundError('sub1-raw.fif')
+    monkeypatch.setattr(run_planner.memory_model, 'get_input_size', get_input_size)
+    plan = run_planner.plan(*_get_run_steps([('sub1', 'filter_raw'), ('sub1', 'epoch_raw')]))
+
+    # The plan is made anyway with an unknown input-size
+    assert set(_get_actions(plan).values()) == {'run'}
+    assert plan['steps'][0]['input_size'] is None
+    assert plan['steps'][0]['reason'] == 'sub1-raw.fif is missing, input-size unknown: sub1-raw.fif'
+    assert 'unknown' in planner.get_plan_table(plan)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the CPU-time of the step-profiles (without MNE)
+"""
+import threading
+from time import perf_counter
+
+from mne_pipeline_hd.pipeline_functions.profiler import RunReport, StepProfile
+
+
+def _busy_thread(seconds=0.2):
+    """Keep another thread busy like BLAS or n_jobs, while this thread waits"""
+    def busy():
+        start = perf_counter()
+        while perf_counter() - start < seconds:
+            pass
+    thread = threading.Thread(target=busy)
+    thread.start()
+    thread.join()
+
+
+def test_cpu_clocks():
+    process_profile = StepProfile(cpu_clock='process')
+    process_profile.run(_busy_thread)
+    thread_profile = StepProfile(cpu_clock='thread')
+    thread_profile.run(_busy_thread)
+
+    # Only the clock of the process counts the threads started by the step
+    assert process_profile.get_result()['cpu_time'] > 0.1
+    assert thread_profile.get_result()['cpu_time'] < 0.1
+    assert process_profile.get_result()['cpu_clock'] == 'process'
+    assert thread_profile.get_result()['cpu_clock'] == 'thread'
+
+
+def test_report_clock():
+    results = [{'object': 'sub1', 'function': 'filter_raw', 'duration': 1, 'cpu_time': 1, 'cpu_clock': 'process'},
+               {'object': 'sub2', 'function': 'filter_raw', 'duration': 1, 'cpu_time': 1, 'cpu_clock': 'thread'},
+               {'object': 'sub1', 'function': 'epoch_raw', 'duration': 1, 'cpu_time': 1, 'cpu_clock': 'process'}]
+    summary = RunReport(results).get_function_summary()
+
+    assert summary['filter_raw']['cpu_clock'] == 'mixed'
+    assert summary['epoch_raw']['cpu_clock'] == 'process'
+    assert 'CPU-Clock' in RunReport(results).get_table()
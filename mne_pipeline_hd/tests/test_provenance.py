@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the provenance-records and the import of the old File-Parameters (without MNE)
+"""
+import json
+import os
+import sys
+from datetime import datetime
+from os.path import isfile, join
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from mne_pipeline_hd.pipeline_functions import pipeline_utils  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.pipeline_utils import (TypedJSONEncoder, check_up_to_date,  # noqa: E402
+                                                               encode_tuples)
+from mne_pipeline_hd.pipeline_functions.project import Project  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.provenance import ProvenanceStore  # noqa: E402
+
+first_time = datetime(2020, 5, 4, 12, 0, 0)
+last_time = datetime(2020, 5, 5, 12, 0, 0)
+
+
+def make_epochs(meeg, epochs_tmin):
+    raw = meeg.load_filtered()
+    meeg.save_epochs(raw[meeg.p['epochs_baseline']:])
+
+
+class MEEG:
+    """A data-object with the filtered data as input and the epochs as output of make_epochs"""
+
+    def __init__(self, data_path, store, parameters):
+        self.name = 'sub1'
+        self.p_preset = 'Default'
+        self.p = parameters
+        self.pr = SimpleNamespace(provenance=store, bad_channels={'sub1': ['MEG 0111']})
+        pd_funcs = pd.DataFrame({'pkg_name': 'test', 'module': 'test_provenance', 'func_args': ''},
+                                index=['make_epochs'])
+        all_modules = {'test': {'test_provenance': [sys.modules[__name__]]}}
+        self.mw = SimpleNamespace(pd_funcs=pd_funcs, all_modules=all_modules, get_setting=lambda setting: False)
+        self.io_dict = {'raw_filtered': {'path': join(data_path, 'sub1_Default-filtered-raw.fif'),
+                                         'load': 'load_filtered', 'save': 'save_filtered'},
+                        'epochs': {'path': join(data_path, 'sub1_Default-epo.fif'),
+                                   'load': 'load_epochs', 'save': 'save_epochs'}}
+
+    def _return_path_list(self, data_type):
+        return [self.io_dict[data_type]['path']]
+
+    def get_file_params(self, path):
+        return self.pr.provenance.get_latest(self.name, Path(path).name) or dict()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProvenanceStore(str(tmp_path / 'provenance_test.db'))
+
+
+def _count_parameter_sets(store):
+    return store.connect().execute('SELECT COUNT(*) FROM parameter_sets').fetchone()[0]
+
+
+def _get_file_parameters(path, functions, epochs_tmin):
+    """The File-Parameters of the epochs like in the old file_parameters_<project>.json"""
+    return {'sub1': {Path(path).name: {'NAME': 'sub1', 'PATH': path, 'FUNCTION': functions,
+                                       'TIME': [first_time, last_time][-len(functions):], 'SIZE': 6,
+                                       'P_PRESET': 'Default', 'epochs_tmin': epochs_tmin,
+                                       'epochs_baseline': (None, 0)}}}
+
+
+def test_import_file_parameters(tmp_path, store):
+    path = join(str(tmp_path), 'sub1_Default-epo.fif')
+    file_parameters = _get_file_parameters(path, ['old_epochs', 'make_epochs'], -0.2)
+    # Like it was saved by the project
+    encode_tuples(file_parameters['sub1'][Path(path).name])
+    with open(join(str(tmp_path), 'file_parameters_test.json'), 'w') as file:
+        json.dump(file_parameters, file, cls=TypedJSONEncoder)
+
+    project = SimpleNamespace(pscripts_path=str(tmp_path), name='test', provenance_path=store.db_path,
+                              provenance=store)
+    Project.import_file_parameters(project)
+
+    # The old file is kept, but not imported again
+    assert not isfile(join(str(tmp_path), 'file_parameters_test.json'))
+    assert isfile(join(str(tmp_path), 'file_parameters_test_imported.json'))
+    Project.import_file_parameters(project)
+
+    history = store.get_history('sub1', 'sub1_Default-epo.fif')
+    assert [(r['FUNCTION'], r['TIME']) for r in history] == [('old_epochs', first_time), ('make_epochs', last_time)]
+    # Only the last save was recorded with path, Parameter-Preset, size and parameters
+    assert [(r['PATH'], r['P_PRESET'], r['SIZE'], r['PARAM_HASH'], r['ENTRIES']) for r in history[:-1]] \
+           == [(None, None, None, None, None)]
+    latest = store.get_latest('sub1', 'sub1_Default-epo.fif')
+    assert (latest['PATH'], latest['P_PRESET'], latest['SIZE']) == (path, 'Default', 6)
+    assert latest['PARAMETERS'] == {'epochs_tmin': -0.2, 'epochs_baseline': (None, 0)}
+    assert latest['ENTRIES'] is None
+
+
+def test_parameter_sets(store):
+    parameters = {'epochs_tmin': -0.2, 'epochs_baseline': (None, 0)}
+    for obj_name in ['sub1', 'sub2']:
+        store.record(obj_name, f'{obj_name}_Default-epo.fif', None, 'make_epochs', 'Default', parameters, 6)
+    store.record('sub3', 'sub3_Default-epo.fif', None, 'make_epochs', 'Default', {'epochs_tmin': -0.1}, 6)
+
+    # Equal parameters are stored once
+    hashes = [r['PARAM_HASH'] for r in store.get_history(func_name='make_epochs')]
+    assert hashes[0] == hashes[1] != hashes[2]
+    assert _count_parameter_sets(store) == 2
+    assert store.get_parameters(hashes[0]) == parameters
+
+    # Parameter-Sets are only kept as long as records refer to them
+    store.remove('sub3')
+    assert _count_parameter_sets(store) == 1
+    store.remove('sub1', 'sub1_Default-epo.fif')
+    assert _count_parameter_sets(store) == 1
+    assert store.keep_objects(['sub1']) == ['sub2']
+    assert _count_parameter_sets(store) == 0
+    assert store.get_history() == list()
+
+
+# The outcome of the check with the old File-Parameters: function, parameters and modification-times were compared
+@pytest.mark.parametrize('functions, epochs_tmin, up_to_date', [(['filter_raw', 'make_epochs'], -0.2, True),
+                                                                 (['filter_raw', 'make_epochs'], -0.1, False),
+                                                                 (['make_epochs', 'filter_raw'], -0.2, False)])
+def test_check_after_import(tmp_path, store, monkeypatch, functions, epochs_tmin, up_to_date):
+    monkeypatch.setattr(pipeline_utils, '_get_data_objects', lambda obj, obj_type: [obj])
+    meeg = MEEG(str(tmp_path), store, {'epochs_tmin': -0.2, 'epochs_baseline': (None, 0)})
+    input_path = meeg.io_dict['raw_filtered']['path']
+    output_path = meeg.io_dict['epochs']['path']
+    for path in [input_path, output_path]:
+        with open(path, 'w') as file:
+            file.write('data')
+    # The input was saved before the output
+    os.utime(input_path, (first_time.timestamp(), first_time.timestamp()))
+    store.import_file_parameters(_get_file_parameters(output_path, functions, epochs_tmin))
+
+    assert check_up_to_date(meeg, 'make_epochs')[0] is up_to_date
+
+    # After the next save the project-entries are compared too
+    if up_to_date:
+        store.record('sub1', Path(output_path).name, output_path, 'make_epochs', 'Default', meeg.p, 4,
+                     entries={'bad_channels': ['MEG 0111']})
+        assert check_up_to_date(meeg, 'make_epochs')[0]
+        meeg.pr.bad_channels['sub1'].append('MEG 0112')
+        assert check_up_to_date(meeg, 'make_epochs') == (False, 'bad_channels of sub1 changed')
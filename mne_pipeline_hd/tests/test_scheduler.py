@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for the dependency-graph of the steps (needs MNE, but no data)
+"""
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('mne')
+pd = pytest.importorskip('pandas')
+
+from mne_pipeline_hd.pipeline_functions import scheduler  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.scheduler import StepGraph  # noqa: E402
+
+# The data, which the functions load and save (like from get_function_io),
+# custom_epochs loads its data through another variable-name (e.g. obj.load_epochs())
+function_io = {'filter_raw': {'load': {('MEEG', 'raw')}, 'save': {('MEEG', 'raw_filtered')}},
+               'epoch_raw': {'load': {('MEEG', 'raw_filtered')}, 'save': {('MEEG', 'epochs')}},
+               'custom_epochs': {'load': set(), 'save': set()},
+               'plot_evokeds': {'load': {('MEEG', 'evokeds')}, 'save': set()}}
+
+
+def _get_graph(monkeypatch, steps, dependencies=None):
+    dependencies = dependencies or dict()
+    pd_funcs = pd.DataFrame({'target': 'MEEG', 'dependencies': [dependencies.get(f, '') for f in function_io]},
+                            index=list(function_io))
+    main_win = SimpleNamespace(pd_funcs=pd_funcs, pr=SimpleNamespace(meeg_to_fsmri=dict(), all_groups=dict()))
+    monkeypatch.setattr(scheduler, 'get_function_io', lambda func_name, mw: function_io[func_name])
+    all_objects = OrderedDict([(obj_name, {'type': 'MEEG'}) for obj_name, _ in steps])
+
+    return StepGraph(main_win, all_objects, steps)
+
+
+def test_function_without_io(monkeypatch):
+    steps = [('sub1', 'filter_raw'), ('sub1', 'epoch_raw'), ('sub1', 'custom_epochs'), ('sub1', 'plot_evokeds'),
+             ('sub2', 'custom_epochs')]
+    predecessors = _get_graph(monkeypatch, steps).predecessors
+
+    # Without any load-/save-calls in the source the function runs after all previous steps of its object
+    assert predecessors[('sub1', 'custom_epochs')] == {('sub1', 'filter_raw'), ('sub1', 'epoch_raw')}
+    # and the following steps of its object run after it
+    assert predecessors[('sub1', 'plot_evokeds')] == {('sub1', 'custom_epochs')}
+    # Other objects are not affected
+    assert predecessors[('sub2', 'custom_epochs')] == set()
+
+
+def test_function_without_io_declared(monkeypatch):
+    steps = [('sub1', 'filter_raw'), ('sub1', 'epoch_raw'), ('sub1', 'custom_epochs'), ('sub1', 'plot_evokeds')]
+    predecessors = _get_graph(monkeypatch, steps, {'custom_epochs': 'epoch_raw'}).predecessors
+
+    # The declared dependencies are used instead
+    assert predecessors[('sub1', 'custom_epochs')] == {('sub1', 'epoch_raw')}
+    assert predecessors[('sub1', 'plot_evokeds')] == set()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline-GUI for Analysis with MNE-Python
+@author: Martin Schulz
+@email: dev@earthman-music.de
+@github: https://github.com/marsipu/mne_pipeline_hd
+License: BSD (3-clause)
+Written on top of MNE-Python
+Copyright © 2011-2020, authors of MNE-Python (https://doi.org/10.3389/fnins.2013.00267)
+inspired by Andersen, L. M. (2018) (https://doi.org/10.3389/fnins.2018.00006)
+
+Tests for saving data in the background with the setting "async_save" (needs MNE, but no data)
+"""
+import threading
+from os.path import isfile, join
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('mne')
+pytest.importorskip('PyQt5')
+
+from PyQt5.QtCore import QSettings  # noqa: E402
+
+from mne_pipeline_hd.pipeline_functions.loading import load_decorator, save_decorator  # noqa: E402
+from mne_pipeline_hd.pipeline_functions.writer import flush_writes  # noqa: E402
+
+
+class DataObject:
+    """A data-object with one data-type saved as numpy-file, whose writes can be held back"""
+
+    def __init__(self, data_path):
+        self.name = 'sub1'
+        self.p_preset = 'Default'
+        self.pr = SimpleNamespace()
+        self.io_dict = {'evokeds': {'path': join(data_path, 'sub1-ave.npy'),
+                                    'load': 'load_evokeds', 'save': 'save_evokeds'}}
+        self.data_dict = dict()
+        self.kept_data = dict()
+        self.keep_data = False
+        self.step_key = None
+        # The writes wait until this event is set
+        self.write_allowed = threading.Event()
+        self.write_allowed.set()
+        self.write_error = None
+        # (path, the file existed, the data in the file) for each recorded save
+        self.records = list()
+
+    def _return_path_list(self, data_type):
+        return [self.io_dict[data_type]['path']]
+
+    def save_file_params(self, path, func_name):
+        self.records.append((path, isfile(path), np.load(path).tolist() if isfile(path) else None))
+
+    @load_decorator
+    def load_evokeds(self):
+        return np.load(self.io_dict['evokeds']['path'])
+
+    @save_decorator
+    def save_evokeds(self, evokeds):
+        self.write_allowed.wait()
+        if self.write_error is not None:
+            raise self.write_error
+        np.save(self.io_dict['evokeds']['path'], evokeds)
+
+
+@pytest.fixture
+def data_object(tmp_path, isolated_settings):
+    QSettings().setValue('async_save', True)
+    obj = DataObject(str(tmp_path))
+    yield obj
+    # Don't leave writes (or their errors) for the next test
+    obj.write_allowed.set()
+    flush_writes()
+
+
+def test_load_waits_for_write(data_object):
+    np.save(data_object.io_dict['evokeds']['path'], np.zeros(3))
+    data_object.write_allowed.clear()
+    data_object.save_evokeds(np.ones(3))
+    # The old file is still on disk and not recorded as saved yet
+    assert data_object.records == list()
+
+    timer = threading.Timer(0.2, data_object.write_allowed.set)
+    timer.start()
+    assert data_object.load_evokeds().tolist() == [1, 1, 1]
+    timer.join()
+
+
+def test_write_error_at_flush(data_object):
+    data_object.write_error = OSError('No space left on device')
+    evokeds = np.ones(3)
+    data_object.save_evokeds(evokeds)
+    # The function may change its data after saving
+    evokeds[:] = 2
+
+    errors = flush_writes()
+    assert len(errors) == 1
+    assert 'Saving evokeds for sub1 failed: OSError: No space left on device' in errors[0]
+    # A failed write is never recorded as saved
+    assert data_object.records == list()
+    assert flush_writes() == list()
+
+
+def test_record_after_write(data_object):
+    evokeds = np.ones(3)
+    data_object.save_evokeds(evokeds)
+    evokeds[:] = 2
+    flush_writes()
+
+    # The File-Parameters are recorded, when the file with the data at the time of saving is on disk
+    assert data_object.records == [(data_object.io_dict['evokeds']['path'], True, [1, 1, 1])]
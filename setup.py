@@ -43,7 +43,9 @@ setup(name='mne_pipeline_hd',
       include_package_data=True,
       entry_points={
           'console_scripts': [
-              'mne_pipeline_hd = mne_pipeline_hd.__main__:main'
+              'mne_pipeline_hd = mne_pipeline_hd.__main__:main',
+              'mne_pipeline_hd_headless = mne_pipeline_hd.headless:main',
+              'mne_pipeline_hd_worker = mne_pipeline_hd.headless:worker_main'
           ]
       }
 